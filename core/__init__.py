@@ -4,6 +4,13 @@ Contiene la lógica principal de comunicación y procesamiento
 """
 
 from .plc_controller import PLCController
-from .vision_processor import VisionProcessor
 
-__all__ = ['PLCController', 'VisionProcessor']
\ No newline at end of file
+__all__ = ['PLCController', 'VisionProcessor', 'Detecciones']
+
+
+def __getattr__(nombre):
+    # vision_processor arrastra ultralytics/torch: se importa recién al usarlo
+    if nombre in ('VisionProcessor', 'Detecciones'):
+        from . import vision_processor
+        return getattr(vision_processor, nombre)
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
\ No newline at end of file
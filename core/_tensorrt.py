@@ -0,0 +1,36 @@
+"""
+Utilidades para engines TensorRT exportados con Ultralytics
+
+Compartidas por VisionProcessor (una cámara) y VisionProcessorDual.
+"""
+
+import json
+from pathlib import Path
+
+
+def dtype_engine(ruta: Path) -> str:
+    """
+    Precisión de entrada de un engine TensorRT ('fp16', 'fp32' o 'int8').
+
+    Ultralytics guarda al inicio del engine sus metadatos (largo uint32 +
+    JSON con los args del export), igual que los lee AutoBackend; sin
+    ellos se deduce del nombre (`_int8`/`_fp32`, como los exportan los
+    procesadores de visión) y si no, FP16.
+    """
+    ruta = Path(ruta)
+    try:
+        with open(ruta, 'rb') as f:
+            largo = int.from_bytes(f.read(4), byteorder='little')
+            if 0 < largo < 1 << 20:  # Engines sin metadatos: basura, se ignora
+                args = json.loads(f.read(largo).decode('utf-8')).get('args', {})
+                if args.get('int8'):
+                    return 'int8'
+                if 'half' in args:
+                    return 'fp16' if args['half'] else 'fp32'
+    except (OSError, ValueError, AttributeError):  # UnicodeDecodeError es ValueError
+        pass
+    if ruta.stem.endswith('_int8'):
+        return 'int8'
+    if ruta.stem.endswith('_fp32'):
+        return 'fp32'
+    return 'fp16'
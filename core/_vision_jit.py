@@ -0,0 +1,108 @@
+"""
+Aritmética del post-proceso de visión compilada con Numba
+
+Si `numba` no está instalado las funciones se ejecutan como Python puro
+con el mismo resultado.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_DISPONIBLE = True
+except ImportError:  # numba es opcional
+    NUMBA_DISPONIBLE = False
+
+    def njit(*args, **kwargs):
+        return lambda f: f
+
+
+@njit(cache=True, fastmath=True)
+def correccion_z(y_ref, y_borde, y_mitad, d_real_mm, offset_cero):
+    """
+    Corrección Z en cMM a partir de las coordenadas Y de la cámara lateral.
+
+    Returns:
+        (corrección_cmm, codigo_error) — codigo_error 1 si la escala colapsó
+    """
+    delta = abs(y_borde - y_mitad)
+    if delta == 0 or d_real_mm == 0.0:
+        return 0, 1
+    factor_escala_px_mm = delta / d_real_mm
+    error_px = (y_borde - y_ref) - offset_cero
+    # np.rint redondea al par más cercano, igual que round()
+    return int(np.rint((error_px / factor_escala_px_mm) * 10.0)), 0
+
+
+@njit(cache=True)
+def columna_mas_cercana(x, xi_sorted, xi_nums):
+    """
+    Búsqueda binaria de la columna ideal más cercana a x.
+    En empate gana la columna de la izquierda.
+
+    Returns:
+        (número de columna, distancia en px); (-1, -1) si no hay centros
+    """
+    n = xi_sorted.shape[0]
+    if n == 0:
+        return -1, -1
+
+    lo, hi = 0, n
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if xi_sorted[mid] < x:
+            lo = mid + 1
+        else:
+            hi = mid
+
+    if lo == 0:
+        return xi_nums[0], abs(x - xi_sorted[0])
+    if lo == n:
+        return xi_nums[n - 1], abs(x - xi_sorted[n - 1])
+
+    izq, der = xi_sorted[lo - 1], xi_sorted[lo]
+    if (x - izq) > (der - x):
+        return xi_nums[lo], der - x
+    return xi_nums[lo - 1], x - izq
+
+
+# Sin fastmath: sus flags (ninf) dan por hecho que no hay infinitos, y los
+# centinelas ±inf de abajo se comparan en cada iteración
+@njit(cache=True, nogil=True)
+def filas_y_desviacion(datos, umbral, punto_referencia):
+    """
+    Filtrado por confianza, conteo de filas y desviación en una sola
+    pasada sobre `boxes.data` (N, 6: x1, y1, x2, y2, conf, cls).
+
+    La caja elegida es la de centro X más cercano a `punto_referencia`
+    (primer mínimo en empates, igual que np.argmin). Libera el GIL, así
+    los elementos de un lote se pueden procesar en paralelo.
+
+    Returns:
+        (filas, desviación_px, suma_conf, conf_min, conf_max)
+    """
+    filas = 0
+    mejor_desv = 0.0
+    mejor_dist = np.inf
+    suma_conf = 0.0
+    conf_min = np.inf
+    conf_max = -np.inf
+    for i in range(datos.shape[0]):
+        conf = datos[i, 4]
+        if conf < umbral:
+            continue
+        filas += 1
+        suma_conf += conf
+        conf_min = min(conf_min, conf)
+        conf_max = max(conf_max, conf)
+        desv = (datos[i, 0] + datos[i, 2]) * 0.5 - punto_referencia
+        if abs(desv) < mejor_dist:
+            mejor_dist = abs(desv)
+            mejor_desv = desv
+    return filas, mejor_desv, suma_conf, conf_min, conf_max
+
+
+# Compila (o carga del caché) al importar, no en el primer ciclo
+correccion_z(0, 10, 0, 100.0, 40)
+columna_mas_cercana(0, np.zeros(2, dtype=np.int32), np.arange(1, 3, dtype=np.int32))
+filas_y_desviacion(np.zeros((0, 6), dtype=np.float32), 0.5, 320.0)
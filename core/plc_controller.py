@@ -4,9 +4,34 @@ Implementa el protocolo MC Type3E y el handshake de control
 """
 
 import pymcprotocol
+from pymcprotocol import mcprotocolconst
 import json
+import logging
+import socket
+import struct
+import threading
+import time
 from typing import Optional, Dict, Tuple
 
+from utils.config import cargar_json
+
+# Rango de un entero con signo de 32 bits (D29-D30)
+INT32_MIN = -2147483648
+INT32_MAX = 2147483647
+
+# Structs precompilados para int32 ↔ palabras PLC (little-endian)
+_PACK_INT32 = struct.Struct('<i').pack
+_UNPACK_WORDS = struct.Struct('<hh').unpack
+_PACK_INTO_INT16 = struct.Struct('<h').pack_into
+_UNPACK_FROM_INT16 = struct.Struct('<h').unpack_from
+
+# Comandos MC en unidades de palabra
+_CMD_BATCH_READ = 0x0401
+_CMD_RANDOM_WRITE = 0x1402
+
+# Hijo de 'SistemaPLC': hereda los handlers configurados por setup_logger
+log = logging.getLogger('SistemaPLC.PLCController')
+
 
 class PLCController:
     """
@@ -19,17 +44,27 @@ class PLCController:
     - Manejar reconexiones automáticas
     """
     
-    def __init__(self, config_file: str = 'config/plc_config.json'):
+    def __init__(self, 
+                 config_file: str = 'config/plc_config.json',
+                 logger: Optional[logging.Logger] = None):
         """
         Inicializa el controlador con configuración desde JSON.
         
         Args:
             config_file: Ruta al archivo de configuración
+            logger: Logger a usar (por defecto 'SistemaPLC.PLCController')
         """
+        self.log = logger or log
         self.config = self._cargar_configuracion(config_file)
         self.mc = None
         self.is_connected = False
         
+        # Frames MC (escritura de resultados, lectura de D28) precompilados al conectar
+        self._frame_escritura = None
+        self._offsets_escritura = []
+        self._frame_lectura_trigger = None
+        self._indice_dato_respuesta = 0
+        
         # Extraer configuraciones
         conn = self.config['conexion']
         dirs = self.config['direcciones']
@@ -45,19 +80,52 @@ class PLCController:
         self.VAL_SOLICITUD = codigos['valor_solicitud']
         self.VAL_EXITO = codigos['valor_exito']
         self.VAL_ERROR = codigos['valor_error']
+        
+        # Backoff adaptativo del polling de D28 (ms)
+        sistema = self.config.get('sistema', {})
+        self.BACKOFF_INICIAL_MS = sistema.get('backoff_inicial_ms', 5)
+        self.BACKOFF_MAXIMO_MS = sistema.get('delay_polling_ms', 100)
+        self._idle_backoff_ms = self.BACKOFF_INICIAL_MS
+        self._ultima_solicitud = None
+        self._ewma_intervalo_ms = None
+        
+        # Keep-alive: solo se sondea la conexión tras un periodo sin I/O
+        self.INTERVALO_PROBE_S = sistema.get('intervalo_probe_s', 2.0)
+        self._ultimo_io = 0.0
+        
+        # Reintentos ante errores de red transitorios
+        self.MAX_REINTENTOS_IO = sistema.get('max_reintentos_io', 3)
+        self.estadisticas_io = {'ok': 0, 'fallos': 0, 'reconexiones': 0}
+        
+        # Serializa el acceso al socket (lecturas en hilo Tk, escrituras en worker)
+        self._lock_io = threading.Lock()
+        
+        # Dispositivos de escritura en un solo frame (orden: D29, D30, D14, D28)
+        self.DEVS_ESCRITURA = [
+            self.DEV_RESULTADO_VALOR,
+            self._siguiente_dispositivo(self.DEV_RESULTADO_VALOR),
+            self.DEV_RESULTADO_FILAS,
+            self.DEV_TRIGGER
+        ]
+    
+    @staticmethod
+    def _siguiente_dispositivo(dispositivo: str) -> str:
+        """Retorna el dispositivo contiguo (ej: 'D29' → 'D30')"""
+        prefijo = dispositivo.rstrip('0123456789')
+        numero = int(dispositivo[len(prefijo):])
+        return f"{prefijo}{numero + 1}"
     
     def _cargar_configuracion(self, config_file: str) -> Dict:
         """Carga configuración desde archivo JSON"""
         try:
-            with open(config_file, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-            print(f"✅ Configuración cargada desde {config_file}")
+            config = cargar_json(config_file)
+            self.log.info("✅ Configuración cargada desde %s", config_file)
             return config
         except FileNotFoundError:
-            print(f"⚠️ Archivo {config_file} no encontrado, usando valores por defecto")
+            self.log.warning("⚠️ Archivo %s no encontrado, usando valores por defecto", config_file)
             return self._configuracion_por_defecto()
         except json.JSONDecodeError as e:
-            print(f"❌ Error parseando JSON: {e}")
+            self.log.error("❌ Error parseando JSON: %s", e)
             raise
     
     def _configuracion_por_defecto(self) -> Dict:
@@ -86,29 +154,191 @@ class PLCController:
         Returns:
             True si la conexión fue exitosa, False en caso contrario
         """
-        print(f"🔌 Conectando al PLC en {self.ip_plc}:{self.puerto_plc}...")
+        self.log.info("🔌 Conectando al PLC en %s:%s...", self.ip_plc, self.puerto_plc)
         try:
             self.mc = pymcprotocol.Type3E()
             self.mc.connect(self.ip_plc, self.puerto_plc)
+            self._configurar_socket()
+            self._construir_frame_escritura()
             self.is_connected = True
-            print("✅ Conexión PLC establecida exitosamente")
+            self._ultimo_io = time.monotonic()
+            self.log.info("✅ Conexión PLC establecida exitosamente")
             return True
         except Exception as e:
-            print(f"❌ Error al conectar con PLC: {e}")
+            self.log.error("❌ Error al conectar con PLC: %s", e)
             self.is_connected = False
             return False
     
-    def desconectar(self) -> None:
-        """Cierra la conexión con el PLC de forma segura"""
-        if self.is_connected and self.mc:
+    def _configurar_socket(self) -> None:
+        """
+        Ajusta opciones del socket TCP creado por pymcprotocol.
+        
+        Cada petición MC es un frame pequeño seguido de una respuesta, el
+        patrón que Nagle + delayed-ACK penalizan. Se activa TCP_NODELAY y
+        se fijan buffers de 64 KB.
+        
+        No se envuelve el socket en un BufferedReader/Writer: pymcprotocol
+        ya hace un único send() y un único recv(4096) por transacción, y
+        la respuesta Type3E completa cabe en ese recv.
+        """
+        try:
+            sock = self.mc._sock  # Atributo interno de pymcprotocol.Type3E
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 65536)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 65536)
+        except (AttributeError, OSError) as e:
+            self.log.warning("⚠️ No se pudieron ajustar opciones del socket: %s", e)
+    
+    def _construir_frame_escritura(self) -> None:
+        """
+        Precompila el frame MC random-write de D29, D30, D14 y D28 y el
+        frame de lectura de D28.
+        
+        La cabecera y los códigos de dispositivo no cambian entre ciclos;
+        solo los 4 valores int16. Se construye una vez con los helpers de
+        pymcprotocol (mismo formato que `randomwrite`) y se guardan los
+        offsets donde van los valores. Solo aplica en modo binario; en
+        ASCII se usan `randomwrite`/`batchread_wordunits` directamente.
+        """
+        self._frame_escritura = None
+        self._offsets_escritura = []
+        self._frame_lectura_trigger = None
+        
+        mc = self.mc
+        if mc.commtype != mcprotocolconst.COMMTYPE_BINARY:
+            return
+        
+        try:
+            subcomando = 0x0002 if mc.plctype == mcprotocolconst.iQR_SERIES else 0x0000
+            datos = mc._make_commanddata(_CMD_RANDOM_WRITE, subcomando)
+            datos += mc._encode_value(len(self.DEVS_ESCRITURA), mode="byte")
+            datos += mc._encode_value(0, mode="byte")  # sin dwords
+            
+            offsets = []
+            for dispositivo in self.DEVS_ESCRITURA:
+                datos += mc._make_devicedata(dispositivo)
+                offsets.append(len(datos))
+                datos += mc._encode_value(0, mode="short", isSigned=True)
+            
+            frame = mc._make_senddata(datos)
+            cabecera = len(frame) - len(datos)
+            
+            self._frame_escritura = bytearray(frame)
+            self._offsets_escritura = [cabecera + o for o in offsets]
+            
+            # Lectura de 1 palabra en D28 (el polling del handshake)
+            datos = mc._make_commanddata(_CMD_BATCH_READ, subcomando)
+            datos += mc._make_devicedata(self.DEV_TRIGGER)
+            datos += mc._encode_value(1)
+            self._frame_lectura_trigger = mc._make_senddata(datos)
+            self._indice_dato_respuesta = mc._get_answerdata_index()
+        except Exception as e:
+            self.log.warning("⚠️ No se pudo precompilar el frame de escritura: %s", e)
+    
+    def _enviar_frame_escritura(self, valores: list) -> None:
+        """Parchea los valores en el frame precompilado y lo envía"""
+        frame = self._frame_escritura
+        for offset, valor in zip(self._offsets_escritura, valores):
+            _PACK_INTO_INT16(frame, offset, valor)
+        
+        self.mc._send(bytes(frame))
+        self.mc._check_cmdanswer(self.mc._recv())
+    
+    def _leer_trigger(self) -> int:
+        """
+        Lee D28. Con el frame precompilado, la respuesta se decodifica
+        con un único struct.unpack_from en el offset fijo del dato.
+        """
+        if self._frame_lectura_trigger is None:
+            return self.mc.batchread_wordunits(headdevice=self.DEV_TRIGGER, readsize=1)[0]
+        
+        self.mc._send(self._frame_lectura_trigger)
+        respuesta = self.mc._recv()
+        self.mc._check_cmdanswer(respuesta)
+        return _UNPACK_FROM_INT16(respuesta, self._indice_dato_respuesta)[0]
+    
+    def _io(self, operacion, *args, **kwargs):
+        """
+        Ejecuta una operación MC y registra el instante de la última I/O
+        exitosa (cuenta como heartbeat para verificar_conexion).
+        
+        Es seguro llamarlo desde varios hilos: cada petición/respuesta MC
+        se ejecuta completa bajo `_lock_io`.
+        """
+        with self._lock_io:
+            resultado = operacion(*args, **kwargs)
+            self._ultimo_io = time.monotonic()
+            self.estadisticas_io['ok'] += 1  # Bajo el lock: se lee desde Tk
+        return resultado
+    
+    def _io_con_reintento(self, operacion, *args, guardia=None, **kwargs):
+        """
+        Como `_io`, pero ante un error de red (reset, timeout, OSError)
+        reconecta con backoff exponencial y reintenta la operación hasta
+        MAX_REINTENTOS_IO veces.
+        
+        Args:
+            operacion: Método MC a ejecutar
+            guardia: Callable opcional evaluado tras reconectar; si retorna
+                False no se reintenta (para escrituras no idempotentes)
+        """
+        for intento in range(self.MAX_REINTENTOS_IO + 1):
+            try:
+                return self._io(operacion, *args, **kwargs)
+            except OSError as e:  # Incluye ConnectionResetError y TimeoutError
+                with self._lock_io:
+                    self.estadisticas_io['fallos'] += 1
+                if intento == self.MAX_REINTENTOS_IO:
+                    raise
+                self.log.warning("Error de red (%s), reintento %d/%d",
+                                 e, intento + 1, self.MAX_REINTENTOS_IO)
+                self._reconectar_con_backoff(intento)
+                if guardia is not None and not guardia():
+                    raise
+    
+    def _reconectar_con_backoff(self, intento: int) -> None:
+        """
+        Espera min(50 ms · 2^intento, 2 s) y reabre el socket TCP sobre
+        el mismo objeto Type3E (se conserva el frame precompilado).
+        """
+        time.sleep(min(0.05 * (2 ** intento), 2.0))
+        with self._lock_io:
             try:
                 self.mc.close()
-                print("✅ Desconectado del PLC")
-            except Exception as e:
-                print(f"⚠️ Error al desconectar: {e}")
-            finally:
-                self.is_connected = False
-                self.mc = None
+            except Exception:
+                pass
+            try:
+                self.mc.connect(self.ip_plc, self.puerto_plc)
+                self._configurar_socket()
+                self.estadisticas_io['reconexiones'] += 1
+            except OSError as e:
+                self.log.warning("Reconexion fallida: %s", e)
+    
+    def _solicitud_sigue_pendiente(self) -> bool:
+        """
+        Guardia de reintento para escribir_resultados: solo es seguro
+        reescribir si el PLC sigue esperando (D28 == 99). Si D28 ya
+        cambió, la escritura anterior llegó o el PLC siguió adelante.
+        """
+        try:
+            valor = self._io(self._leer_trigger)
+        except OSError:
+            return False
+        return valor == self.VAL_SOLICITUD
+    
+    def desconectar(self) -> None:
+        """Cierra la conexión con el PLC de forma segura"""
+        # Bajo _lock_io: el worker de I/O puede estar a mitad de una petición
+        with self._lock_io:
+            if self.is_connected and self.mc:
+                try:
+                    self.mc.close()
+                    self.log.info("✅ Desconectado del PLC")
+                except Exception as e:
+                    self.log.warning("⚠️ Error al desconectar: %s", e)
+                finally:
+                    self.is_connected = False
+                    self.mc = None
     
     def leer_solicitud_inspeccion(self) -> bool:
         """
@@ -125,21 +355,54 @@ class PLCController:
             return False
         
         try:
-            valor = self.mc.batchread_wordunits(
-                headdevice=self.DEV_TRIGGER, 
-                readsize=1
-            )[0]
+            valor = self._io_con_reintento(self._leer_trigger)
             
             if valor == self.VAL_SOLICITUD:
-                print(f"📥 Solicitud de inspección detectada ({self.DEV_TRIGGER}={self.VAL_SOLICITUD})")
+                self.log.info("Solicitud de inspeccion detectada (%s=%s)",
+                              self.DEV_TRIGGER, self.VAL_SOLICITUD)
+                self._registrar_solicitud()
                 return True
+            
+            self._idle_backoff_ms = min(self._idle_backoff_ms * 2, self._backoff_tope_ms())
             return False
             
         except Exception as e:
-            print(f"❌ Error al leer {self.DEV_TRIGGER}: {e}")
+            self.log.error("Error al leer %s: %s", self.DEV_TRIGGER, e)
             self.is_connected = False
             return False
     
+    def _registrar_solicitud(self) -> None:
+        """Reinicia el backoff y actualiza la EWMA del intervalo entre solicitudes"""
+        ahora = time.monotonic()
+        if self._ultima_solicitud is not None:
+            intervalo_ms = (ahora - self._ultima_solicitud) * 1000.0
+            if self._ewma_intervalo_ms is None:
+                self._ewma_intervalo_ms = intervalo_ms
+            else:
+                self._ewma_intervalo_ms += 0.2 * (intervalo_ms - self._ewma_intervalo_ms)
+        self._ultima_solicitud = ahora
+        self._idle_backoff_ms = self.BACKOFF_INICIAL_MS
+    
+    def _backoff_tope_ms(self) -> float:
+        """
+        Tope del backoff: una décima parte del intervalo típico entre
+        solicitudes, acotado a [BACKOFF_INICIAL_MS, BACKOFF_MAXIMO_MS].
+        """
+        if self._ewma_intervalo_ms is None:
+            return self.BACKOFF_MAXIMO_MS
+        tope = self._ewma_intervalo_ms * 0.1
+        return max(self.BACKOFF_INICIAL_MS, min(tope, self.BACKOFF_MAXIMO_MS))
+    
+    def obtener_delay_polling_ms(self) -> int:
+        """
+        Retorna el tiempo de espera recomendado antes de la siguiente
+        lectura de D28.
+        
+        Empieza en BACKOFF_INICIAL_MS, se duplica con cada lectura sin
+        solicitud hasta el tope y se reinicia al detectar D28=99.
+        """
+        return int(self._idle_backoff_ms)
+    
     def escribir_resultados(self, 
                           desviacion_mm: float, 
                           num_filas: int, 
@@ -147,8 +410,8 @@ class PLCController:
         """
         Escribe los resultados de la inspección al PLC.
         
-        Protocolo de escritura (orden crítico):
-        1. D29 (desviación en 1/100 mm, 32 bits)
+        Protocolo de escritura (un único random write, orden del frame):
+        1. D29-D30 (desviación en 1/100 mm, 32 bits)
         2. D14 (número de filas, 16 bits)
         3. D28 (estado: 88=éxito, 77=error)
         
@@ -161,57 +424,55 @@ class PLCController:
             True si la escritura fue exitosa
         """
         if not self.is_connected:
-            print("❌ No se puede escribir: sin conexión PLC")
+            self.log.error("No se puede escribir: sin conexion PLC")
             return False
         
         try:
             if exito:
                 # Convertir desviación a formato PLC (1/100 mm)
                 valor_desviacion = int(round(desviacion_mm * 100.0))
-                palabras_valor = self._int32_to_words(valor_desviacion)
                 
                 # Validar número de filas
                 valor_filas = max(0, int(num_filas))
-                
-                # ORDEN CRÍTICO: Datos primero, estado después
-                self.mc.batchwrite_wordunits(
-                    headdevice=self.DEV_RESULTADO_VALOR, 
-                    values=palabras_valor
-                )
-                self.mc.batchwrite_wordunits(
-                    headdevice=self.DEV_RESULTADO_FILAS, 
-                    values=[valor_filas]
-                )
-                self.mc.batchwrite_wordunits(
-                    headdevice=self.DEV_TRIGGER, 
-                    values=[self.VAL_EXITO]
-                )
-                
-                print(f"✅ Resultados enviados: Desv={desviacion_mm:.2f}mm ({valor_desviacion}), "
-                      f"Filas={valor_filas}, Estado=ÉXITO({self.VAL_EXITO})")
+                estado = self.VAL_EXITO
             else:
                 # Error: enviar ceros
-                palabras_cero = self._int32_to_words(0)
-                
-                self.mc.batchwrite_wordunits(
-                    headdevice=self.DEV_RESULTADO_VALOR, 
-                    values=palabras_cero
-                )
-                self.mc.batchwrite_wordunits(
-                    headdevice=self.DEV_RESULTADO_FILAS, 
-                    values=[0]
+                valor_desviacion = 0
+                valor_filas = 0
+                estado = self.VAL_ERROR
+            
+            palabras_valor = self._int32_to_words(valor_desviacion)
+            
+            # Un solo frame MC (random write): el PLC aplica todos los
+            # dispositivos en el mismo scan, por lo que D28 nunca se ve
+            # actualizado antes que los datos.
+            valores = palabras_valor + [valor_filas, estado]
+            
+            if self._frame_escritura is not None:
+                self._io_con_reintento(
+                    self._enviar_frame_escritura, valores,
+                    guardia=self._solicitud_sigue_pendiente
                 )
-                self.mc.batchwrite_wordunits(
-                    headdevice=self.DEV_TRIGGER, 
-                    values=[self.VAL_ERROR]
+            else:
+                self._io_con_reintento(
+                    self.mc.randomwrite,
+                    guardia=self._solicitud_sigue_pendiente,
+                    word_devices=self.DEVS_ESCRITURA,
+                    word_values=valores,
+                    dword_devices=[],
+                    dword_values=[]
                 )
-                
-                print(f"❌ Error enviado al PLC: Estado=ERROR({self.VAL_ERROR})")
+            
+            if exito:
+                self.log.info("Resultados enviados: Desv=%.2fmm (%d), Filas=%d, Estado=EXITO(%d)",
+                              desviacion_mm, valor_desviacion, valor_filas, self.VAL_EXITO)
+            else:
+                self.log.warning("Error enviado al PLC: Estado=ERROR(%d)", self.VAL_ERROR)
             
             return True
             
         except Exception as e:
-            print(f"❌ Error al escribir resultados: {e}")
+            self.log.error("Error al escribir resultados: %s", e)
             self.is_connected = False
             return False
     
@@ -219,24 +480,20 @@ class PLCController:
         """
         Convierte un entero con signo de 32 bits a dos palabras de 16 bits.
         
-        Formato PLC: [low_word, high_word]
-        Ejemplo: -1250 → [0xFB1E, 0xFFFF]
+        Formato PLC: [low_word, high_word], cada palabra como int16 con
+        signo (es lo que codifica pymcprotocol).
+        Ejemplo: -1250 → [-1250, -1]  (0xFB1E, 0xFFFF)
         
         Args:
-            n: Entero con signo (-2147483648 a 2147483647)
+            n: Entero con signo (INT32_MIN a INT32_MAX)
             
         Returns:
             Lista [low_word, high_word]
         """
         # Clamp al rango int32
-        n = max(-2147483648, min(n, 2147483647))
+        n = INT32_MAX if n > INT32_MAX else (INT32_MIN if n < INT32_MIN else n)
         
-        # Convertir a unsigned si es negativo
-        if n < 0:
-            n = n + (1 << 32)
-        
-        low_word = n & 0xFFFF
-        high_word = (n >> 16) & 0xFFFF
+        low_word, high_word = _UNPACK_WORDS(_PACK_INT32(n))
         
         return [low_word, high_word]
     
@@ -244,15 +501,21 @@ class PLCController:
         """
         Verifica si la conexión con el PLC sigue activa.
         
+        Cualquier lectura/escritura exitosa hace de heartbeat: solo se
+        envía una lectura de prueba si no hubo I/O en INTERVALO_PROBE_S.
+        
         Returns:
             True si la conexión está activa
         """
         if not self.is_connected or not self.mc:
             return False
         
+        if time.monotonic() - self._ultimo_io < self.INTERVALO_PROBE_S:
+            return True
+        
         try:
             # Intenta leer el registro de trigger
-            self.mc.batchread_wordunits(headdevice=self.DEV_TRIGGER, readsize=1)
+            self._io(self._leer_trigger)
             return True
         except Exception:
             self.is_connected = False
@@ -269,17 +532,22 @@ class PLCController:
             return {'conectado': False}
         
         try:
-            trigger = self.mc.batchread_wordunits(headdevice=self.DEV_TRIGGER, readsize=1)[0]
-            filas = self.mc.batchread_wordunits(headdevice=self.DEV_RESULTADO_FILAS, readsize=1)[0]
+            # Una sola lectura aleatoria en lugar de dos batchread
+            (trigger, filas), _ = self._io_con_reintento(
+                self.mc.randomread,
+                word_devices=[self.DEV_TRIGGER, self.DEV_RESULTADO_FILAS],
+                dword_devices=[]
+            )
             
             return {
                 'conectado': True,
                 'trigger': trigger,
                 'filas': filas,
-                'descripcion_trigger': self._describir_codigo(trigger)
+                'descripcion_trigger': self._describir_codigo(trigger),
+                'estadisticas_io': dict(self.estadisticas_io)
             }
         except Exception as e:
-            print(f"⚠️ Error leyendo estado: {e}")
+            self.log.warning("⚠️ Error leyendo estado: %s", e)
             return {'conectado': False, 'error': str(e)}
     
     def _describir_codigo(self, codigo: int) -> str:
@@ -300,6 +568,9 @@ class PLCController:
 # EJEMPLO DE USO
 # =============================================================================
 if __name__ == "__main__":
+    from utils.logger import setup_logger
+    setup_logger('SistemaPLC')
+    
     # Test básico del controlador
     plc = PLCController()
     
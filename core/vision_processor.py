@@ -3,10 +3,41 @@ VisionProcessor - Módulo de procesamiento de visión artificial
 Integra YOLO con el sistema de control PLC
 """
 
+import logging
+import threading
+import cv2
 import numpy as np
-from typing import Dict, List, Optional, Tuple
+from dataclasses import dataclass
+from multiprocessing.pool import ThreadPool
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
 from ultralytics import YOLO
 
+from ._tensorrt import dtype_engine
+from ._vision_jit import NUMBA_DISPONIBLE, filas_y_desviacion
+
+# Hijo de 'SistemaPLC': hereda los handlers configurados por setup_logger
+log = logging.getLogger('SistemaPLC.VisionProcessor')
+
+
+@dataclass
+class Detecciones:
+    """
+    Detecciones válidas en formato columnar (un ndarray por campo).
+    
+    Todos los arrays tienen longitud N; `bbox` tiene forma (N, 4)
+    con columnas (x1, y1, x2, y2).
+    """
+    center_x: np.ndarray
+    center_y: np.ndarray
+    ancho: np.ndarray
+    alto: np.ndarray
+    confianza: np.ndarray
+    bbox: np.ndarray
+    
+    def __len__(self) -> int:
+        return len(self.confianza)
+
 
 class VisionProcessor:
     """
@@ -35,29 +66,400 @@ class VisionProcessor:
         self.usar_centro_imagen = self.config['usar_centro_imagen']
         self.referencia_x_custom = self.config['referencia_x_custom']
         
+        # Referencia fija resuelta una vez (None = usar centro de la imagen)
+        if self.usar_centro_imagen or self.referencia_x_custom is None:
+            self._referencia_x_fija = None
+        else:
+            self._referencia_x_fija = float(self.referencia_x_custom)
+        
+        # Punto de referencia cacheado para el ancho de imagen actual
+        self._ancho_referencia = None
+        self._punto_referencia_cached = self._referencia_x_fija
+        
+        # Optimización de inferencia
+        # imgsz: entero (cuadrado) o [alto, ancho], p. ej. [288, 512]
+        imgsz = self.config.get('imgsz', 640)
+        self.imgsz = list(imgsz) if isinstance(imgsz, (list, tuple)) else imgsz
+        self.exportar_tensorrt = self.config.get('exportar_tensorrt', True)
+        # FP16 en GPU (engine TensorRT o PyTorch CUDA); False = FP32
+        self.half_precision = self.config.get('half_precision', True)
+        # 'int8' exporta el engine cuantizado; necesita `int8_data`, un YAML
+        # de dataset con imágenes representativas de planta para calibrar
+        self.quantization = self.config.get('quantization', 'fp16')
+        self.int8_data = self.config.get('int8_data')
+        # Dispositivo de inferencia: None = automático (CUDA si hay GPU),
+        # 'cpu', 0, 'cuda:1', ...
+        self.device = self.config.get('device')
+        self._kwargs_device = {} if self.device is None else {'device': self.device}
+        # Memoria (GiB) que TensorRT puede usar al construir el engine
+        self.workspace_trt_gb = self.config.get('workspace_trt_gb', 4)
+        # Backends de torch (globales al proceso, ver _configurar_torch)
+        self.cudnn_benchmark = self.config.get('cudnn_benchmark', True)
+        self.permitir_tf32 = self.config.get('permitir_tf32', True)
+        self.inference_dtype = 'fp32'
+        # Frames por llamada en inferir_lote (el engine se exporta para ese lote)
+        self.batch_size = max(1, int(self.config.get('batch_size', 1)))
+        # Preproceso propio en lugar del de Ultralytics:
+        # - preproceso_pinned: letterbox en CPU sobre memoria pinned + H2D asíncrona
+        # - preproceso_gpu: se sube el frame BGR crudo y todo (BGR→RGB, CHW,
+        #   cast, /255, resize y relleno) se hace en la GPU; tiene prioridad
+        self.preproceso_pinned = self.config.get('preproceso_pinned', False)
+        self.preproceso_gpu = self.config.get('preproceso_gpu', False)
+        self._pinned = None
+        self._gpu_pre = None
+        self._preparar_tensor = None  # frames -> tensor de entrada (None = Ultralytics)
+        
+        # Estadísticos de confianza en metadata (solo para depuración)
+        self.debug_metadata = self.config.get('debug_metadata', False)
+        
+        # Post-proceso en un kernel Numba de una pasada (sin numba, NumPy)
+        self.postproceso_jit = self.config.get('postproceso_jit', True) and NUMBA_DISPONIBLE
+        
+        # Buffers de trabajo reutilizados entre frames (crecen si hace falta);
+        # uno por hilo, para poder post-procesar un lote en paralelo
+        self._capacidad_inicial = self.config.get('max_detecciones', 256)
+        self._por_hilo = threading.local()
+        self._reservar_scratch(self._capacidad_inicial)
+        
+        # Pool persistente para procesar_lote (solo con lotes)
+        self.post_pool = ThreadPool(processes=min(4, self.batch_size)) if self.batch_size > 1 else None
+        
+        # Inferencias de prueba tras cargar (ver calentar)
+        self.iteraciones_warmup = self.config.get('iteraciones_warmup', 3)
+        
         self.modelo = None
         if modelo_path:
             self.cargar_modelo(modelo_path)
     
-    def cargar_modelo(self, modelo_path: str) -> bool:
+    def cerrar(self):
+        """Libera el pool de post-proceso por lotes."""
+        if self.post_pool is not None:
+            self.post_pool.close()
+            self.post_pool.join()
+            self.post_pool = None
+    
+    def cargar_modelo(self, modelo_path: str,
+                      notificar: Optional[Callable[[str], None]] = None) -> bool:
         """
         Carga el modelo YOLO desde archivo.
         
+        Si `exportar_tensorrt` está activo, se usa (o se genera la primera
+        vez) un engine TensorRT junto al .pt. Sin TensorRT, el modelo
+        PyTorch se mueve a CUDA si hay GPU. En ambos casos se usa FP16
+        salvo `half_precision=False`.
+        
         Args:
-            modelo_path: Ruta al archivo .pt
+            modelo_path: Ruta al archivo .pt (o .engine ya exportado)
+            notificar: Callback opcional con un texto de estado (p. ej.
+                para avisar en la UI que se está exportando el engine)
             
         Returns:
             True si se cargó exitosamente
         """
         try:
-            print(f"📦 Cargando modelo YOLO desde {modelo_path}...")
-            self.modelo = YOLO(modelo_path)
-            print("✅ Modelo YOLO cargado exitosamente")
+            log.info("📦 Cargando modelo YOLO desde %s...", modelo_path)
+            self._configurar_torch()
+            self.modelo = self._cargar_modelo_optimizado(modelo_path, notificar)
+            self._preparar_tensor = None
+            if self.preproceso_gpu:
+                self._reservar_preproceso_gpu()
+            elif self.preproceso_pinned:
+                self._reservar_buffers_pinned()
+            log.info("✅ Modelo YOLO cargado exitosamente (%s)", self.inference_dtype)
             return True
         except Exception as e:
-            print(f"❌ Error cargando modelo: {e}")
+            log.error("❌ Error cargando modelo: %s", e)
             return False
     
+    def _configurar_torch(self):
+        """
+        Ajusta los backends de torch antes de cargar el modelo.
+        
+        Con `imgsz` fijo, cudnn.benchmark busca el kernel de convolución más
+        rápido en la primera inferencia (el warm-up) y lo reutiliza después;
+        TF32 acelera las capas FP32 en GPUs Ampere o superiores. No aplica a
+        engines TensorRT, que ya traen sus kernels elegidos.
+        """
+        try:
+            import torch
+        except ImportError:
+            return
+        torch.backends.cudnn.benchmark = self.cudnn_benchmark
+        torch.backends.cuda.matmul.allow_tf32 = self.permitir_tf32
+        torch.backends.cudnn.allow_tf32 = self.permitir_tf32
+    
+    def _cargar_modelo_optimizado(self, modelo_path: str,
+                                  notificar: Optional[Callable[[str], None]] = None) -> YOLO:
+        """
+        Resuelve el backend más rápido disponible para el modelo.
+        
+        Orden: engine TensorRT cacheado → exportar engine (INT8 si hay datos
+        de calibración, si no FP16/FP32) → PyTorch CUDA (FP16/FP32 según
+        `half_precision`) → PyTorch FP32 (CPU).
+        """
+        ruta = Path(modelo_path)
+        
+        if ruta.suffix == '.engine':
+            self.inference_dtype = dtype_engine(ruta)
+            return YOLO(str(ruta), task='detect')
+        
+        if self.exportar_tensorrt:
+            # Un engine estático de lote 1 no acepta lotes: con batch_size > 1
+            # se exporta dinámico hasta ese lote y se cachea aparte
+            nombre = ruta.stem
+            opciones = {}
+            if self.batch_size > 1:
+                nombre += f"_b{self.batch_size}"
+                opciones = dict(batch=self.batch_size, dynamic=True)
+            int8 = self.quantization == 'int8'
+            if int8 and not self.int8_data:
+                log.warning("⚠️ quantization=int8 sin 'int8_data' (YAML de calibración); se exporta FP16/FP32")
+                int8 = False
+            if int8:
+                nombre += "_int8"
+                opciones.update(int8=True, data=self.int8_data)
+                dtype = 'int8'
+            else:
+                if not self.half_precision:
+                    nombre += "_fp32"
+                opciones['half'] = self.half_precision
+                dtype = 'fp16' if self.half_precision else 'fp32'
+            engine = ruta.with_name(f"{nombre}.engine")
+            if not engine.exists():
+                try:
+                    log.info("⚙️ Exportando engine TensorRT %s (imgsz=%s, lote=%s)...",
+                             dtype.upper(), self.imgsz, self.batch_size)
+                    if notificar:
+                        notificar(f"⚙️ Exportando TensorRT {dtype.upper()} (solo la primera vez)...")
+                    exportado = Path(YOLO(str(ruta)).export(
+                        format='engine', imgsz=self.imgsz,
+                        workspace=self.workspace_trt_gb, **opciones
+                    ))
+                    if exportado != engine:
+                        exportado.replace(engine)
+                except Exception as e:
+                    log.warning("⚠️ TensorRT no disponible, se usa PyTorch: %s", e)
+            if engine.exists():
+                self.inference_dtype = dtype_engine(engine)
+                return YOLO(str(engine), task='detect')
+        
+        modelo = YOLO(str(ruta))
+        try:
+            import torch
+            if str(self.device) != 'cpu' and torch.cuda.is_available():
+                modelo.to('cuda' if self.device is None else self.device)
+                if self.half_precision:
+                    self.inference_dtype = 'fp16'
+        except ImportError:
+            pass
+        return modelo
+    
+    def calentar(self):
+        """
+        Ejecuta inferencias de prueba sobre frames vacíos.
+        
+        La primera llamada a predict() paga la inicialización de CUDA, la
+        búsqueda de algoritmos de cuDNN (o la carga de kernels de TensorRT)
+        y la reserva de buffers; con esto ese costo no cae en la primera
+        solicitud real. Con lotes también se calienta el tamaño de lote
+        completo. Conviene llamarlo desde el mismo hilo que luego infiere.
+        """
+        if self.modelo is None:
+            return
+        alto, ancho = self.imgsz if isinstance(self.imgsz, list) else (self.imgsz, self.imgsz)
+        frame_vacio = np.zeros((alto, ancho, 3), dtype=np.uint8)
+        for _ in range(self.iteraciones_warmup):
+            self.inferir(frame_vacio)
+            if self.batch_size > 1:
+                self.inferir_lote([frame_vacio] * self.batch_size)
+        log.info("🔥 Warm-up del modelo completado (%d iteraciones)", self.iteraciones_warmup)
+    
+    def inferir(self, frame):
+        """
+        Ejecuta YOLO sobre un frame con la precisión del modelo cargado.
+        
+        Args:
+            frame: Imagen BGR (numpy)
+            
+        Returns:
+            Resultados crudos de model.predict()
+        """
+        if self._preparar_tensor is not None:
+            return self._predecir_tensor([frame])
+        return self.modelo.predict(
+            frame,
+            half=self.inference_dtype == 'fp16',
+            imgsz=self.imgsz,
+            verbose=False,
+            **self._kwargs_device
+        )
+    
+    def inferir_lote(self, frames: List[np.ndarray]):
+        """
+        Ejecuta YOLO sobre varios frames en una sola llamada.
+        
+        Args:
+            frames: Lista de imágenes BGR (hasta `batch_size`)
+            
+        Returns:
+            Lista de Results, uno por frame y en el mismo orden
+        """
+        if self._preparar_tensor is not None:
+            return self._predecir_tensor(frames)
+        return self.modelo.predict(
+            list(frames),
+            half=self.inference_dtype == 'fp16',
+            imgsz=self.imgsz,
+            verbose=False,
+            **self._kwargs_device
+        )
+    
+    def _reservar_buffers_pinned(self) -> None:
+        """
+        Reserva el lote de entrada (batch_size, H, W, 3) uint8 en memoria
+        pinned, su copia en GPU y el tensor (batch_size, 3, H, W) que recibe
+        predict(). Sin CUDA se sigue con el preproceso de Ultralytics.
+        """
+        self._pinned = None
+        try:
+            import torch
+        except ImportError:
+            log.warning("⚠️ preproceso_pinned requiere torch; se usa el preproceso estándar")
+            return
+        if str(self.device) == 'cpu' or not torch.cuda.is_available():
+            log.warning("⚠️ preproceso_pinned sin CUDA; se usa el preproceso estándar")
+            return
+        dispositivo = 'cuda' if self.device is None else self.device
+        
+        alto, ancho = self.imgsz if isinstance(self.imgsz, list) else (self.imgsz, self.imgsz)
+        forma = (self.batch_size, alto, ancho, 3)
+        host = torch.full(forma, 114, dtype=torch.uint8).pin_memory()
+        self._pinned = {
+            'host': host,
+            'buf': host.numpy(),  # Vista NumPy del mismo buffer
+            'gpu_u8': torch.empty(forma, dtype=torch.uint8, device=dispositivo),
+            'entrada': torch.empty((self.batch_size, 3, alto, ancho), device=dispositivo,
+                                   dtype=torch.float16 if self.inference_dtype == 'fp16' else torch.float32),
+            'geometria': None,  # (h, w) de los frames del último letterbox
+        }
+        self._preparar_tensor = self._letterbox_a_tensor
+        log.info("✅ Buffers pinned de preproceso reservados (%sx%sx%s)", self.batch_size, alto, ancho)
+    
+    def _reservar_preproceso_gpu(self) -> None:
+        """
+        Reserva el tensor de entrada (batch_size, 3, H, W) en GPU para el
+        preproceso fusionado. El buffer del frame crudo se reserva en el
+        primer uso (depende de la resolución de la fuente).
+        """
+        try:
+            import torch
+            import torch.nn.functional as F
+        except ImportError:
+            log.warning("⚠️ preproceso_gpu requiere torch; se usa el preproceso estándar")
+            return
+        if str(self.device) == 'cpu' or not torch.cuda.is_available():
+            log.warning("⚠️ preproceso_gpu sin CUDA; se usa el preproceso estándar")
+            return
+        
+        alto, ancho = self.imgsz if isinstance(self.imgsz, list) else (self.imgsz, self.imgsz)
+        dispositivo = 'cuda' if self.device is None else self.device
+        self._gpu_pre = {
+            'torch': torch,
+            'interpolar': F.interpolate,
+            'dispositivo': dispositivo,
+            'crudo': None,  # (batch_size, h, w, 3) uint8 con la resolución de la fuente
+            'entrada': torch.empty((self.batch_size, 3, alto, ancho), device=dispositivo,
+                                   dtype=torch.float16 if self.inference_dtype == 'fp16' else torch.float32),
+            'geometria': None,
+        }
+        self._preparar_tensor = self._preproceso_en_gpu
+        log.info("✅ Preproceso en GPU reservado (%sx%sx%s)", self.batch_size, alto, ancho)
+    
+    def _preproceso_en_gpu(self, frames: List[np.ndarray]):
+        """
+        Sube los frames BGR uint8 tal cual (1 byte/canal) y arma el lote de
+        entrada en la GPU: permute + flip de canales + cast + /255 + resize
+        bilineal al letterbox, escrito sobre el tensor de entrada cacheado.
+        En CPU no se toca ningún píxel.
+        """
+        g = self._gpu_pre
+        torch = g['torch']
+        n = len(frames)
+        h, w = frames[0].shape[:2]
+        entrada = g['entrada']
+        _, _, alto, ancho = entrada.shape
+        escala = min(alto / h, ancho / w)
+        nh, nw = round(h * escala), round(w * escala)
+        top, left = (alto - nh) // 2, (ancho - nw) // 2
+        
+        if g['geometria'] != (h, w):
+            g['crudo'] = torch.empty((self.batch_size, h, w, 3), dtype=torch.uint8,
+                                     device=g['dispositivo'])
+            entrada.fill_(114 / 255.0)
+            g['geometria'] = (h, w)
+        crudo = g['crudo']
+        for i, frame in enumerate(frames):
+            crudo[i].copy_(torch.from_numpy(frame))
+        
+        x = crudo[:n].permute(0, 3, 1, 2).flip(1).to(entrada.dtype).div_(255.0)
+        if (nh, nw) != (h, w):
+            x = g['interpolar'](x, size=(nh, nw), mode='bilinear', align_corners=False)
+        entrada[:n, :, top:top + nh, left:left + nw] = x
+        return entrada[:n]
+    
+    def _letterbox_a_tensor(self, frames: List[np.ndarray]):
+        """
+        Letterbox de cada frame sobre su slot del buffer pinned y subida del
+        lote a GPU en una sola copia asíncrona.
+        
+        El relleno gris solo se repinta si cambia el tamaño de los frames;
+        BGR→RGB + HWC→CHW + cast se hacen con una copia por canal directa al
+        tensor de entrada, seguida de un /255 en sitio.
+        """
+        b = self._pinned
+        buf = b['buf']
+        n = len(frames)
+        _, alto, ancho, _ = buf.shape
+        h, w = frames[0].shape[:2]
+        escala = min(alto / h, ancho / w)
+        nh, nw = round(h * escala), round(w * escala)
+        top, left = (alto - nh) // 2, (ancho - nw) // 2
+        
+        if b['geometria'] != (h, w):
+            buf.fill(114)
+            b['geometria'] = (h, w)
+        for i, frame in enumerate(frames):
+            buf[i, top:top + nh, left:left + nw] = cv2.resize(
+                frame, (nw, nh), interpolation=cv2.INTER_LINEAR
+            )
+        
+        gpu = b['gpu_u8'][:n]
+        gpu.copy_(b['host'][:n], non_blocking=True)
+        entrada = b['entrada'][:n]
+        for c_dst, c_src in ((0, 2), (1, 1), (2, 0)):
+            entrada[:, c_dst].copy_(gpu[..., c_src])
+        return entrada.mul_(1.0 / 255.0)
+    
+    def _predecir_tensor(self, frames: List[np.ndarray]):
+        """predict() sobre el lote ya en GPU; las cajas vuelven al frame original"""
+        from ultralytics.utils import ops
+        
+        tensor = self._preparar_tensor(frames)
+        results = self.modelo.predict(
+            tensor,
+            half=self.inference_dtype == 'fp16',
+            imgsz=self.imgsz,
+            verbose=False,
+            **self._kwargs_device
+        )
+        for r, frame in zip(results, frames):
+            datos = r.boxes.data.clone()
+            datos[:, :4] = ops.scale_boxes(tensor.shape[2:], datos[:, :4], frame.shape)
+            r.orig_img = frame
+            r.orig_shape = frame.shape[:2]
+            r.update(boxes=datos)
+        return results
+    
     def procesar_resultados(self, 
                            yolo_results,
                            ancho_imagen: int,
@@ -70,7 +472,8 @@ class VisionProcessor:
         2. Filtrar por confianza mínima
         3. Calcular desviación en mm
         4. Contar filas
-        5. Generar metadata para debugging
+        5. Generar metadata para debugging (estadísticos de confianza
+           solo con `debug_metadata` activo)
         
         Args:
             yolo_results: Resultados crudos de model.predict()
@@ -87,78 +490,193 @@ class VisionProcessor:
             }
         """
         result = yolo_results[0]
+        boxes = result.boxes
         
         # Validación: sin detecciones
-        if result.boxes is None or len(result.boxes) == 0:
+        if boxes is None or len(boxes) == 0:
             return self._generar_respuesta_fallo(
                 "No se detectaron objetos en la imagen"
             )
         
+        total_detectado = len(boxes)
+        
+        if self.postproceso_jit:
+            return self._procesar_jit(boxes, total_detectado, ancho_imagen, alto_imagen)
+        
         # Filtrar detecciones válidas
-        detecciones_validas = self._filtrar_por_confianza(result.boxes)
+        detecciones_validas = self._filtrar_por_confianza(boxes)
+        num_filas = len(detecciones_validas)
         
-        if len(detecciones_validas) == 0:
+        if num_filas == 0:
             return self._generar_respuesta_fallo(
                 f"Ninguna detección supera el umbral de confianza "
                 f"({self.confianza_minima*100:.0f}%)"
             )
         
         # Calcular métricas
-        num_filas = len(detecciones_validas)
         desviacion_mm = self._calcular_desviacion(
             detecciones_validas, 
             ancho_imagen
         )
         
         # Generar metadata
-        confianzas = [d['confianza'] for d in detecciones_validas]
+        metadata = {
+            'total_detectado': total_detectado,
+            'detecciones_validas': num_filas,
+            'ancho_imagen': ancho_imagen,
+            'alto_imagen': alto_imagen
+        }
+        
+        # Estadísticos de confianza solo si se piden (no los usa el PLC)
+        if self.debug_metadata:
+            confianzas = detecciones_validas.confianza
+            metadata['confianza_promedio'] = confianzas.sum().item() / num_filas
+            metadata['confianza_minima'] = confianzas.min().item()
+            metadata['confianza_maxima'] = confianzas.max().item()
         
         return {
             'success': True,
             'filas': num_filas,
             'desviacion_mm': desviacion_mm,
-            'metadata': {
-                'total_detectado': len(result.boxes),
-                'detecciones_validas': len(detecciones_validas),
-                'confianza_promedio': float(np.mean(confianzas)),
-                'confianza_minima': float(np.min(confianzas)),
-                'confianza_maxima': float(np.max(confianzas)),
-                'ancho_imagen': ancho_imagen,
-                'alto_imagen': alto_imagen
-            }
+            'metadata': metadata
         }
     
-    def _filtrar_por_confianza(self, boxes) -> List[Dict]:
+    def _procesar_jit(self, boxes, total_detectado: int,
+                      ancho_imagen: int, alto_imagen: int) -> Dict:
+        """
+        Variante de procesar_resultados con filtrado, conteo y desviación
+        fusionados en `filas_y_desviacion` (una pasada, sin temporales).
+        Mismo resultado que el camino NumPy.
+        """
+        if ancho_imagen != self._ancho_referencia:
+            self.ajustar_referencia(ancho_imagen)
+        
+        datos = np.asarray(boxes.data.detach().cpu().numpy(), dtype=np.float32)
+        num_filas, desv_px, suma_conf, conf_min, conf_max = filas_y_desviacion(
+            datos, self.confianza_minima, self._punto_referencia_cached
+        )
+        
+        if num_filas == 0:
+            return self._generar_respuesta_fallo(
+                f"Ninguna detección supera el umbral de confianza "
+                f"({self.confianza_minima*100:.0f}%)"
+            )
+        
+        metadata = {
+            'total_detectado': total_detectado,
+            'detecciones_validas': num_filas,
+            'ancho_imagen': ancho_imagen,
+            'alto_imagen': alto_imagen
+        }
+        if self.debug_metadata:
+            metadata['confianza_promedio'] = float(suma_conf) / num_filas
+            metadata['confianza_minima'] = float(conf_min)
+            metadata['confianza_maxima'] = float(conf_max)
+        
+        return {
+            'success': True,
+            'filas': int(num_filas),
+            'desviacion_mm': float(desv_px) * self.mm_per_pixel,
+            'metadata': metadata
+        }
+    
+    def procesar_lote(self, results_list, ancho_imagen: int, alto_imagen: int) -> List[Dict]:
+        """
+        procesar_resultados sobre cada Results de inferir_lote, repartido
+        en `post_pool` (cada elemento del lote es independiente).
+        
+        Args:
+            results_list: Lista de Results (uno por frame)
+            ancho_imagen: Ancho de las imágenes en píxeles
+            alto_imagen: Alto de las imágenes en píxeles
+            
+        Returns:
+            Un resultado de procesar_resultados por frame, en orden
+        """
+        # La referencia se ajusta antes: dentro del pool solo se lee
+        if ancho_imagen != self._ancho_referencia:
+            self.ajustar_referencia(ancho_imagen)
+        
+        argumentos = [([r], ancho_imagen, alto_imagen) for r in results_list]
+        if self.post_pool is None or len(argumentos) < 2:
+            return [self.procesar_resultados(*a) for a in argumentos]
+        return self.post_pool.starmap(self.procesar_resultados, argumentos)
+    
+    @property
+    def _scratch(self) -> Dict[str, np.ndarray]:
+        """Buffers de trabajo del hilo actual (se reservan al primer uso)"""
+        if not hasattr(self._por_hilo, 'scratch'):
+            self._reservar_scratch(self._capacidad_inicial)
+        return self._por_hilo.scratch
+    
+    @property
+    def _capacidad_scratch(self) -> int:
+        return self._scratch['conf'].shape[0]
+    
+    def _reservar_scratch(self, capacidad: int) -> None:
+        """Reserva los buffers de trabajo del hilo actual para `capacidad` detecciones"""
+        self._por_hilo.scratch = {
+            'mascara': np.empty(capacidad, np.bool_),
+            'xyxy': np.empty((capacidad, 4), np.float32),
+            'conf': np.empty(capacidad, np.float32),
+            'cx': np.empty(capacidad, np.float32),
+            'cy': np.empty(capacidad, np.float32),
+            'ancho': np.empty(capacidad, np.float32),
+            'alto': np.empty(capacidad, np.float32),
+            'desv': np.empty(capacidad, np.float32),
+            'dist': np.empty(capacidad, np.float32),
+        }
+    
+    def _filtrar_por_confianza(self, boxes) -> Detecciones:
         """
         Filtra cajas de detección por umbral de confianza.
         
+        El tensor `boxes.data` (N, 6: x1, y1, x2, y2, conf, cls) se copia
+        a NumPy en una sola transferencia (una sola sincronización con la
+        GPU) y el filtrado se hace con una máscara booleana, sin bucle ni
+        `.item()` por caja.
+        
+        Los resultados se escriben en los buffers de `_scratch`, así que
+        los arrays retornados son vistas válidas hasta la siguiente llamada.
+        
         Args:
             boxes: Objeto boxes de YOLO results
             
         Returns:
-            Lista de diccionarios con datos de detecciones válidas
+            Detecciones válidas en formato columnar
         """
-        detecciones = []
+        # float32 (sin copia en el caso habitual; FP16 se promueve aquí)
+        datos = np.asarray(boxes.data.detach().cpu().numpy(), dtype=np.float32)
+        total = len(datos)
+        if total > self._capacidad_scratch:
+            self._reservar_scratch(max(total, 2 * self._capacidad_scratch))
+        buf = self._scratch
         
-        for box in boxes:
-            confianza = float(box.conf[0].item())
-            
-            if confianza >= self.confianza_minima:
-                x1, y1, x2, y2 = box.xyxy[0].tolist()
-                
-                detecciones.append({
-                    'center_x': (x1 + x2) / 2,
-                    'center_y': (y1 + y2) / 2,
-                    'ancho': x2 - x1,
-                    'alto': y2 - y1,
-                    'confianza': confianza,
-                    'bbox': (x1, y1, x2, y2)
-                })
-        
-        return detecciones
+        umbral = self.confianza_minima
+        mascara = np.greater_equal(datos[:, -2], umbral, out=buf['mascara'][:total])
+        n = int(np.count_nonzero(mascara))
+        
+        xyxy = np.compress(mascara, datos[:, :4], axis=0, out=buf['xyxy'][:n])
+        conf = np.compress(mascara, datos[:, -2], out=buf['conf'][:n])
+        
+        x1, y1, x2, y2 = xyxy[:, 0], xyxy[:, 1], xyxy[:, 2], xyxy[:, 3]
+        
+        center_x = np.add(x1, x2, out=buf['cx'][:n])
+        center_x *= 0.5
+        center_y = np.add(y1, y2, out=buf['cy'][:n])
+        center_y *= 0.5
+        
+        return Detecciones(
+            center_x=center_x,
+            center_y=center_y,
+            ancho=np.subtract(x2, x1, out=buf['ancho'][:n]),
+            alto=np.subtract(y2, y1, out=buf['alto'][:n]),
+            confianza=conf,
+            bbox=xyxy
+        )
     
     def _calcular_desviacion(self, 
-                            detecciones: List[Dict], 
+                            detecciones: Detecciones, 
                             ancho_imagen: int) -> float:
         """
         Calcula la desviación en milímetros.
@@ -166,32 +684,28 @@ class VisionProcessor:
         Estrategia: Encontrar el objeto más cercano al punto de referencia.
         
         Args:
-            detecciones: Lista de diccionarios con detecciones
+            detecciones: Detecciones válidas (formato columnar)
             ancho_imagen: Ancho de la imagen en píxeles
             
         Returns:
             Desviación en mm (positivo=derecha, negativo=izquierda)
         """
-        # Determinar punto de referencia
-        if self.usar_centro_imagen or self.referencia_x_custom is None:
-            punto_referencia = ancho_imagen / 2
-        else:
-            punto_referencia = self.referencia_x_custom
+        # Punto de referencia (se recalcula solo si cambia la cámara)
+        if ancho_imagen != self._ancho_referencia:
+            self.ajustar_referencia(ancho_imagen)
+        punto_referencia = self._punto_referencia_cached
         
-        # Buscar objeto más cercano al punto de referencia
-        min_distancia_abs = float('inf')
-        desviacion_objetivo = 0.0
+        if len(detecciones) == 0:
+            return 0.0
         
-        for det in detecciones:
-            desviacion_px = det['center_x'] - punto_referencia
-            distancia_abs = abs(desviacion_px)
-            
-            if distancia_abs < min_distancia_abs:
-                min_distancia_abs = distancia_abs
-                desviacion_objetivo = desviacion_px
+        # Objeto más cercano al punto de referencia (primer mínimo en empates)
+        n = len(detecciones)
+        desviaciones_px = np.subtract(detecciones.center_x, punto_referencia,
+                                      out=self._scratch['desv'][:n])
+        idx = np.argmin(np.abs(desviaciones_px, out=self._scratch['dist'][:n]))
         
-        # Convertir a mm
-        desviacion_mm = desviacion_objetivo * self.mm_per_pixel
+        # Convertir a mm (.item() ya retorna un float de Python)
+        desviacion_mm = desviaciones_px.item(idx) * self.mm_per_pixel
         
         return desviacion_mm
     
@@ -205,7 +719,7 @@ class VisionProcessor:
         Returns:
             Dict con success=False y metadata
         """
-        print(f"⚠️ Procesamiento fallido: {razon}")
+        log.warning("Procesamiento fallido: %s", razon)
         
         return {
             'success': False,
@@ -254,6 +768,22 @@ class VisionProcessor:
         
         return len(advertencias) == 0, advertencias
     
+    def ajustar_referencia(self, ancho_imagen: int) -> None:
+        """
+        Precalcula el punto de referencia X para un ancho de imagen.
+        
+        Se llama al configurar la cámara; `_calcular_desviacion` lo
+        invoca automáticamente si el ancho de imagen cambia.
+        
+        Args:
+            ancho_imagen: Ancho de la imagen en píxeles
+        """
+        self._ancho_referencia = ancho_imagen
+        if self._referencia_x_fija is None:
+            self._punto_referencia_cached = ancho_imagen / 2
+        else:
+            self._punto_referencia_cached = self._referencia_x_fija
+    
     def ajustar_calibracion(self, nuevo_mm_per_pixel: float) -> None:
         """
         Ajusta la calibración espacial del sistema.
@@ -262,7 +792,7 @@ class VisionProcessor:
             nuevo_mm_per_pixel: Nueva relación mm/píxel
         """
         self.mm_per_pixel = nuevo_mm_per_pixel
-        print(f"🔧 Calibración actualizada: {self.mm_per_pixel} mm/píxel")
+        log.info("🔧 Calibración actualizada: %s mm/píxel", self.mm_per_pixel)
 
 
 # =============================================================================
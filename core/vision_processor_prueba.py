@@ -4,11 +4,44 @@ VisionProcessor_prueba - Módulo de procesamiento de visión artificial
 Integra la lógica de 'prueba_control.py'
 """
 
+import logging
+import time
 import numpy as np
 import cv2
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 from ultralytics import YOLO
 
+from ._tensorrt import dtype_engine
+from ._vision_jit import correccion_z, columna_mas_cercana
+
+
+class AnotacionDiferida:
+    """
+    Frame anotado que solo se dibuja (p. ej. results.plot()) cuando alguien
+    lo pide.
+    
+    El ciclo PLC no necesita la imagen; la UI llama a get() al mostrarla.
+    """
+    __slots__ = ('_dibujar', '_img')
+    
+    def __init__(self, dibujar=None, imagen=None):
+        """
+        Args:
+            dibujar: Callable sin argumentos que devuelve la imagen
+            imagen: Imagen ya lista (no se dibuja nada)
+        """
+        self._dibujar = dibujar
+        self._img = imagen
+    
+    def get(self) -> np.ndarray:
+        if self._img is None:
+            self._img = self._dibujar()
+            self._dibujar = None
+        return self._img
+
+
 class VisionProcessor:
     """
     Procesador de visión DUAL.
@@ -65,34 +98,381 @@ class VisionProcessor:
         # Estado de calibración
         self.X_CENTROS_IDEALES = {}
         self.calibrado_y = False
+        self._xi_sorted = np.empty(0, dtype=np.int32)   # Centros ideales ordenados
+        self._xi_nums = np.empty(0, dtype=np.int32)     # Número de columna de cada centro
+        
+        # Inferencia lateral en paralelo con la superior (un hilo dedicado)
+        self.inferencia_paralela = self.config_vision.get('inferencia_paralela', True)
+        self._executor_lat = ThreadPoolExecutor(max_workers=1, thread_name_prefix='yolo-lat') \
+            if self.inferencia_paralela else None
+        
+        # Optimización de inferencia (engine TensorRT FP16 cacheado junto al .pt)
+        self.imgsz = self.config_vision.get('imgsz', 640)
+        self.exportar_tensorrt = self.config_vision.get('exportar_tensorrt', True)
+        # 'fp16' o 'int8'; INT8 necesita un YAML de calibración con imágenes de planta
+        self.quantization = self.config_vision.get('quantization', 'fp16')
+        self.int8_data = self.config_vision.get('int8_data', None)
+        # FP16 en GPU (engine TensorRT o PyTorch CUDA); False = FP32
+        self.half_precision = self.config_vision.get('half_precision', True)
+        # Backends de torch (globales al proceso, ver _configurar_torch)
+        self.cudnn_benchmark = self.config_vision.get('cudnn_benchmark', True)
+        self.permitir_tf32 = self.config_vision.get('permitir_tf32', True)
+        # Hilos intra-op de torch (None = los que elija torch)
+        self.torch_num_threads = config.get('sistema', {}).get('torch_num_threads')
+        self.half_sup = False
+        self.half_lat = False
+        
+        # False = no se dibujan cajas; get() devuelve el frame original
+        self.render_overlays = self.config_vision.get('render_overlays', True)
+        self._buffer_aviso = None  # Reutilizado por _aviso_sobre_frame
+        
+        # Reutilizar el resultado lateral si el frame casi no cambió
+        # (diferencia absoluta media entre miniaturas 32x32 en gris menor a
+        # dedup_lateral_umbral) y el resultado tiene menos de
+        # dedup_lateral_ttl_ms. El TTL tiene que superar el período del ciclo
+        # (delay_post_proceso_ms / delay_simulacion_ms) o nunca hay acierto
+        self.dedup_lateral = self.config_vision.get('dedup_lateral', True)
+        self.dedup_lateral_ttl_s = self.config_vision.get('dedup_lateral_ttl_ms', 1500) / 1000.0
+        self.dedup_lateral_umbral = self.config_vision.get('dedup_lateral_umbral', 2.0)
+        self._miniatura_lat = None
+        self._resultado_lat = None
+        self._t_resultado_lat = 0.0
+        
+        # Letterbox propio sobre un buffer pinned por cámara (solo CUDA)
+        self.preproceso_pinned = self.config_vision.get('preproceso_pinned', False)
+        self._dev = None
+        self._pinned = {}
+        self._streams = {}
+        self._stream_ctx = None
+        
+        # Con preproceso_pinned: llamar al backend + NMS sin predict()
+        self.inferencia_directa = self.config_vision.get('inferencia_directa', False)
+        self.iou = self.config_vision.get('iou', 0.7)           # Defaults de predict()
+        self.max_det = self.config_vision.get('max_det', 300)
         
         # Cargar modelos
         self.modelo_sup = None
         self.modelo_lat = None
         self.modelos_cargados = self._cargar_modelos(modelo_path_sup, modelo_path_lat)
 
+    _NIVELES_LOG = {'info': logging.INFO, 'warning': logging.WARNING, 'error': logging.ERROR}
+
+    def _log_activo(self, nivel: str = 'info') -> bool:
+        """True si un mensaje de este nivel llegaría a algún handler"""
+        return self.logger is None or self.logger.isEnabledFor(self._NIVELES_LOG[nivel])
+
     def _log(self, mensaje: str, nivel: str = 'info'):
         """Helper para loggear"""
         if self.logger:
-            if nivel == 'info': self.logger.info(mensaje)
-            elif nivel == 'warning': self.logger.warning(mensaje)
-            elif nivel == 'error': self.logger.error(mensaje)
+            lvl = self._NIVELES_LOG[nivel]
+            if self.logger.isEnabledFor(lvl):
+                self.logger.log(lvl, mensaje)
         else:
             print(mensaje) # Fallback a print
 
     def _cargar_modelos(self, path_sup, path_lat):
         """Carga los modelos YOLOv8 para ambas cámaras."""
         try:
+            self._configurar_torch()
             self._log(f"📦 Cargando modelo Superior desde {path_sup}...")
-            self.modelo_sup = YOLO(path_sup)
+            self.modelo_sup, self.half_sup = self._cargar_yolo(path_sup)
             self._log(f"📦 Cargando modelo Lateral desde {path_lat}...")
-            self.modelo_lat = YOLO(path_lat)
-            self._log("✅ Modelos Superior y Lateral cargados.")
+            self.modelo_lat, self.half_lat = self._cargar_yolo(path_lat)
+            self._log(f"✅ Modelos Superior y Lateral cargados. "
+                      f"(FP16 sup={self.half_sup}, lat={self.half_lat})")
+            self._construir_ids_clases()
+            if self.preproceso_pinned:
+                self._reservar_buffers_pinned()
+            if self._executor_lat:
+                self._reservar_streams()
+            self._calentar_modelos()
             return True
         except Exception as e:
             self._log(f"❌ ERROR al cargar modelos: {e}", 'error')
             return False
 
+    def _configurar_torch(self):
+        """
+        cudnn.benchmark elige el kernel de convolución más rápido para el
+        imgsz fijo en el warm-up; TF32 acelera las capas FP32 en Ampere+.
+        Con `sistema.torch_num_threads` se acota el pool intra-op, para que
+        no compita por núcleos con la captura y el hilo de Tk.
+        """
+        try:
+            import torch
+        except ImportError:
+            return
+        if self.torch_num_threads:
+            torch.set_num_threads(self.torch_num_threads)
+        torch.backends.cudnn.benchmark = self.cudnn_benchmark
+        torch.backends.cuda.matmul.allow_tf32 = self.permitir_tf32
+        torch.backends.cudnn.allow_tf32 = self.permitir_tf32
+
+    def _cargar_yolo(self, path):
+        """
+        Carga un modelo usando el backend más rápido disponible.
+        
+        Orden: engine TensorRT cacheado → exportar engine FP16/INT8 (primera
+        vez; FP32 con half_precision=False) → PyTorch CUDA FP16 (o FP32) →
+        PyTorch FP32 (CPU).
+        
+        Returns:
+            (modelo, usar_half)
+        """
+        ruta = Path(path)
+        
+        # Engines: half solo si su entrada es FP16 (los INT8/FP32 reciben
+        # float32; AutoBackend solo convierte hacia half, nunca de vuelta)
+        if ruta.suffix == '.engine':
+            return YOLO(str(ruta), task='detect'), dtype_engine(ruta) == 'fp16'
+        
+        if self.exportar_tensorrt:
+            int8 = self.quantization == 'int8'
+            if int8 and not self.int8_data:
+                self._log("⚠️ quantization=int8 sin 'int8_data' (YAML de calibración); se exporta FP16.", 'warning')
+                int8 = False
+            
+            # Cada precisión tiene su propio engine cacheado
+            if int8:
+                engine = ruta.with_name(f"{ruta.stem}_int8.engine")
+            elif self.half_precision:
+                engine = ruta.with_suffix('.engine')
+            else:
+                engine = ruta.with_name(f"{ruta.stem}_fp32.engine")
+            if not engine.exists():
+                try:
+                    precision = 'INT8' if int8 else ('FP16' if self.half_precision else 'FP32')
+                    self._log(f"⚙️ Exportando {ruta.name} a TensorRT {precision} (imgsz={self.imgsz})...")
+                    opciones = dict(int8=True, data=self.int8_data) if int8 else dict(half=self.half_precision)
+                    exportado = Path(YOLO(str(ruta)).export(
+                        format='engine', imgsz=self.imgsz,
+                        device=0, dynamic=False, batch=1, **opciones
+                    ))
+                    if exportado != engine:
+                        exportado.replace(engine)
+                except Exception as e:
+                    self._log(f"⚠️ TensorRT no disponible para {ruta.name}, se usa PyTorch: {e}", 'warning')
+            if engine.exists():
+                return YOLO(str(engine), task='detect'), dtype_engine(engine) == 'fp16'
+        
+        modelo = YOLO(str(ruta))
+        try:
+            import torch
+            if torch.cuda.is_available():
+                modelo.to('cuda')
+                return modelo, self.half_precision
+        except ImportError:
+            pass
+        return modelo, False
+
+    def _construir_ids_clases(self):
+        """
+        Traduce los nombres de clase de la config a ids de cada modelo,
+        para comparar enteros en el bucle en vez de strings.
+        """
+        inv_sup = {v: k for k, v in self.modelo_sup.names.items()}
+        self.ID_POSICION = inv_sup.get(self.CLASE_POSICION, -1)
+        self.ID_VACIO = inv_sup.get(self.CLASE_VACIO, -1)
+        self.IDS_FALLO_SUP = frozenset(inv_sup[c] for c in self.CLASES_FALLO_SUPERIOR if c in inv_sup)
+        
+        inv_lat = {v: k for k, v in self.modelo_lat.names.items()}
+        self.ID_REF = inv_lat.get(self.CLASE_REFERENCIA, -1)
+        self.ID_BORDE = inv_lat.get(self.CLASE_BORDE_ENV, -1)
+        self.ID_MITAD = inv_lat.get(self.CLASE_MITAD_ENV, -1)
+        self.IDS_ANOM_LAT = frozenset(inv_lat[c] for c in self.CLASES_ANOMALIA_LATERAL if c in inv_lat)
+        
+        # Arrays para np.isin (se construyen una sola vez)
+        self._ids_fallo_sup = np.fromiter(self.IDS_FALLO_SUP, dtype=np.int32)
+        self._ids_anom_lat = np.fromiter(self.IDS_ANOM_LAT, dtype=np.int32)
+        self._ids_z = np.array([self.ID_REF, self.ID_BORDE, self.ID_MITAD], dtype=np.int32)
+        
+        # La lateral solo lee anomalías y las 3 clases Z: se filtra en GPU
+        # antes de la copia D2H (se sube al dispositivo en el primer uso)
+        import torch
+        self._isin = torch.isin
+        self._ids_interes_lat = torch.from_numpy(np.concatenate((self._ids_anom_lat, self._ids_z)))
+
+    def _reservar_buffers_pinned(self):
+        """
+        Reserva un buffer HWC uint8 en memoria pinned por cámara.
+        
+        El letterbox se escribe directamente sobre su vista NumPy y la copia
+        H2D es asíncrona; sin CUDA se sigue con el preproceso de Ultralytics.
+        """
+        try:
+            import torch
+        except ImportError:
+            self._log("⚠️ preproceso_pinned requiere torch; se usa el preproceso estándar.", 'warning')
+            return
+        if not torch.cuda.is_available():
+            self._log("⚠️ preproceso_pinned sin CUDA; se usa el preproceso estándar.", 'warning')
+            return
+        
+        self._dev = torch.device('cuda:0')
+        self._inference_mode = torch.inference_mode
+        lado = self.imgsz
+        for camara, half in (('sup', self.half_sup), ('lat', self.half_lat)):
+            host = torch.full((lado, lado, 3), 114, dtype=torch.uint8).pin_memory()
+            self._pinned[camara] = {
+                'host': host,
+                'buf': host.numpy(),                       # Vista NumPy del mismo buffer
+                'gpu_u8': torch.empty((lado, lado, 3), dtype=torch.uint8, device=self._dev),
+                'entrada': torch.empty((1, 3, lado, lado), device=self._dev,
+                                       dtype=torch.float16 if half else torch.float32),
+                'geometria': None,                         # (h, w) del último letterbox
+            }
+        self._log(f"✅ Buffers pinned de preproceso reservados ({lado}x{lado}).")
+
+    def _letterbox_a_tensor(self, frame, camara, half):
+        """
+        Letterbox de frame sobre el buffer pinned de la cámara y subida a GPU.
+        
+        Todo va a buffers reservados: el relleno gris solo se repinta si
+        cambia el tamaño del frame, y BGR→RGB + HWC→CHW + cast se hacen con
+        una copia por canal directa al tensor de entrada (sin intermedios),
+        seguida de un /255 en sitio.
+        """
+        b = self._pinned[camara]
+        buf = b['buf']
+        h, w = frame.shape[:2]
+        escala = min(self.imgsz / h, self.imgsz / w)
+        nh, nw = round(h * escala), round(w * escala)
+        top, left = (self.imgsz - nh) // 2, (self.imgsz - nw) // 2
+        
+        if b['geometria'] != (h, w):
+            buf.fill(114)
+            b['geometria'] = (h, w)
+        buf[top:top + nh, left:left + nw] = cv2.resize(frame, (nw, nh), interpolation=cv2.INTER_LINEAR)
+        
+        gpu = b['gpu_u8']
+        gpu.copy_(b['host'], non_blocking=True)
+        entrada = b['entrada']
+        for c_dst, c_src in ((0, 2), (1, 1), (2, 0)):
+            entrada[0, c_dst].copy_(gpu[..., c_src])
+        return entrada.mul_(1.0 / 255.0)
+
+    def _reservar_streams(self):
+        """
+        Un torch.cuda.Stream por cámara, para que las dos inferencias
+        paralelas no se serialicen en el stream por defecto.
+        """
+        try:
+            import torch
+        except ImportError:
+            return
+        if not torch.cuda.is_available():
+            return
+        self._stream_ctx = torch.cuda.stream
+        self._streams = {'sup': torch.cuda.Stream(), 'lat': torch.cuda.Stream()}
+
+    def _predecir(self, modelo, half, frame, conf, camara=None):
+        """predict() en el stream CUDA de la cámara (si hay)"""
+        stream = self._streams.get(camara)
+        if stream is None:
+            return self._predecir_en_stream(modelo, half, frame, conf, camara)
+        # La lectura de cajas (.cpu()) sincroniza con este stream
+        with self._stream_ctx(stream):
+            return self._predecir_en_stream(modelo, half, frame, conf, camara)
+
+    def _predecir_en_stream(self, modelo, half, frame, conf, camara):
+        """predict() con la precisión y el tamaño de entrada del engine"""
+        if camara not in self._pinned:
+            return modelo.predict(source=frame, conf=conf, half=half,
+                                  imgsz=self.imgsz, verbose=False)
+        
+        from ultralytics.utils import ops
+        
+        tensor = self._letterbox_a_tensor(frame, camara, half)
+        if self.inferencia_directa and modelo.predictor is not None:
+            return self._inferir_directo(modelo, tensor, frame, conf)
+        
+        results = modelo.predict(source=tensor, conf=conf, half=half,
+                                 imgsz=self.imgsz, verbose=False)
+        
+        # Las cajas vienen en coordenadas del letterbox: se devuelven al frame
+        r = results[0]
+        datos = r.boxes.data.clone()
+        datos[:, :4] = ops.scale_boxes(tensor.shape[2:], datos[:, :4], frame.shape)
+        r.orig_img = frame
+        r.orig_shape = frame.shape[:2]
+        r.update(boxes=datos)
+        return results
+
+    def _inferir_directo(self, modelo, tensor, frame, conf):
+        """
+        Inferencia sin el wrapper predict(): AutoBackend + NMS a mano.
+        
+        Se usa el backend que predict() ya construyó en el warm-up, así que
+        cubre .pt y engines TensorRT por igual. Devuelve una lista con un
+        Results equivalente al de predict().
+        """
+        from ultralytics.engine.results import Results
+        from ultralytics.utils import ops
+        
+        with self._inference_mode():
+            preds = modelo.predictor.model(tensor)
+            dets = ops.non_max_suppression(preds, conf, self.iou, max_det=self.max_det)[0]
+        dets[:, :4] = ops.scale_boxes(tensor.shape[2:], dets[:, :4], frame.shape)
+        return [Results(frame, path='', names=modelo.names, boxes=dets)]
+
+    def _extraer_cajas(self, results, ids_interes=None):
+        """
+        Copia las cajas a host en una sola transferencia.
+        
+        Args:
+            results: Salida de predict()
+            ids_interes: Si se da (tensor de ids), se filtra en el
+                dispositivo y solo se copian esas cajas
+        
+        Returns:
+            (xyxy (N,4), confianzas (N,), ids de clase (N,) int32)
+        """
+        datos = results[0].boxes.data                 # (N,6): x1,y1,x2,y2,conf,cls
+        if ids_interes is not None and datos.shape[0]:
+            datos = datos[self._isin(datos[:, 5], ids_interes)]
+        datos = datos.cpu().numpy()
+        return datos[:, :4], datos[:, 4], datos[:, 5].astype(np.int32)
+
+    def _anotacion(self, results, frame) -> AnotacionDiferida:
+        """Envuelve el resultado para dibujarlo solo si la UI lo consume."""
+        if self.render_overlays:
+            return AnotacionDiferida(results[0].plot)
+        return AnotacionDiferida(imagen=frame)
+
+    def _aviso_sobre_frame(self, frame, texto, org, escala, grosor) -> AnotacionDiferida:
+        """
+        Aviso en rojo sobre una copia del frame, dibujado solo si la UI lo pide.
+        
+        La copia va a un buffer reutilizado (np.copyto) en vez de
+        frame.copy(); se pisa en la siguiente llamada, así que la imagen vale
+        hasta el próximo ciclo.
+        """
+        def dibujar():
+            if self._buffer_aviso is None or self._buffer_aviso.shape != frame.shape:
+                self._buffer_aviso = np.empty_like(frame)
+            np.copyto(self._buffer_aviso, frame)
+            cv2.putText(self._buffer_aviso, texto, org, cv2.FONT_HERSHEY_SIMPLEX, escala, (0, 0, 255), grosor)
+            return self._buffer_aviso
+        return AnotacionDiferida(dibujar)
+
+    def _calentar_modelos(self):
+        """
+        Ejecuta una inferencia de prueba por modelo para que la
+        inicialización de CUDA/cuDNN no caiga en el primer ciclo real.
+        """
+        frame_vacio = np.zeros((640, 640, 3), dtype=np.uint8)
+        for modelo, half in ((self.modelo_sup, self.half_sup), (self.modelo_lat, self.half_lat)):
+            try:
+                self._predecir(modelo, half, frame_vacio, 0.25)
+            except Exception as e:
+                self._log(f"⚠️ Warm-up de modelo fallido: {e}", 'warning')
+
+    def cerrar(self):
+        """Libera el hilo de inferencia lateral."""
+        if self._executor_lat:
+            self._executor_lat.shutdown(wait=True)
+            self._executor_lat = None
+
     def calibrar_y(self, frame_calibracion):
         """
         (Lógica de 'calcular_centros_ideales')
@@ -104,36 +484,32 @@ class VisionProcessor:
             return
             
         try:
-            results = self.modelo_sup.predict(source=frame_calibracion, conf=0.1, verbose=False) # Confianza baja para calibrar
+            results = self._predecir(self.modelo_sup, self.half_sup, frame_calibracion, 0.1, 'sup') # Confianza baja para calibrar
             
-            centros_x_detectados = []
-            
-            for box in results[0].boxes:
-                cls_name = self.modelo_sup.names.get(int(box.cls.item()))
-                if cls_name == self.CLASE_POSICION or cls_name == self.CLASE_VACIO:
-                    x_center = int((box.xyxy[0][0].item() + box.xyxy[0][2].item()) / 2)
-                    centros_x_detectados.append(x_center)
+            xyxy, _, cls_ids = self._extraer_cajas(results)
+            mask_col = (cls_ids == self.ID_POSICION) | (cls_ids == self.ID_VACIO)
+            centros_x_detectados = ((xyxy[mask_col, 0] + xyxy[mask_col, 2]) * 0.5).astype(np.int32)
                     
-            if len(centros_x_detectados) < 2:
-                self._log(f"⚠️ Calibración Y Fallida: Se necesitan al menos 2 columnas (detectadas: {len(centros_x_detectados)}).", 'warning')
+            if centros_x_detectados.size < 2:
+                self._log(f"⚠️ Calibración Y Fallida: Se necesitan al menos 2 columnas (detectadas: {centros_x_detectados.size}).", 'warning')
                 self.X_CENTROS_IDEALES = {}
+                self._xi_sorted = self._xi_nums = np.empty(0, dtype=np.int32)
                 self.calibrado_y = False
                 return
 
             centros_x_detectados.sort()
-            deltas = [centros_x_detectados[i+1] - centros_x_detectados[i] 
-                      for i in range(len(centros_x_detectados) - 1)]
-            
-            distancia_ideal_px = sum(deltas) / len(deltas)
-            primer_centro_ideal = centros_x_detectados[0] 
+            distancia_ideal_px = np.diff(centros_x_detectados).mean().item()
+            primer_centro_ideal = centros_x_detectados.item(0)
             
-            self.X_CENTROS_IDEALES = {}
-            for i in range(self.TOTAL_POSICIONES):
-                self.X_CENTROS_IDEALES[i + 1] = int(primer_centro_ideal + i * distancia_ideal_px)
+            self._xi_nums = np.arange(1, self.TOTAL_POSICIONES + 1, dtype=np.int32)
+            self._xi_sorted = (primer_centro_ideal
+                               + np.arange(self.TOTAL_POSICIONES) * distancia_ideal_px).astype(np.int32)
+            self.X_CENTROS_IDEALES = dict(zip(self._xi_nums.tolist(), self._xi_sorted.tolist()))
                 
             self.calibrado_y = True
             self._log(f"✅ Calibración Y Exitosa: Distancia promedio: {distancia_ideal_px:.2f} px")
-            self._log(f"   Centros Ideales generados: {self.X_CENTROS_IDEALES}")
+            if self._log_activo('info'):
+                self._log(f"   Centros Ideales generados: {self.X_CENTROS_IDEALES}")
 
         except Exception as e:
             self._log(f"❌ Error durante calibración de centros Y: {e}", 'error')
@@ -144,27 +520,66 @@ class VisionProcessor:
         (Lógica de 'calcular_correccion_z')
         Calcula la corrección de altura (Eje Z) en centésimas de milímetro (cMM).
         """
-        delta_p_escala = abs(y_borde - y_mitad) 
-        
-        if delta_p_escala == 0 or self.D_REAL_MM == 0:
-            return 0, "No se pudo calcular la escala Z (Etiquetas 'borde' y 'mitad' colapsaron)."
-            
-        factor_escala_px_mm = delta_p_escala / self.D_REAL_MM
-        delta_p_bruto = y_borde - y_referencia
-        delta_p_error = delta_p_bruto - self.OFFSET_CERO_PX
-        
         # cMM = (error_px / (px/mm)) * 10
-        correccion_cmm = (delta_p_error / factor_escala_px_mm) * 10 
+        correccion_cmm, error = correccion_z(
+            y_referencia, y_borde, y_mitad,
+            float(self.D_REAL_MM), float(self.OFFSET_CERO_PX)
+        )
+        if error:
+            return 0, "No se pudo calcular la escala Z (Etiquetas 'borde' y 'mitad' colapsaron)."
         
-        return int(round(correccion_cmm)), None
+        return correccion_cmm, None
+
+    def _inferencia_lateral_dedup(self, frame_lat):
+        """
+        _ejecutar_inferencia_lateral con reutilización del último resultado
+        cuando el frame lateral casi no cambió (cinta detenida / video
+        pausado). Compara contra la miniatura del último frame inferido, no
+        contra la anterior, así un cambio lento se acumula y termina
+        disparando la inferencia.
+        """
+        if not self.dedup_lateral:
+            return self._ejecutar_inferencia_lateral(frame_lat)
+        
+        ahora = time.monotonic()
+        # Reducir antes de convertir a gris: menos píxeles que convertir
+        miniatura = cv2.cvtColor(
+            cv2.resize(frame_lat, (32, 32), interpolation=cv2.INTER_AREA),
+            cv2.COLOR_BGR2GRAY
+        )
+        if (self._resultado_lat is not None
+                and ahora - self._t_resultado_lat < self.dedup_lateral_ttl_s
+                and cv2.absdiff(miniatura, self._miniatura_lat).mean() < self.dedup_lateral_umbral):
+            return self._resultado_lat
+        
+        resultado = self._ejecutar_inferencia_lateral(frame_lat)
+        self._miniatura_lat = miniatura
+        self._resultado_lat = resultado
+        self._t_resultado_lat = ahora
+        return resultado
 
     def _ejecutar_inferencia_lateral(self, frame_lat):
         """
         (Lógica de 'ejecutar_inferencia_lateral')
         Ejecuta inferencia en la cámara lateral (SEGURIDAD Y CORRECCIÓN Z).
         """
-        results = self.modelo_lat.predict(source=frame_lat, conf=self.conf_lat, verbose=False) 
-        annotated_lat = results[0].plot()
+        results = self._predecir(self.modelo_lat, self.half_lat, frame_lat, self.conf_lat, 'lat')
+        
+        # --- BÚSQUEDA DE ANOMALÍAS ---
+        # Cortan antes de tocar coordenadas y sin preparar la anotación;
+        # procesar_frames_dual pone el frame original en su lugar
+        datos = results[0].boxes.data
+        if self._ids_interes_lat.device != datos.device or self._ids_interes_lat.dtype != datos.dtype:
+            self._ids_interes_lat = self._ids_interes_lat.to(datos.device, datos.dtype)
+        xyxy, conf, cls_ids = self._extraer_cajas(results, self._ids_interes_lat)
+        
+        mask_anomalia = np.isin(cls_ids, self._ids_anom_lat)
+        if mask_anomalia.any():
+            cls_name = self.modelo_lat.names[cls_ids.item(mask_anomalia.argmax())]
+            self._log(f"🚨 Anomalía Lateral Crítica: {cls_name} detectada.", 'warning')
+            return self.CODIGO_PARADA, None, 0, f"PARADA CRÍTICA: {cls_name}"
+        
+        annotated_lat = self._anotacion(results, frame_lat)
         
         response_code = self.CODIGO_OK
         correccion_z_cmm = 0 
@@ -172,52 +587,62 @@ class VisionProcessor:
         log_z_ref = ""
         
         y_coords = {self.CLASE_REFERENCIA: None, self.CLASE_BORDE_ENV: None, self.CLASE_MITAD_ENV: None}
+        ids_z = ((self.CLASE_REFERENCIA, self.ID_REF), (self.CLASE_BORDE_ENV, self.ID_BORDE),
+                 (self.CLASE_MITAD_ENV, self.ID_MITAD))
         y_center_ref_fallback = frame_lat.shape[0] // 2
         
-        # --- BÚSQUEDA DE DETECCIONES Y ANOMALÍAS ---
-        for box in results[0].boxes:
-            cls_name = self.modelo_lat.names.get(int(box.cls.item()))
-            
-            if cls_name in y_coords:
-                y_center = int((box.xyxy[0][1].item() + box.xyxy[0][3].item()) / 2)
-                # Tomar la detección con mayor confianza si hay múltiples
-                if y_coords[cls_name] is None:
-                     y_coords[cls_name] = y_center
-                # (Se podría mejorar guardando la 'conf' y tomando el más alto)
-                
-            if cls_name in self.CLASES_ANOMALIA_LATERAL:
-                self._log(f"🚨 Anomalía Lateral Crítica: {cls_name} detectada.", 'warning')
-                response_code = self.CODIGO_PARADA
-                log_z = f"PARADA CRÍTICA: {cls_name}"
-                break 
+        # --- BÚSQUEDA DE DETECCIONES Z ---
+        # Detección de mayor confianza por clase en una sola pasada:
+        # orden por (clase, -conf) y se toma la primera de cada grupo
+        want = np.isin(cls_ids, self._ids_z)
+        if want.any():
+            c, p = cls_ids[want], conf[want]
+            yc = ((xyxy[want, 1] + xyxy[want, 3]) * 0.5).astype(np.int32)
+            orden = np.lexsort((-p, c))   # estable: en empate gana la primera caja
+            c_s, yc_s = c[orden], yc[orden]
+            primeros = np.concatenate(([0], np.flatnonzero(np.diff(c_s)) + 1))
+            picks = dict(zip(c_s[primeros].tolist(), yc_s[primeros].tolist()))
+            for clase, cls_id in ids_z:
+                y_coords[clase] = picks.get(cls_id)
             
         # --- CÁLCULO DE CORRECCIÓN Z ---
-        if response_code != self.CODIGO_PARADA:
-            if y_coords[self.CLASE_REFERENCIA] is None:
-                 y_coords[self.CLASE_REFERENCIA] = y_center_ref_fallback
-                 log_z_ref = "Usando centro imagen (Fallback Z)."
-
-            if all(y_coords.values()):
-                correccion_z_cmm, log_error = self._calcular_correccion_z(
-                    y_coords[self.CLASE_REFERENCIA], 
-                    y_coords[self.CLASE_BORDE_ENV], 
-                    y_coords[self.CLASE_MITAD_ENV]
-                )
-                if log_error:
-                    log_z = log_error
-                    correccion_z_cmm = 0
-                else:
-                    log_z = f"Cálculo Z exitoso."
+        if y_coords[self.CLASE_REFERENCIA] is None:
+             y_coords[self.CLASE_REFERENCIA] = y_center_ref_fallback
+             log_z_ref = "Usando centro imagen (Fallback Z)."
+
+        if all(y_coords.values()):
+            correccion_z_cmm, log_error = self._calcular_correccion_z(
+                y_coords[self.CLASE_REFERENCIA], 
+                y_coords[self.CLASE_BORDE_ENV], 
+                y_coords[self.CLASE_MITAD_ENV]
+            )
+            if log_error:
+                log_z = log_error
+                correccion_z_cmm = 0
             else:
-                # Loguear qué etiquetas faltaron
-                faltantes = [k for k,v in y_coords.items() if v is None]
-                log_z = f"Advertencia: Faltan etiquetas Z: {', '.join(faltantes)} (Z=0)."
-                self._log(log_z, 'warning')
-        
+                log_z = f"Cálculo Z exitoso."
+        else:
+            # Loguear qué etiquetas faltaron
+            faltantes = [k for k,v in y_coords.items() if v is None]
+            log_z = f"Advertencia: Faltan etiquetas Z: {', '.join(faltantes)} (Z=0)."
+            self._log(log_z, 'warning')
+    
         log_final = log_z + (f" ({log_z_ref})" if log_z_ref else "")
         
         return response_code, annotated_lat, correccion_z_cmm, log_final
 
+    def _columna_mas_cercana(self, x):
+        """
+        Columna ideal más cercana a x (ver _vision_jit.columna_mas_cercana).
+        
+        Returns:
+            (número de columna o None, distancia en px)
+        """
+        num_col, dist = columna_mas_cercana(x, self._xi_sorted, self._xi_nums)
+        if num_col < 0:
+            return None, float('inf')
+        return int(num_col), int(dist)
+
     def _ejecutar_inferencia_superior(self, frame_sup):
         """
         (Lógica de 'ejecutar_inferencia_superior')
@@ -226,54 +651,34 @@ class VisionProcessor:
         if not self.calibrado_y:
             self._log("Error: Inferencia superior llamada sin calibración Y.", 'error')
             # Retorna un fallo si no está calibrado
-            annotated_sup = frame_sup.copy() # Devuelve frame original
-            cv2.putText(annotated_sup, "ERROR: NO CALIBRADO", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 3)
+            annotated_sup = self._aviso_sobre_frame(frame_sup, "ERROR: NO CALIBRADO", (50, 50), 1, 3)
             return self.CODIGO_FALLO_QC, annotated_sup, 0, 0
             
-        results = self.modelo_sup.predict(source=frame_sup, conf=self.conf_sup, verbose=False)
-        annotated_sup = results[0].plot()
+        results = self._predecir(self.modelo_sup, self.half_sup, frame_sup, self.conf_sup, 'sup')
+        annotated_sup = self._anotacion(results, frame_sup)
         
         has_qc_error = False
-        detecciones_por_posicion = {} 
         
-        for box in results[0].boxes:
-            cls_name = self.modelo_sup.names.get(int(box.cls.item()))
-            x_center = int((box.xyxy[0][0].item() + box.xyxy[0][2].item()) / 2)
-
-            if cls_name in self.CLASES_FALLO_SUPERIOR:
-                has_qc_error = True
-                
-            if cls_name == self.CLASE_VACIO:
-                detecciones_por_posicion[x_center] = 'VACIO'
-            elif cls_name == self.CLASE_POSICION:
-                if x_center not in detecciones_por_posicion:
-                    detecciones_por_posicion[x_center] = 'PRODUCTO'
+        xyxy, _, cls_ids = self._extraer_cajas(results)
+        x_centers = ((xyxy[:, 0] + xyxy[:, 2]) * 0.5).astype(np.int32)
         
-        # --- CÁLCULO DE CONTEO Y COLUMNA DE TRABAJO ---
-        conteo_filas_restantes = 0
-        posicion_x_trabajo = None 
+        if np.isin(cls_ids, self._ids_fallo_sup).any():
+            has_qc_error = True
         
-        posiciones_ordenadas = sorted(detecciones_por_posicion.keys())
-
-        for x_pos in posiciones_ordenadas:
-            estado = detecciones_por_posicion[x_pos]
-            if estado == 'PRODUCTO':
-                conteo_filas_restantes += 1
-                if posicion_x_trabajo is None:
-                    posicion_x_trabajo = x_pos
+        # --- CÁLCULO DE CONTEO Y COLUMNA DE TRABAJO ---
+        # Una X con algún 'VACIO' queda vacía aunque también tenga
+        # 'posicion_columna'; el resto de X con producto son filas restantes.
+        # setdiff1d devuelve las X únicas y ordenadas.
+        x_producto = np.setdiff1d(x_centers[cls_ids == self.ID_POSICION],
+                                  x_centers[cls_ids == self.ID_VACIO])
+        conteo_filas_restantes = x_producto.size
+        posicion_x_trabajo = x_producto.item(0) if x_producto.size else None
                     
         # --- CORRECCIÓN Y DINÁMICA ---
         correccion_y_pixels = 0
         
         if posicion_x_trabajo is not None:
-            columna_actual_num = None
-            min_dist = float('inf')
-            
-            for num_col, x_ideal in self.X_CENTROS_IDEALES.items():
-                dist = abs(posicion_x_trabajo - x_ideal)
-                if dist < min_dist:
-                    min_dist = dist
-                    columna_actual_num = num_col
+            columna_actual_num, min_dist = self._columna_mas_cercana(posicion_x_trabajo)
             
             if columna_actual_num is not None:
                 if min_dist > self.TOLERANCIA_COLUMNA_PX:
@@ -295,22 +700,40 @@ class VisionProcessor:
         """
         Función principal llamada por main.py.
         Ejecuta ambas inferencias y combina los resultados para el PLC.
+        
+        Se procesa un solo par de frames por llamada a propósito: cada
+        solicitud del PLC (D28=99) espera su respuesta antes de emitir la
+        siguiente, así que nunca hay frames pendientes para armar un lote,
+        y los engines TensorRT se exportan con batch estático 1.
         """
         
-        # 1. Inferencia Lateral (Seguridad y Z)
-        resp_lat_code, annotated_lat, correccion_z, log_z = \
-            self._ejecutar_inferencia_lateral(frame_lat)
+        resultado_sup = None
+        
+        if self._executor_lat:
+            # 1+2. Lateral en el hilo dedicado mientras la superior corre aquí;
+            # la GPU queda ocupada con ambos modelos a la vez
+            futuro_lat = self._executor_lat.submit(self._inferencia_lateral_dedup, frame_lat)
+            resultado_sup = self._ejecutar_inferencia_superior(frame_sup)
+            resp_lat_code, annotated_lat, correccion_z, log_z = futuro_lat.result()
+        else:
+            # 1. Inferencia Lateral (Seguridad y Z)
+            resp_lat_code, annotated_lat, correccion_z, log_z = \
+                self._inferencia_lateral_dedup(frame_lat)
+        
+        if annotated_lat is None:
+            # Parada lateral: no se dibujó nada, se muestra el frame tal cual
+            annotated_lat = AnotacionDiferida(imagen=frame_lat)
             
         # 2. Inferencia Superior (QC, Y, Conteo)
-        # Solo se ejecuta si la lateral NO detectó una parada crítica
+        # Solo cuenta si la lateral NO detectó una parada crítica
         if resp_lat_code != self.CODIGO_PARADA:
-            resp_sup_code, annotated_sup, conteo, correccion_y_px = \
-                self._ejecutar_inferencia_superior(frame_sup)
+            if resultado_sup is None:
+                resultado_sup = self._ejecutar_inferencia_superior(frame_sup)
+            resp_sup_code, annotated_sup, conteo, correccion_y_px = resultado_sup
         else:
             # Si hay parada, no ejecutes la superior
             resp_sup_code = self.CODIGO_OK # No es un fallo de QC, es una parada
-            annotated_sup = frame_sup.copy() # Devuelve el frame original
-            cv2.putText(annotated_sup, "PARADA (LATERAL)", (50, 100), cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 0, 255), 5)
+            annotated_sup = self._aviso_sobre_frame(frame_sup, "PARADA (LATERAL)", (50, 100), 2, 5)
             conteo = 0
             correccion_y_px = 0
 
@@ -358,7 +781,7 @@ class VisionProcessor:
             'correccion_z_cmm': correccion_z,
             'desviacion_y_px': correccion_y_px, # Desviación Y original en píxeles
             'codigo_respuesta_plc': codigo_respuesta_plc, 
-            'annotated_sup': annotated_sup,   
+            'annotated_sup': annotated_sup,   # AnotacionDiferida: usar .get()
             'annotated_lat': annotated_lat,
             'log_z': log_z,
         }
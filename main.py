@@ -6,15 +6,25 @@ Punto de entrada principal del sistema
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import cv2
+import numpy as np
 from PIL import Image, ImageTk
-import json
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Dict, List
 
 # <<< Asumiendo que tus archivos están en estas carpetas >>>
 from core.plc_controller import PLCController
-from core.vision_processor import VisionProcessor
-from utils.logger import setup_logger, log_resultado_procesamiento, log_estado_plc
+from utils.logger import setup_logger, log_resultado_procesamiento
+from utils.config import cargar_json
+from utils.captura import (CapturaEnHilo, abrir_camara, abrir_video, interpolacion_preview,
+                           PIPELINE_GSTREAMER_NVDEC)
+
+
+# Historial del panel de resultados (líneas de texto)
+MAX_LINEAS_RESULTADOS = 2000
+LINEAS_A_RECORTAR = 500
 
 
 class SistemaPLCYOLO:
@@ -34,7 +44,7 @@ class SistemaPLCYOLO:
         # Logger
         # <<< Asegúrate de que la carpeta 'logs' exista >>>
         Path('logs').mkdir(exist_ok=True) 
-        self.logger = setup_logger('SistemaPLC', archivo_log='logs/sistema.log')
+        self.logger = setup_logger('SistemaPLC', archivo_log='logs/sistema.log', asincrono=True)
         self.logger.info("="*70)
         self.logger.info("INICIANDO SISTEMA PLC-YOLO")
         self.logger.info("="*70)
@@ -44,6 +54,14 @@ class SistemaPLCYOLO:
         Path('config').mkdir(exist_ok=True) 
         self.config = self._cargar_configuracion()
         
+        # Valores de 'sistema' resueltos una vez (el loop no toca el dict)
+        self._cfg_sistema = self.config.get('sistema', {})
+        self._delay_post_s = float(self._cfg_sistema.get('delay_post_proceso_ms', 500)) / 1000.0
+        self._umbral_movimiento = float(self._cfg_sistema.get('umbral_movimiento', 3.0))
+        # Un lote incompleto se infiere igual pasado este tiempo (simulación)
+        self._espera_max_lote_s = float(
+            self.config.get('vision', {}).get('espera_max_lote_ms', 30)) / 1000.0
+        
         # Componentes del sistema
         self.controlador_plc = None
         self.vision_processor = None
@@ -51,22 +69,73 @@ class SistemaPLCYOLO:
         
         # Estado del sistema
         self.modo_realtime_activo = False
-        self.modo_simulacion = self.config.get('sistema', {}).get('modo_simulacion', True) # <<< Lectura más segura >>>
+        self.modo_simulacion = self._cfg_sistema.get('modo_simulacion', True) # <<< Lectura más segura >>>
         self.video_cap = None
         self.frame_actual = None
+        self.captura = None  # Hilo lector de frames (ver _iniciar_captura)
+        self.frame_buffer = []  # Lote pendiente en modo simulación
+        self._t_inicio_lote = 0.0  # perf_counter del primer frame del lote
+        self._miniatura_previa = None  # Último frame procesado, 64x64 gris
+        
+        # Refresco del canvas acotado a `fps_display`, sin importar el FPS
+        # del video ni el de la inferencia (0 = mostrar cada frame)
+        fps_display = self._cfg_sistema.get('fps_display', 30)
+        self._periodo_display_s = 1.0 / fps_display if fps_display else 0.0
+        self._t_ultimo_display = 0.0
+        self._ui_visible = True  # False con la ventana minimizada o tapada
+        
+        # Escritura de resultados al PLC fuera del hilo de Tk
+        self.plc_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='plc-io')
+        self.escritura_pendiente = None
+        # La lectura de D28 también va al worker de I/O (ver _solicitud_plc)
+        self.lectura_pendiente = None
+        self._proxima_lectura = 0.0  # perf_counter de la próxima lectura de D28
+        
+        # YOLO + post-proceso fuera del hilo de Tk. Un solo worker: el
+        # predictor de Ultralytics no es thread-safe, y con un hilo intra-op
+        # por worker Torch no sobresuscribe la CPU
+        self.inferencia_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='yolo-inf')
+        self.inferencia_pendiente = None
+        self._proxima_inferencia = 0.0  # perf_counter desde el que se acepta otra solicitud
+        self._t_captura_actual = None  # perf_counter de lectura de frame_actual
+        self._t_captura_inferencia = None  # ... del frame más viejo en inferencia
         
         # UI
         self._crear_interfaz()
         self._actualizar_estado_ui()
         
+        # torch/ultralytics se importan en segundo plano con la UI ya armada
+        # (ver _precargar_vision); _cargar_modelo espera a este evento
+        self._clase_vision = None
+        self._error_precarga = None
+        self._vision_lista = threading.Event()
+        # Carga de modelo en el hilo de inferencia (ver _cargar_modelo)
+        self.carga_modelo_pendiente = None
+        self._aviso_carga = None  # Texto de avance que deja el worker para Tk
+        threading.Thread(target=self._precargar_vision, name='precarga-vision', daemon=True).start()
+        
         self.logger.info("✅ Sistema inicializado correctamente")
     
+    def _precargar_vision(self):
+        """Importa torch + VisionProcessor (ultralytics) fuera del hilo de Tk"""
+        try:
+            import torch
+            hilos_torch = self._cfg_sistema.get('torch_num_threads', 1)
+            if hilos_torch:
+                torch.set_num_threads(hilos_torch)
+            from core.vision_processor import VisionProcessor
+            self._clase_vision = VisionProcessor
+            self.logger.info("✅ Librerías de visión precargadas")
+        except ImportError as e:
+            self._error_precarga = e
+        finally:
+            self._vision_lista.set()
+    
     def _cargar_configuracion(self):
         """Carga configuración desde JSON"""
         config_path = 'config/plc_config.json'
         try:
-            with open(config_path, 'r') as f:
-                config = json.load(f)
+            config = cargar_json(config_path)
             self.logger.info(f"✅ Configuración cargada desde {config_path}")
             return config
         except FileNotFoundError:
@@ -127,8 +196,13 @@ class SistemaPLCYOLO:
         ttk.Label(panel_controles, text="Fuente de Video", font=('Arial', 12, 'bold')).pack(anchor=tk.W)
         
         # <<< CAMBIO: Botón y comando actualizados >>>
-        ttk.Button(panel_controles, text="📁 Cargar Video", 
-                  command=self._cargar_video).pack(fill=tk.X, pady=5)
+        self.btn_cargar_video = ttk.Button(panel_controles, text="📁 Cargar Video", 
+                  command=self._cargar_video)
+        self.btn_cargar_video.pack(fill=tk.X, pady=5)
+        
+        self.btn_usar_camara = ttk.Button(panel_controles, text="📷 Usar Cámara", 
+                  command=self._usar_camara)
+        self.btn_usar_camara.pack(fill=tk.X, pady=5)
         
         self.camara_status_var = tk.StringVar(value="Sin video") # <<< CAMBIO: Texto actualizado >>>
         ttk.Label(panel_controles, textvariable=self.camara_status_var).pack(anchor=tk.W, pady=5)
@@ -159,6 +233,22 @@ class SistemaPLCYOLO:
         self.canvas_video = tk.Canvas(panel_video, width=640, height=480, bg='black')
         self.canvas_video.pack(fill=tk.BOTH, expand=True) # <<< CAMBIO: Permitir que se expanda >>>
         
+        # Un solo PhotoImage e item de canvas: cada frame se pega encima
+        # (ver _pintar_en_canvas); se recrean solo si cambia el tamaño
+        self._photo = ImageTk.PhotoImage(image=Image.new('RGB', (640, 480)))
+        self._canvas_item = self.canvas_video.create_image(0, 0, anchor=tk.NW, image=self._photo)
+        
+        # Tamaño del canvas cacheado: se actualiza en <Configure>, así
+        # mostrar un frame no consulta winfo_* a Tcl
+        self._tamano_canvas = (640, 480)
+        self._bgr_display = None  # Buffers de _mostrar_frame (sin lector en hilo)
+        self._rgb_display = None
+        self.canvas_video.bind('<Configure>', self._on_canvas_resize)
+        
+        # Minimizada o tapada: no se dibuja video (ver _on_visibilidad)
+        for evento in ('<Map>', '<Unmap>', '<Visibility>'):
+            self.root.bind(evento, self._on_visibilidad, add='+')
+        
         # ==================== PANEL DERECHO (Resultados) ====================
         panel_resultados = ttk.LabelFrame(self.root, text="Últimos Resultados", padding=10)
         panel_resultados.pack(side=tk.RIGHT, fill=tk.Y, padx=10, pady=10)
@@ -205,34 +295,100 @@ class SistemaPLCYOLO:
         """Carga modelo YOLO"""
         archivo = filedialog.askopenfilename(
             title="Seleccionar modelo YOLO",
-            filetypes=[("Modelos YOLO", "*.pt"), ("Todos", "*.*")]
+            filetypes=[("Modelos YOLO", "*.pt *.engine"), ("Todos", "*.*")]
         )
         
-        if archivo:
-            try:
-                # <<< CAMBIO: Intenta importar YOLO aquí >>>
-                from ultralytics import YOLO
-                self.logger.info(f"Cargando modelo desde: {archivo}...")
-                self.status_var.set("Cargando modelo...")
-                self.root.update() # Forzar actualización de UI
-                
-                self.modelo_yolo = YOLO(archivo)
-                
-                # Crear processor
-                self.vision_processor = VisionProcessor(self.config)
-                self.vision_processor.modelo = self.modelo_yolo
-                
-                self.modelo_status_var.set(f"✅ {Path(archivo).name}")
-                self._actualizar_estado_ui()
-                self.logger.info(f"✅ Modelo cargado: {archivo}")
-                self.status_var.set("Modelo cargado")
-            except ImportError:
-                messagebox.showerror("Error", "Librería 'ultralytics' no encontrada. Instálala con 'pip install ultralytics'")
-                self.logger.error("❌ Error: Librería 'ultralytics' no encontrada.")
-            except Exception as e:
-                messagebox.showerror("Error", f"No se pudo cargar el modelo: {e}")
-                self.logger.error(f"❌ Error cargando modelo: {e}")
-                self.status_var.set("Error al cargar modelo")
+        if archivo and self.modo_realtime_activo:
+            # La carga ya no congela la UI: sin esto una solicitud del PLC
+            # llegaría al loop sin modelo
+            messagebox.showwarning("Aviso", "Detén el sistema antes de cambiar el modelo.")
+            return
+        if archivo and self.carga_modelo_pendiente is None:
+            self.logger.info(f"Cargando modelo desde: {archivo}...")
+            self.status_var.set("Cargando modelo...")
+            self.modelo_status_var.set("📦 Cargando modelo...")
+            
+            # El modelo queda "listo" (y se habilita Iniciar) recién cuando
+            # terminan la carga y el warm-up
+            self.modelo_yolo = None
+            self._actualizar_estado_ui()
+            self._aviso_carga = None
+            
+            # El processor anterior se cierra en el hilo de inferencia,
+            # después de cualquier inferencia suya que siga en vuelo
+            if self.vision_processor:
+                self.inferencia_executor.submit(self.vision_processor.cerrar)
+                self.vision_processor = None
+            
+            # Carga (la primera exportación TensorRT tarda minutos) y warm-up
+            # en el hilo de inferencia; Tk sigue atendiendo eventos
+            self.carga_modelo_pendiente = self.inferencia_executor.submit(
+                self._cargar_y_calentar, archivo
+            )
+            self._esperar_calentamiento(self.carga_modelo_pendiente, archivo)
+    
+    def _cargar_y_calentar(self, archivo):
+        """
+        Crea el VisionProcessor, carga el modelo y lo calienta (hilo
+        'yolo-inf', sin Tk)
+        
+        Returns:
+            VisionProcessor con el modelo cargado
+        """
+        # Esperar la precarga de torch/ultralytics (suele estar lista)
+        self._vision_lista.wait()
+        if self._error_precarga:
+            raise self._error_precarga
+        
+        # Crear processor (exporta/carga engine TensorRT FP16 si es posible)
+        vision_processor = self._clase_vision(self.config)
+        if not vision_processor.cargar_modelo(archivo, self._notificar_carga_modelo):
+            vision_processor.cerrar()
+            raise RuntimeError(f"VisionProcessor no pudo cargar {archivo}")
+        
+        self._aviso_carga = "🔥 Calentando modelo..."
+        try:
+            vision_processor.calentar()
+        except Exception as e:
+            self.logger.warning(f"⚠️ Warm-up del modelo fallido: {e}")
+        return vision_processor
+    
+    def _esperar_calentamiento(self, futuro, archivo):
+        """Revisa la carga en segundo plano; al terminar marca el modelo como listo"""
+        if self._aviso_carga is not None:
+            self.modelo_status_var.set(self._aviso_carga)
+            self._aviso_carga = None
+        if not futuro.done():
+            self.root.after(50, self._esperar_calentamiento, futuro, archivo)
+            return
+        self.carga_modelo_pendiente = None
+        
+        try:
+            self.vision_processor = futuro.result()
+        except ImportError:
+            messagebox.showerror("Error", "Librería 'ultralytics' no encontrada. Instálala con 'pip install ultralytics'")
+            self.logger.error("❌ Error: Librería 'ultralytics' no encontrada.")
+            self.modelo_status_var.set("Sin modelo")
+            return
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudo cargar el modelo: {e}")
+            self.logger.error(f"❌ Error cargando modelo: {e}")
+            self.status_var.set("Error al cargar modelo")
+            self.modelo_status_var.set("Sin modelo")
+            return
+        
+        self.modelo_yolo = self.vision_processor.modelo
+        self.modelo_status_var.set(f"✅ {Path(archivo).name}")
+        self._actualizar_estado_ui()
+        self.logger.info(f"✅ Modelo cargado: {archivo}")
+        self.status_var.set("Modelo cargado")
+    
+    def _notificar_carga_modelo(self, texto):
+        """
+        Avance de la carga (p. ej. la exportación TensorRT). Se llama desde
+        el worker: solo deja el texto, _esperar_calentamiento lo muestra
+        """
+        self._aviso_carga = texto
     
     # <<< CAMBIO: Función reemplazada de _abrir_camara a _cargar_video >>>
     def _cargar_video(self):
@@ -248,16 +404,21 @@ class SistemaPLCYOLO:
                 if self.video_cap:
                     self.video_cap.release()
                     
-                self.video_cap = cv2.VideoCapture(archivo)
+                self.video_cap, backend = self._abrir_video(archivo)
                 
                 if self.video_cap.isOpened():
                     # Obtener info del video
                     fps = self.video_cap.get(cv2.CAP_PROP_FPS)
                     frames = self.video_cap.get(cv2.CAP_PROP_FRAME_COUNT)
-                    self.camara_status_var.set(f"✅ {Path(archivo).name} ({int(fps)} FPS)")
+                    self.camara_status_var.set(f"✅ {Path(archivo).name} ({int(fps)} FPS, {backend})")
                     self._actualizar_estado_ui()
                     self.logger.info(f"✅ Video cargado: {archivo} ({int(frames)} frames @ {int(fps)} FPS)")
                     
+                    # Precalcular referencia X para el ancho de esta fuente
+                    if self.vision_processor:
+                        ancho = int(self.video_cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                        self.vision_processor.ajustar_referencia(ancho)
+                    
                     # Mostrar primer frame
                     ret, frame = self.video_cap.read()
                     if ret:
@@ -272,6 +433,47 @@ class SistemaPLCYOLO:
                 messagebox.showerror("Error", f"Error cargando video: {e}")
                 self.logger.error(f"❌ Error cargando video: {e}")
 
+    def _usar_camara(self):
+        """Abre la cámara local de `sistema.camara_indice` (baja latencia)"""
+        sistema = self._cfg_sistema
+        indice = sistema.get('camara_indice', 0)
+        try:
+            if self.video_cap:
+                self.video_cap.release()
+            
+            self.video_cap = abrir_camara(
+                indice,
+                sistema.get('camara_ancho'),
+                sistema.get('camara_alto'),
+                sistema.get('camara_fourcc', 'MJPG')
+            )
+            if not self.video_cap.isOpened():
+                messagebox.showerror("Error", f"No se pudo abrir la cámara {indice}")
+                self.logger.error(f"❌ No se pudo abrir la cámara {indice}")
+                return
+            
+            ancho = int(self.video_cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            alto = int(self.video_cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            self.camara_status_var.set(f"✅ Cámara {indice} ({ancho}x{alto})")
+            self._actualizar_estado_ui()
+            self.logger.info(f"✅ Cámara {indice} abierta ({ancho}x{alto})")
+            
+            # Precalcular referencia X para el ancho de esta fuente
+            if self.vision_processor:
+                self.vision_processor.ajustar_referencia(ancho)
+        except Exception as e:
+            messagebox.showerror("Error", f"Error abriendo cámara: {e}")
+            self.logger.error(f"❌ Error abriendo cámara: {e}")
+
+    def _abrir_video(self, archivo):
+        """Abre el video con el backend de `sistema.capture_backend`"""
+        sistema = self._cfg_sistema
+        return abrir_video(
+            archivo,
+            sistema.get('capture_backend', 'ffmpeg'),
+            sistema.get('gstreamer_pipeline', PIPELINE_GSTREAMER_NVDEC)
+        )
+
     def _toggle_simulacion(self):
         """Alterna modo simulación"""
         self.modo_simulacion = self.chk_simulacion_var.get() # <<< CAMBIO: Lee desde la variable >>>
@@ -305,13 +507,24 @@ class SistemaPLCYOLO:
         # Deshabilitar controles mientras corre
         self.btn_conectar_plc.config(state=tk.DISABLED)
         self.chk_simulacion.config(state=tk.DISABLED)
+        # El hilo de captura lee este VideoCapture: no se libera en marcha
+        self._habilitar_carga_video(False)
         
-        # Iniciar loop
+        # Iniciar lector y loop
+        self._iniciar_captura()
         self._loop_principal()
     
     def _detener_sistema(self):
         """Detiene el sistema"""
         self.modo_realtime_activo = False
+        self._detener_captura()
+        self.frame_buffer = []
+        self._miniatura_previa = None
+        # Una inferencia en vuelo termina en el worker; su resultado se descarta
+        self.inferencia_pendiente = None
+        self._proxima_inferencia = 0.0
+        self.lectura_pendiente = None
+        self._proxima_lectura = 0.0
         self.btn_iniciar.config(state=tk.NORMAL)
         self.btn_detener.config(state=tk.DISABLED)
         self.status_var.set("Sistema detenido")
@@ -321,24 +534,112 @@ class SistemaPLCYOLO:
         if not (self.controlador_plc and self.controlador_plc.is_connected):
             self.btn_conectar_plc.config(state=tk.NORMAL)
         self.chk_simulacion.config(state=tk.NORMAL)
+        self._habilitar_carga_video(True)
+    
+    def _habilitar_carga_video(self, habilitar: bool):
+        """Habilita o deshabilita los botones de video y cámara"""
+        estado = tk.NORMAL if habilitar else tk.DISABLED
+        self.btn_cargar_video.config(state=estado)
+        self.btn_usar_camara.config(state=estado)
+    
+    def _iniciar_captura(self):
+        """
+        Lanza la lectura del video en un hilo aparte: la decodificación del
+        frame N+1 se solapa con la inferencia del frame N, que corre en el
+        worker de inferencia (ver _inferir_y_procesar).
+        """
+        sistema = self._cfg_sistema
+        if not sistema.get('captura_en_hilo', True):
+            return
+        self._detener_captura()
+        self.captura = CapturaEnHilo(
+            [self.video_cap], ['principal'],
+            maxsize=sistema.get('tamano_cola_frames', 4),
+            descartar_viejos=sistema.get('descartar_frames_viejos', False),
+            usar_opencl=sistema.get('display_opencl', False),
+            nucleos=sistema.get('nucleos_captura')
+        )
+        # El lector también prepara la imagen RGB al tamaño del canvas
+        self._actualizar_tamano_display()
+        self.captura.iniciar()
+    
+    def _on_canvas_resize(self, event):
+        """Guarda el nuevo tamaño del canvas de video (<Configure>)"""
+        # Evitar tamaños degenerados mientras la ventana se construye
+        if event.width < 10 or event.height < 10:
+            self._tamano_canvas = (640, 480) # Default
+        else:
+            self._tamano_canvas = (event.width, event.height)
+        self._actualizar_tamano_display()
+    
+    def _on_visibilidad(self, event):
+        """Sigue si la ventana está a la vista (<Map>/<Unmap>/<Visibility>)"""
+        if event.widget is not self.root:
+            return  # Los bindings de la raíz también reciben eventos de los hijos
+        if event.type == tk.EventType.Unmap:
+            self._ui_visible = False
+        elif event.type == tk.EventType.Map:
+            self._ui_visible = True
+        else:
+            self._ui_visible = event.state != 'VisibilityFullyObscured'
+    
+    def _actualizar_tamano_display(self):
+        """Informa al lector el tamaño actual del canvas de video"""
+        if self.captura:
+            self.captura.set_tamano_display(*self._tamano_canvas)
+    
+    def _detener_captura(self):
+        """Detiene el hilo lector de frames (si existe)"""
+        if self.captura:
+            self.captura.detener()
+            self.captura = None
     
     def _loop_principal(self):
         """
         Loop principal del sistema - Implementa el handshake PLC
+        
+        Corre en el hilo de Tk y solo coordina; nada en él bloquea:
+        - captura: CapturaEnHilo decodifica y prepara el display en su hilo
+        - inferencia: YOLO + procesar_resultados en `inferencia_executor`
+        - PLC: escrituras en `plc_executor`
+        Cada vuelta toma el último frame, lo muestra, recoge los resultados
+        terminados (_inferencia_en_curso / _escritura_en_curso) y lanza la
+        siguiente inferencia si hay solicitud.
         """
         if not self.modo_realtime_activo:
             self.logger.info("Loop detenido por bandera 'modo_realtime_activo'")
             return
         
-        delay_siguiente = 100  # ms (tiempo de espera entre lecturas de PLC)
-        
         try:
             # 1. Capturar frame
-            if self.video_cap and self.video_cap.isOpened():
+            if self.captura:
+                item = self.captura.obtener(timeout=0, con_display=True)
+                if item is None:
+                    if self.captura.error:
+                        self.logger.error(f"Error en loop: {self.captura.error}")
+                        self._detener_sistema()
+                        messagebox.showerror("Error", "Se perdió la fuente de video.")
+                        return
+                    # El lector todavía no entregó frame
+                    self.root.after(10, self._loop_principal)
+                    return
+                frames, display = item
+                frame = frames[0]
+                if self._toca_display():
+                    if display is not None:
+                        self._mostrar_display(display)
+                    else:
+                        self._mostrar_frame(frame)
+                self.frame_actual = frame  # El lector ya no reutiliza este array
+                self._t_captura_actual = self.captura.t_captura
+            elif self.video_cap and self.video_cap.isOpened():
                 ret, frame = self.video_cap.read()
                 if ret and frame is not None:
-                    self._mostrar_frame(frame)
-                    self.frame_actual = frame.copy()
+                    if self._toca_display():
+                        self._mostrar_frame(frame)
+                    # read() sin `image=` aloca un array nuevo en cada llamada:
+                    # el frame no se pisa mientras lo usa el worker de inferencia
+                    self.frame_actual = frame
                 else:
                     # <<< CAMBIO: Reiniciar video al terminar >>>
                     self.logger.info("Video finalizado, reiniciando...")
@@ -351,121 +652,319 @@ class SistemaPLCYOLO:
                 messagebox.showerror("Error", "Se perdió la fuente de video.")
                 return
 
-            # 2. Consultar PLC (o simular)
+            # 2. Consultar PLC (o simular), salvo con una solicitud en proceso
+            ocupado = (self._inferencia_en_curso()
+                       or time.perf_counter() < self._proxima_inferencia)
             procesar = False
-            if self.modo_simulacion:
-                procesar = True  # En simulación, procesar cada frame
+            if ocupado:
+                pass  # Se sigue mostrando video mientras YOLO trabaja
+            elif self.modo_simulacion:
+                # En simulación, procesar cada frame en el que algo se movió
+                procesar = self._hubo_movimiento(self.frame_actual)
             elif self.controlador_plc and self.controlador_plc.is_connected:
-                procesar = self.controlador_plc.leer_solicitud_inspeccion()
-                log_estado_plc(self.logger, self.controlador_plc, procesar) # <<< Log de estado >>>
+                # D28 sigue en 99 hasta que termine la escritura en curso
+                if not self._escritura_en_curso():
+                    procesar = self._solicitud_plc()
             
             # 3. Procesar si hay solicitud
             if procesar:
-                self.status_var.set("🔄 Procesando solicitud...")
-                self.root.update()
-                
                 # Ejecutar YOLO
                 if not self.vision_processor or not self.modelo_yolo:
                     self.logger.error("Error crítico: VisionProcessor o Modelo no están inicializados.")
                     self._detener_sistema()
                     return
 
-                resultados_yolo = self.modelo_yolo.predict(self.frame_actual, verbose=False)
-                
-                # Procesar con VisionProcessor
-                resultado = self.vision_processor.procesar_resultados(
-                    resultados_yolo,
-                    self.frame_actual.shape[1],  # ancho
-                    self.frame_actual.shape[0]   # alto
-                )
-                
-                # Validar
-                valido, advertencias = self.vision_processor.validar_resultado(resultado)
-                if advertencias:
-                    for adv in advertencias:
-                        self.logger.warning(adv)
-                
-                # Log
-                log_resultado_procesamiento(resultado, self.logger)
-                
-                # Mostrar en UI
-                self._mostrar_resultado(resultado)
-                
-                # Enviar a PLC
-                if not self.modo_simulacion and self.controlador_plc:
-                    exito_escritura = self.controlador_plc.escribir_resultados(
-                        resultado['desviacion_mm'],
-                        resultado['filas'],
-                        resultado['success'] # 'success' ya es booleano
-                    )
-                    if not exito_escritura:
-                        self.logger.error("❌ FALLO AL ESCRIBIR EN PLC")
-                        self.plc_status_var.set("❌ Error Escritura")
-                        self.plc_status_var.config(foreground='red')
-                        # Podrías detener el sistema aquí si la escritura es crítica
-                        # self._detener_sistema() 
-                
-                delay_siguiente = self.config.get('sistema', {}).get('delay_post_proceso_ms', 500) # Esperar más
-            else:
+                if self.modo_simulacion and self.vision_processor.batch_size > 1:
+                    # En simulación no hay handshake: se infiere por lotes
+                    if not self.frame_buffer:
+                        self._t_inicio_lote = time.perf_counter()
+                        self._t_captura_inferencia = self._t_captura_actual
+                    self.frame_buffer.append(self.frame_actual)
+                    self._lanzar_lote_si_corresponde()
+                else:
+                    self._t_captura_inferencia = self._t_captura_actual
+                    self._lanzar_inferencia([self.frame_actual])
+            elif not ocupado:
+                if self.frame_buffer:
+                    # Escena quieta: no llegan frames nuevos al lote
+                    self._lanzar_lote_si_corresponde()
                 if not self.modo_simulacion:
                     self.status_var.set("🟢 Monitoreando PLC (esperando D28=99)")
             
-            # 4. Siguiente iteración
-            self.root.after(delay_siguiente, self._loop_principal)
+            # 4. Siguiente iteración: con lector en hilo manda el ritmo de
+            # frames (after_idle en cuanto haya uno listo); sin él, 100 ms
+            # (el PLC lleva su propio ritmo)
+            if self.captura:
+                if self.captura.frame_listo.is_set():
+                    self.root.after_idle(self._loop_principal)
+                else:
+                    self.root.after(10, self._loop_principal)
+            else:
+                self.root.after(100, self._loop_principal)
             
         except Exception as e:
             self.logger.error(f"❌ Error fatal en loop principal: {e}", exc_info=True) # <<< exc_info=True >>>
             self._detener_sistema()
             messagebox.showerror("Error de Ejecución", f"Error fatal en el sistema: {e}")
     
+    def _hubo_movimiento(self, frame) -> bool:
+        """
+        Detección de cambio barata para simulación: diferencia absoluta
+        media entre miniaturas 64x64 en gris del frame y del último frame
+        procesado. Con `umbral_movimiento` 0 siempre retorna True.
+        """
+        umbral = self._umbral_movimiento
+        if not umbral:
+            return True
+        
+        # Reducir antes de convertir a gris: menos píxeles que convertir
+        miniatura = cv2.cvtColor(
+            cv2.resize(frame, (64, 64), interpolation=cv2.INTER_AREA),
+            cv2.COLOR_BGR2GRAY
+        )
+        previa = self._miniatura_previa
+        if previa is not None and cv2.absdiff(miniatura, previa).mean() < umbral:
+            return False
+        self._miniatura_previa = miniatura
+        return True
+    
+    def _lanzar_lote_si_corresponde(self):
+        """
+        Infiere el lote de simulación si está completo o si su primer
+        frame espera hace más de `espera_max_lote_ms`.
+        """
+        completo = len(self.frame_buffer) >= self.vision_processor.batch_size
+        vencido = time.perf_counter() - self._t_inicio_lote >= self._espera_max_lote_s
+        if completo or vencido:
+            lote, self.frame_buffer = self.frame_buffer, []
+            self._lanzar_inferencia(lote)
+    
+    def _lanzar_inferencia(self, frames: List):
+        """Envía uno o varios frames al worker de inferencia"""
+        self.status_var.set("🔄 Procesando solicitud...")
+        self.inferencia_pendiente = self.inferencia_executor.submit(
+            self._inferir_y_procesar, frames
+        )
+    
+    def _inferir_y_procesar(self, frames: List) -> List[Dict]:
+        """
+        YOLO + procesar_resultados de cada frame (corre en el worker de
+        inferencia; no toca la UI).
+        
+        Returns:
+            Un resultado de VisionProcessor.procesar_resultados por frame
+        """
+        alto, ancho = frames[0].shape[:2]  # Todos los frames vienen del mismo video
+        if len(frames) > 1:
+            return self.vision_processor.procesar_lote(
+                self.vision_processor.inferir_lote(frames), ancho, alto
+            )
+        
+        resultados_yolo = self.vision_processor.inferir(frames[0])
+        return [self.vision_processor.procesar_resultados(resultados_yolo, ancho, alto)]
+    
+    def _inferencia_en_curso(self) -> bool:
+        """
+        Indica si hay una inferencia todavía en el worker.
+        
+        Cuando termina, reporta sus resultados en el hilo de Tk, envía el
+        último al PLC (fuera de simulación) y arranca la espera
+        `delay_post_proceso_ms` antes de aceptar otra solicitud.
+        """
+        if self.inferencia_pendiente is None:
+            return False
+        if not self.inferencia_pendiente.done():
+            return True
+        
+        resultados = self.inferencia_pendiente.result()
+        self.inferencia_pendiente = None
+        if self._t_captura_inferencia is not None:
+            # Antigüedad del dato que recibe el PLC (lectura del frame → resultado)
+            self.logger.debug("Edad del frame al resultado: %.0f ms",
+                              (time.perf_counter() - self._t_captura_inferencia) * 1000.0)
+        for resultado in resultados:
+            self._reportar_resultado(resultado)
+        
+        # Enviar a PLC
+        if not self.modo_simulacion and self.controlador_plc:
+            resultado = resultados[-1]
+            # Se envía en el worker de I/O; el resultado se revisa
+            # en _escritura_en_curso() antes del siguiente polling
+            self.escritura_pendiente = self.plc_executor.submit(
+                self.controlador_plc.escribir_resultados,
+                resultado['desviacion_mm'],
+                resultado['filas'],
+                resultado['success'] # 'success' ya es booleano
+            )
+        
+        self._proxima_inferencia = time.perf_counter() + self._delay_post_s
+        return False
+    
+    def _reportar_resultado(self, resultado: Dict):
+        """Valida un resultado de procesar_resultados, lo loguea y lo muestra en la UI"""
+        # Validar
+        valido, advertencias = self.vision_processor.validar_resultado(resultado)
+        if advertencias:
+            for adv in advertencias:
+                self.logger.warning(adv)
+        
+        # Log
+        log_resultado_procesamiento(resultado, self.logger)
+        
+        # Mostrar en UI
+        self._mostrar_resultado(resultado)
+    
+    def _solicitud_plc(self) -> bool:
+        """
+        Polling de D28 sin bloquear el hilo de Tk.
+        
+        La lectura se envía al worker de I/O y se recoge en una vuelta
+        posterior del loop; entre lecturas se respeta el backoff del
+        controlador (obtener_delay_polling_ms), así el video sigue a su
+        ritmo mientras el PLC solo se consulta cuando corresponde.
+        
+        Returns:
+            True cuando una lectura terminada encontró D28=99
+        """
+        if self.lectura_pendiente is None:
+            if time.perf_counter() >= self._proxima_lectura:
+                self.lectura_pendiente = self.plc_executor.submit(
+                    self.controlador_plc.leer_solicitud_inspeccion
+                )
+            return False
+        if not self.lectura_pendiente.done():
+            return False
+        
+        procesar = self.lectura_pendiente.result()
+        self.lectura_pendiente = None
+        self._proxima_lectura = (time.perf_counter()
+                                 + self.controlador_plc.obtener_delay_polling_ms() / 1000.0)
+        # PLCController ya registra la solicitud detectada (INFO); las
+        # lecturas sin solicitud no se loguean para no escribir 10 líneas/s
+        return procesar
+    
+    def _escritura_en_curso(self) -> bool:
+        """
+        Indica si hay una escritura al PLC todavía en vuelo.
+        
+        Cuando la escritura termina, procesa su resultado en el hilo de Tk
+        (actualiza la UI si falló) y libera el polling.
+        """
+        if self.escritura_pendiente is None:
+            return False
+        if not self.escritura_pendiente.done():
+            return True
+        
+        exito_escritura = self.escritura_pendiente.result()
+        self.escritura_pendiente = None
+        if not exito_escritura:
+            self.logger.error("❌ FALLO AL ESCRIBIR EN PLC")
+            self.plc_status_var.set("❌ Error Escritura")
+            self.plc_status_var.config(foreground='red')
+        return False
+    
+    def _toca_display(self) -> bool:
+        """True si la ventana está a la vista y ya pasó el período de display"""
+        if not self._ui_visible:
+            return False
+        ahora = time.perf_counter()
+        if ahora - self._t_ultimo_display < self._periodo_display_s:
+            return False
+        self._t_ultimo_display = ahora
+        return True
+    
+    def _mostrar_display(self, imagen_rgb):
+        """
+        Muestra una imagen RGB ya redimensionada por el lector.
+        
+        PIL lee directamente el buffer (frombuffer, sin copia); paste()
+        copia los píxeles a Tk, así que el buffer queda libre al volver.
+        """
+        try:
+            alto, ancho = imagen_rgb.shape[:2]
+            self._pintar_en_canvas(
+                Image.frombuffer('RGB', (ancho, alto), imagen_rgb, 'raw', 'RGB', 0, 1)
+            )
+        except Exception as e:
+            self.logger.warning(f"⚠️ Error al mostrar frame: {e}")
+    
     def _mostrar_frame(self, frame):
         """Muestra frame en canvas, redimensionando al tamaño del canvas"""
+        if not self._ui_visible:
+            return
         try:
             # <<< CAMBIO: Redimensionar al tamaño del canvas dinámicamente >>>
-            canvas_width = self.canvas_video.winfo_width()
-            canvas_height = self.canvas_video.winfo_height()
-
-            # Evitar error si el canvas es 0x0 al inicio
-            if canvas_width < 10 or canvas_height < 10:
-                canvas_width, canvas_height = 640, 480 # Default
+            canvas_width, canvas_height = self._tamano_canvas
                 
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            frame_resized = cv2.resize(frame_rgb, (canvas_width, canvas_height))
+            # Reducir y convertir sobre buffers reservados (se recrean solo
+            # si cambia el tamaño del canvas)
+            forma = (canvas_height, canvas_width, 3)
+            if self._rgb_display is None or self._rgb_display.shape != forma:
+                self._bgr_display = np.empty(forma, dtype=np.uint8)
+                self._rgb_display = np.empty(forma, dtype=np.uint8)
+            cv2.resize(frame, (canvas_width, canvas_height), dst=self._bgr_display,
+                       interpolation=interpolacion_preview(frame.shape[1], canvas_width))
+            cv2.cvtColor(self._bgr_display, cv2.COLOR_BGR2RGB, dst=self._rgb_display)
             
-            imagen = Image.fromarray(frame_resized)
-            imagen_tk = ImageTk.PhotoImage(imagen)
-            
-            self.canvas_video.create_image(0, 0, anchor=tk.NW, image=imagen_tk)
-            self.canvas_video.image = imagen_tk  # Mantener referencia
+            self._pintar_en_canvas(Image.frombuffer(
+                'RGB', (canvas_width, canvas_height), self._rgb_display, 'raw', 'RGB', 0, 1
+            ))
         except Exception as e:
             self.logger.warning(f"⚠️ Error al mostrar frame: {e}")
+    
+    def _pintar_en_canvas(self, imagen):
+        """
+        Pega una imagen PIL sobre el PhotoImage persistente del canvas.
+        
+        Si el canvas cambió de tamaño se crea un PhotoImage nuevo y se
+        reasigna al mismo item (itemconfig), sin crear items nuevos.
+        """
+        if (self._photo.width(), self._photo.height()) != imagen.size:
+            self._photo = ImageTk.PhotoImage(image=imagen)
+            self.canvas_video.itemconfig(self._canvas_item, image=self._photo)
+        else:
+            self._photo.paste(imagen)
 
     
     def _mostrar_resultado(self, resultado):
         """Muestra resultado en panel de texto"""
         timestamp = time.strftime("%H:%M:%S")
+        separador = '=' * 40
         
-        texto = f"\n{'='*40}\n"
-        texto += f"[{timestamp}] RESULTADO\n"
-        texto += f"{'='*40}\n"
+        # Una sola concatenación (join) en vez de un += por línea
+        partes = ["", separador, f"[{timestamp}] RESULTADO", separador]
         
         if resultado['success']:
-            texto += f"✅ Estado: ÉXITO\n"
-            texto += f"📊 Filas: {resultado['filas']}\n"
-            texto += f"📏 Desviación: {resultado['desviacion_mm']:.2f} mm\n"
+            partes.append("✅ Estado: ÉXITO")
+            partes.append(f"📊 Filas: {resultado['filas']}")
+            partes.append(f"📏 Desviación: {resultado['desviacion_mm']:.2f} mm")
             
             if 'metadata' in resultado:
                 meta = resultado['metadata']
-                texto += f"\n📈 Metadata:\n"
-                texto += f"  • Total detectado: {meta.get('total_detectado', 'N/A')}\n"
-                texto += f"  • Válidas: {meta.get('detecciones_validas', 'N/A')}\n"
-                texto += f"  • Conf. promedio: {meta.get('confianza_promedio', 0):.2%}\n"
+                partes.append("")
+                partes.append("📈 Metadata:")
+                partes.append(f"  • Total detectado: {meta.get('total_detectado', 'N/A')}")
+                partes.append(f"  • Válidas: {meta.get('detecciones_validas', 'N/A')}")
+                if 'confianza_promedio' in meta:
+                    partes.append(f"  • Conf. promedio: {meta['confianza_promedio']:.2%}")
         else:
-            texto += f"❌ Estado: FALLO\n"
-            texto += f"📋 Razón: {resultado.get('metadata', {}).get('razon_fallo', 'Desconocida')}\n"
+            partes.append("❌ Estado: FALLO")
+            partes.append(f"📋 Razón: {resultado.get('metadata', {}).get('razon_fallo', 'Desconocida')}")
+        partes.append("")
         
         # Insertar al final y hacer scroll
+        self._agregar_texto_resultados("\n".join(partes))
+    
+    def _agregar_texto_resultados(self, texto):
+        """
+        Agrega texto al panel de resultados y recorta el historial: pasadas
+        MAX_LINEAS_RESULTADOS se borran las LINEAS_A_RECORTAR más viejas de
+        una vez (borrado amortizado, memoria y scroll acotados en 24/7).
+        """
         self.text_resultados.insert(tk.END, texto)
+        lineas = int(self.text_resultados.index('end-1c').split('.')[0])
+        if lineas > MAX_LINEAS_RESULTADOS:
+            self.text_resultados.delete('1.0', f'{LINEAS_A_RECORTAR + 1}.0')
         self.text_resultados.see(tk.END)
     
     def cerrar(self):
@@ -477,6 +976,12 @@ class SistemaPLCYOLO:
             self.logger.info("Liberando captura de video...")
             self.video_cap.release()
         
+        # Esperar a que termine la inferencia y cualquier escritura pendiente
+        self.inferencia_executor.shutdown(wait=True)
+        self.plc_executor.shutdown(wait=True)
+        if self.vision_processor:
+            self.vision_processor.cerrar()
+        
         if self.controlador_plc:
             self.logger.info("Desconectando PLC...")
             self.controlador_plc.desconectar()
@@ -4,12 +4,14 @@ Punto de entrada principal del sistema
 *** Versión Modificada para DOS CÁMARAS (Superior y Lateral) ***
 """
 
+import logging
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import cv2
+import numpy as np
 from PIL import Image, ImageTk
-import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # <<< Asumiendo que tus archivos están en estas carpetas >>>
@@ -17,6 +19,13 @@ from core.plc_controller import PLCController
 from core.vision_processor_prueba import VisionProcessor
 # <<< CAMBIO: Importar desde logger_prueba >>>
 from utils.logger_prueba import setup_logger, log_resultado_procesamiento, log_estado_plc
+from utils.config import cargar_json
+from utils.captura import CapturaEnHilo, abrir_video, interpolacion_preview, PIPELINE_GSTREAMER_NVDEC
+
+
+# Historial del panel de resultados (líneas de texto)
+MAX_LINEAS_RESULTADOS = 2000
+LINEAS_A_RECORTAR = 500
 
 
 class SistemaPLCYOLO:
@@ -37,7 +46,10 @@ class SistemaPLCYOLO:
         
         # Logger
         Path('logs').mkdir(exist_ok=True) 
-        self.logger = setup_logger('SistemaPLC', archivo_log='logs/sistema.log')
+        self.logger = setup_logger('SistemaPLC', archivo_log='logs/sistema.log', asincrono=True)
+        # El nivel no cambia en ejecución: el polling consulta este bool y
+        # no llama a log_estado_plc si DEBUG está apagado
+        self._log_debug = self.logger.isEnabledFor(logging.DEBUG)
         self.logger.info("="*70)
         self.logger.info("INICIANDO SISTEMA PLC-YOLO (DUAL CAM)")
         self.logger.info("="*70)
@@ -46,19 +58,51 @@ class SistemaPLCYOLO:
         Path('config').mkdir(exist_ok=True) 
         self.config = self._cargar_configuracion()
         
+        # Valores de 'sistema' resueltos una vez (el loop no toca el dict)
+        self._cfg_sistema = self.config.get('sistema', {})
+        self._delay_lectura_ms = self._cfg_sistema.get('delay_lectura_plc_ms', 100)
+        self._delay_simulacion_ms = self._cfg_sistema.get('delay_simulacion_ms', 500)
+        self._delay_post_ms = self._cfg_sistema.get('delay_post_proceso_ms', 500)
+        
         # Componentes del sistema
         self.controlador_plc = None
         self.vision_processor = None # Se inicializará al 'Iniciar'
         
         # Estado del sistema
         self.modo_realtime_activo = False
-        self.modo_simulacion = self.config.get('sistema', {}).get('modo_simulacion', True)
+        self.modo_simulacion = self._cfg_sistema.get('modo_simulacion', True)
         
         # <<< CAMBIO: Dos capturas de video >>>
         self.video_cap_sup = None
         self.video_cap_lat = None
         self.frame_actual_sup = None
         self.frame_actual_lat = None
+        self.captura = None  # Hilo productor de frames (ver _iniciar_captura)
+        # Sin hilo lector: dos slots por cámara que read() reescribe por turno
+        self._pool_frames = {'sup': [None, None], 'lat': [None, None]}
+        self._slot_frame = 0
+        self._t_captura = None  # perf_counter de lectura del par actual
+        
+        # Conversión/redimensionado de display en GPU si OpenCV tiene CUDA
+        self.display_cuda = self._opencv_cuda_disponible()
+        self._gpu_mats = {}  # canvas -> (GpuMat entrada, reducido, RGB)
+        self._buffers_display = {}  # canvas -> (BGR reducido, RGB) reutilizados
+        self._photos = {}  # canvas -> [PhotoImage, id del item, (x, y)]
+        
+        # Refresco del video crudo acotado a `fps_display` (0 = cada vuelta);
+        # los frames anotados de un resultado se muestran siempre
+        fps_display = self._cfg_sistema.get('fps_display', 15)
+        self._periodo_display_s = 1.0 / fps_display if fps_display else 0.0
+        self._t_ultimo_display = 0.0
+        self._ui_visible = True  # False con la ventana minimizada o tapada
+        
+        # Lectura de D28 y escritura de resultados al PLC fuera del hilo de Tk
+        self.plc_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='plc-io')
+        self.escritura_pendiente = None
+        self.lectura_pendiente = None
+        
+        # Carga de modelos + calibración fuera del hilo de Tk (ver _iniciar_sistema)
+        self.preparacion_pendiente = None
         
         # <<< CAMBIO: Dos rutas de modelo >>>
         self.modelo_path_sup = None
@@ -75,8 +119,7 @@ class SistemaPLCYOLO:
         # <<< CAMBIO: Usa el nombre de config correcto >>>
         config_path = 'config/plc_config_prueba.json'
         try:
-            with open(config_path, 'r') as f:
-                config = json.load(f)
+            config = cargar_json(config_path)
             self.logger.info(f"✅ Configuración cargada desde {config_path}")
             
             # Asegurarse de que las secciones existan
@@ -148,13 +191,15 @@ class SistemaPLCYOLO:
         ttk.Label(panel_controles, text="Fuentes de Video", font=('Arial', 12, 'bold')).pack(anchor=tk.W)
         
         # <<< CAMBIO: Botones para DOS videos >>>
-        ttk.Button(panel_controles, text="📁 Cargar Video Superior", 
-                  command=self._cargar_video_sup).pack(fill=tk.X, pady=5)
+        self.btn_video_sup = ttk.Button(panel_controles, text="📁 Cargar Video Superior", 
+                  command=self._cargar_video_sup)
+        self.btn_video_sup.pack(fill=tk.X, pady=5)
         self.camara_sup_status_var = tk.StringVar(value="Sin video Sup.")
         ttk.Label(panel_controles, textvariable=self.camara_sup_status_var).pack(anchor=tk.W, pady=2)
         
-        ttk.Button(panel_controles, text="📁 Cargar Video Lateral", 
-                  command=self._cargar_video_lat).pack(fill=tk.X, pady=5)
+        self.btn_video_lat = ttk.Button(panel_controles, text="📁 Cargar Video Lateral", 
+                  command=self._cargar_video_lat)
+        self.btn_video_lat.pack(fill=tk.X, pady=5)
         self.camara_lat_status_var = tk.StringVar(value="Sin video Lat.")
         ttk.Label(panel_controles, textvariable=self.camara_lat_status_var).pack(anchor=tk.W, pady=2)
 
@@ -189,6 +234,15 @@ class SistemaPLCYOLO:
         self.canvas_video_lat = tk.Canvas(panel_video_lat, bg='black')
         self.canvas_video_lat.pack(fill=tk.BOTH, expand=True)
         
+        # Tamaño de cada canvas cacheado en <Configure> (sin winfo_* por frame)
+        self._tamano_canvas = {}
+        for canvas in (self.canvas_video_sup, self.canvas_video_lat):
+            canvas.bind('<Configure>', self._on_canvas_resize)
+        
+        # Minimizada o tapada: no se dibuja video (ver _on_visibilidad)
+        for evento in ('<Map>', '<Unmap>', '<Visibility>'):
+            self.root.bind(evento, self._on_visibilidad, add='+')
+        
         # ==================== PANEL DERECHO (Resultados) ====================
         panel_resultados = ttk.LabelFrame(self.root, text="Logs y Resultados", padding=10)
         panel_resultados.pack(side=tk.RIGHT, fill=tk.Y, padx=10, pady=10)
@@ -232,7 +286,7 @@ class SistemaPLCYOLO:
         self.logger.info("🔌 PLC desconectado")
 
     def _cargar_modelo_sup(self):
-        archivo = filedialog.askopenfilename(title="Seleccionar modelo SUPERIOR", filetypes=[("Modelos YOLO", "*.pt")])
+        archivo = filedialog.askopenfilename(title="Seleccionar modelo SUPERIOR", filetypes=[("Modelos YOLO", "*.pt *.engine")])
         if archivo:
             self.modelo_path_sup = archivo
             self.modelo_sup_status_var.set(f"✅ {Path(archivo).name}")
@@ -240,7 +294,7 @@ class SistemaPLCYOLO:
             self.logger.info(f"Ruta modelo Superior: {archivo}")
 
     def _cargar_modelo_lat(self):
-        archivo = filedialog.askopenfilename(title="Seleccionar modelo LATERAL", filetypes=[("ModelOS YOLO", "*.pt")])
+        archivo = filedialog.askopenfilename(title="Seleccionar modelo LATERAL", filetypes=[("ModelOS YOLO", "*.pt *.engine")])
         if archivo:
             self.modelo_path_lat = archivo
             self.modelo_lat_status_var.set(f"✅ {Path(archivo).name}")
@@ -251,10 +305,10 @@ class SistemaPLCYOLO:
         archivo = filedialog.askopenfilename(title="Seleccionar video SUPERIOR", filetypes=[("Archivos de video", "*.mp4 *.avi *.mkv")])
         if archivo:
             if self.video_cap_sup: self.video_cap_sup.release()
-            self.video_cap_sup = cv2.VideoCapture(archivo)
+            self.video_cap_sup, backend = self._abrir_video(archivo)
             if self.video_cap_sup.isOpened():
                 fps = self.video_cap_sup.get(cv2.CAP_PROP_FPS)
-                self.camara_sup_status_var.set(f"✅ {Path(archivo).name} ({int(fps)} FPS)")
+                self.camara_sup_status_var.set(f"✅ {Path(archivo).name} ({int(fps)} FPS, {backend})")
                 self._actualizar_estado_ui()
                 self.logger.info(f"Video Superior cargado: {archivo}")
                 ret, frame = self.video_cap_sup.read()
@@ -268,10 +322,10 @@ class SistemaPLCYOLO:
         archivo = filedialog.askopenfilename(title="Seleccionar video LATERAL", filetypes=[("Archivos de video", "*.mp4 *.avi *.mkv")])
         if archivo:
             if self.video_cap_lat: self.video_cap_lat.release()
-            self.video_cap_lat = cv2.VideoCapture(archivo)
+            self.video_cap_lat, backend = self._abrir_video(archivo)
             if self.video_cap_lat.isOpened():
                 fps = self.video_cap_lat.get(cv2.CAP_PROP_FPS)
-                self.camara_lat_status_var.set(f"✅ {Path(archivo).name} ({int(fps)} FPS)")
+                self.camara_lat_status_var.set(f"✅ {Path(archivo).name} ({int(fps)} FPS, {backend})")
                 self._actualizar_estado_ui()
                 self.logger.info(f"Video Lateral cargado: {archivo}")
                 ret, frame = self.video_cap_lat.read()
@@ -281,6 +335,15 @@ class SistemaPLCYOLO:
                 messagebox.showerror("Error", f"No se pudo abrir el video Lateral: {archivo}")
                 self.logger.error(f"❌ No se pudo abrir el video Lateral: {archivo}")
 
+    def _abrir_video(self, archivo):
+        """Abre el video con el backend de `sistema.capture_backend`"""
+        sistema = self._cfg_sistema
+        return abrir_video(
+            archivo,
+            sistema.get('capture_backend', 'ffmpeg'),
+            sistema.get('gstreamer_pipeline', PIPELINE_GSTREAMER_NVDEC)
+        )
+
     def _toggle_simulacion(self):
         """Alterna modo simulación"""
         self.modo_simulacion = self.chk_simulacion_var.get()
@@ -302,35 +365,83 @@ class SistemaPLCYOLO:
             self.btn_iniciar.config(state=tk.DISABLED)
     
     def _iniciar_sistema(self):
-        """Inicia el loop principal del sistema"""
-        if self.modo_realtime_activo:
+        """
+        Inicia el sistema: carga de modelos + calibración Y en segundo plano
+        
+        La construcción de VisionProcessor (carga/exportación de engines y
+        warm-up) y la calibración corren en un hilo aparte; Tk sigue
+        atendiendo eventos y _esperar_preparacion arranca el loop al terminar.
+        """
+        if self.modo_realtime_activo or self.preparacion_pendiente is not None:
             return
-            
+        
+        # El frame de calibración se lee aquí: el VideoCapture es de Tk
+        if not self.video_cap_sup or not self.video_cap_sup.isOpened():
+            self.logger.error("No se puede calibrar, video superior no cargado.")
+            return
+        ret, frame_sup_calib = self.video_cap_sup.read()
+        if not ret:
+            self.logger.error("❌ Error: No se pudo leer el primer frame del video Superior para calibración Y.")
+            messagebox.showerror("Error", "No se pudo leer el frame de calibración.")
+            return
+        self.video_cap_sup.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        
+        self.logger.info("Inicializando VisionProcessor...")
+        self.status_var.set("Cargando modelos...")
+        self.btn_iniciar.config(state=tk.DISABLED)
+        # El hilo de captura lee estos VideoCapture: no se liberan en marcha
+        self._habilitar_carga_videos(False)
+        
+        if self.vision_processor:
+            self.vision_processor.cerrar()
+            self.vision_processor = None
+        
+        ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='carga-vision')
+        self.preparacion_pendiente = ejecutor.submit(self._preparar_vision, frame_sup_calib)
+        ejecutor.shutdown(wait=False)  # El hilo termina solo al acabar la tarea
+        self._esperar_preparacion()
+    
+    def _preparar_vision(self, frame_sup_calib):
+        """
+        Construye VisionProcessor y calibra Y (hilo 'carga-vision', sin Tk)
+        
+        Returns:
+            VisionProcessor con modelos cargados y calibrado
+        """
+        vision_processor = VisionProcessor(
+            self.config, 
+            self.logger,
+            self.modelo_path_sup,
+            self.modelo_path_lat
+        )
+        if not vision_processor.modelos_cargados:
+            vision_processor.cerrar()
+            raise RuntimeError("No se pudieron cargar los modelos en VisionProcessor.")
+        self.logger.info("✅ VisionProcessor listo y modelos cargados.")
+        
+        self.logger.info("🔧 Iniciando calibración Y (Superior)...")
+        vision_processor.calibrar_y(frame_sup_calib)
+        return vision_processor
+    
+    def _esperar_preparacion(self):
+        """Revisa la carga en segundo plano; al terminar inicia el loop"""
+        futuro = self.preparacion_pendiente
+        if not futuro.done():
+            self.root.after(50, self._esperar_preparacion)
+            return
+        self.preparacion_pendiente = None
+        
         try:
-            self.logger.info("Inicializando VisionProcessor...")
-            self.status_var.set("Cargando modelos...")
-            self.root.update()
-            
-            self.vision_processor = VisionProcessor(
-                self.config, 
-                self.logger,
-                self.modelo_path_sup,
-                self.modelo_path_lat
-            )
-            
-            if not self.vision_processor.modelos_cargados:
-                messagebox.showerror("Error", "No se pudieron cargar los modelos en VisionProcessor.")
-                self.logger.error("❌ Fallo al cargar modelos en VisionProcessor.")
-                self.status_var.set("Error de modelo")
-                return
-            
-            self.logger.info("✅ VisionProcessor listo y modelos cargados.")
-            
+            self.vision_processor = futuro.result()
         except Exception as e:
             self.logger.error(f"❌ Error fatal al inicializar VisionProcessor: {e}", exc_info=True)
             messagebox.showerror("Error Crítico", f"No se pudo iniciar VisionProcessor: {e}")
+            self.status_var.set("Error de modelo")
+            self._habilitar_carga_videos(True)
+            self._actualizar_estado_ui()
             return
-            
+        
+        self.logger.info(f"Calibración finalizada. Centros Y: {self.vision_processor.X_CENTROS_IDEALES}")
         self.modo_realtime_activo = True
         self.btn_iniciar.config(state=tk.DISABLED)
         self.btn_detener.config(state=tk.NORMAL)
@@ -340,36 +451,16 @@ class SistemaPLCYOLO:
         self.btn_conectar_plc.config(state=tk.DISABLED)
         self.chk_simulacion.config(state=tk.DISABLED)
         
-        self._calibrar_sistema()
-
-    def _calibrar_sistema(self):
-        """Ejecuta la calibración Y (Superior) antes de iniciar el loop"""
-        if not self.video_cap_sup or not self.video_cap_sup.isOpened():
-            self.logger.error("No se puede calibrar, video superior no cargado.")
-            return
-
-        ret, frame_sup_calib = self.video_cap_sup.read()
-        if ret:
-            self.logger.info("🔧 Iniciando calibración Y (Superior)...")
-            self.status_var.set("Calibrando...")
-            self.root.update()
-            
-            self.vision_processor.calibrar_y(frame_sup_calib)
-            
-            self.video_cap_sup.set(cv2.CAP_PROP_POS_FRAMES, 0)
-            self.logger.info(f"Calibración finalizada. Centros Y: {self.vision_processor.X_CENTROS_IDEALES}")
-            self.status_var.set("Calibrado. Iniciando loop...")
-            
-            self._loop_principal()
-        else:
-            self.logger.error("❌ Error: No se pudo leer el primer frame del video Superior para calibración Y.")
-            messagebox.showerror("Error", "No se pudo leer el frame de calibración.")
-            self._detener_sistema()
+        self._iniciar_captura()
+        self._loop_principal()
 
     
     def _detener_sistema(self):
         """Detiene el sistema"""
         self.modo_realtime_activo = False
+        self._detener_captura()
+        # Una lectura en vuelo termina en el worker; su resultado se descarta
+        self.lectura_pendiente = None
         self.btn_iniciar.config(state=tk.NORMAL)
         self.btn_detener.config(state=tk.DISABLED)
         self.status_var.set("Sistema detenido")
@@ -378,6 +469,75 @@ class SistemaPLCYOLO:
         if not (self.controlador_plc and self.controlador_plc.is_connected):
             self.btn_conectar_plc.config(state=tk.NORMAL)
         self.chk_simulacion.config(state=tk.NORMAL)
+        self._habilitar_carga_videos(True)
+    
+    def _habilitar_carga_videos(self, habilitar: bool):
+        """Habilita o deshabilita los botones de carga de video"""
+        estado = tk.NORMAL if habilitar else tk.DISABLED
+        self.btn_video_sup.config(state=estado)
+        self.btn_video_lat.config(state=estado)
+    
+    def _iniciar_captura(self):
+        """
+        Lanza la lectura de ambos videos en un hilo aparte, para que la
+        decodificación se solape con la inferencia y el polling del PLC.
+        """
+        if not self._cfg_sistema.get('captura_en_hilo', True):
+            return
+        self._detener_captura()
+        self.captura = CapturaEnHilo(
+            [self.video_cap_sup, self.video_cap_lat], ['Superior', 'Lateral'],
+            maxsize=self._cfg_sistema.get('tamano_cola_frames', 2),
+            nucleos=self._cfg_sistema.get('nucleos_captura')
+        )
+        self.captura.iniciar()
+    
+    def _detener_captura(self):
+        """Detiene el hilo productor de frames (si existe)"""
+        if self.captura:
+            self.captura.detener()
+            self.captura = None
+    
+    def _leer_frames(self):
+        """
+        Obtiene el par de frames (superior, lateral) más reciente.
+        
+        Returns:
+            (frame_sup, frame_lat), (None, None) si se perdieron las fuentes,
+            o None si el hilo lector todavía no entregó un par nuevo
+        """
+        if self.captura:
+            # Sin bloquear el hilo de Tk: si no hay par, el loop reintenta
+            frames = self.captura.obtener(timeout=0)
+            if frames is None and self.captura.error:
+                return None, None
+            if frames is not None:
+                self._t_captura = self.captura.t_captura
+            return frames
+        
+        # read(destino) decodifica sobre el slot del ciclo anterior al previo
+        # (el primero con None aloca); el frame del ciclo previo no se toca
+        i = self._slot_frame
+        self._slot_frame ^= 1
+        pool_sup, pool_lat = self._pool_frames['sup'], self._pool_frames['lat']
+        ret_sup, frame_sup = self.video_cap_sup.read(pool_sup[i])
+        ret_lat, frame_lat = self.video_cap_lat.read(pool_lat[i])
+
+        # Manejar fin de video (reiniciar)
+        if not ret_sup:
+            self.logger.info("Video Superior finalizado, reiniciando...")
+            self.video_cap_sup.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret_sup, frame_sup = self.video_cap_sup.read()
+        if not ret_lat:
+            self.logger.info("Video Lateral finalizado, reiniciando...")
+            self.video_cap_lat.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret_lat, frame_lat = self.video_cap_lat.read()
+
+        if not ret_sup or not ret_lat:
+            return None, None
+        self._t_captura = time.perf_counter()
+        pool_sup[i], pool_lat[i] = frame_sup, frame_lat
+        return frame_sup, frame_lat
     
     def _loop_principal(self):
         """
@@ -388,49 +548,41 @@ class SistemaPLCYOLO:
             self.logger.info("Loop detenido por bandera 'modo_realtime_activo'")
             return
         
-        delay_siguiente = self.config.get('sistema', {}).get('delay_lectura_plc_ms', 100)
+        delay_siguiente = self._delay_lectura_ms
         
         try:
             # 1. Capturar frames
-            ret_sup, frame_sup = self.video_cap_sup.read()
-            ret_lat, frame_lat = self.video_cap_lat.read()
-
-            # Manejar fin de video (reiniciar)
-            if not ret_sup:
-                self.logger.info("Video Superior finalizado, reiniciando...")
-                self.video_cap_sup.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                ret_sup, frame_sup = self.video_cap_sup.read()
-            if not ret_lat:
-                self.logger.info("Video Lateral finalizado, reiniciando...")
-                self.video_cap_lat.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                ret_lat, frame_lat = self.video_cap_lat.read()
+            frames = self._leer_frames()
+            if frames is None:
+                self.root.after(10, self._loop_principal)
+                return
+            frame_sup, frame_lat = frames
 
-            if not ret_sup or not ret_lat:
+            if frame_sup is None or frame_lat is None:
                 self.logger.error("Error en loop: No se pueden leer frames de los videos.")
                 self._detener_sistema()
                 messagebox.showerror("Error", "Se perdieron las fuentes de video.")
                 return
 
-            self.frame_actual_sup = frame_sup.copy()
-            self.frame_actual_lat = frame_lat.copy()
-
-            # Mostrar frames *originales*
-            self._mostrar_frame(self.frame_actual_sup, self.canvas_video_sup)
-            self._mostrar_frame(self.frame_actual_lat, self.canvas_video_lat)
+            # Sin copia: el ciclo es síncrono y cada frame es un array propio
+            # (cola del hilo lector) o un slot de _pool_frames
+            self.frame_actual_sup = frame_sup
+            self.frame_actual_lat = frame_lat
 
             # 2. Consultar PLC (o simular)
             procesar = False
             if self.modo_simulacion:
                 procesar = True
-                delay_siguiente = self.config.get('sistema', {}).get('delay_simulacion_ms', 500)
+                delay_siguiente = self._delay_simulacion_ms
             elif self.controlador_plc and self.controlador_plc.is_connected:
-                procesar = self.controlador_plc.leer_solicitud_inspeccion()
-                log_estado_plc(self.controlador_plc, self.logger, procesar)
+                # D28 sigue en 99 hasta que termine la escritura en curso
+                if not self._escritura_en_curso():
+                    procesar = self._solicitud_plc()
             
             # 3. Procesar si hay solicitud
             if procesar:
                 self.status_var.set("🔄 Procesando solicitud...")
-                self.root.update()
+                self.root.update_idletasks()
                 
                 if not self.vision_processor:
                     self.logger.error("Error crítico: VisionProcessor no inicializado.")
@@ -448,31 +600,41 @@ class SistemaPLCYOLO:
                         self.logger.warning(adv)
                 
                 log_resultado_procesamiento(resultado, self.logger)
+                if self._log_debug and self._t_captura is not None:
+                    # Antigüedad del dato que recibe el PLC (lectura del par → resultado)
+                    self.logger.debug("Edad del frame al resultado: %.0f ms",
+                                      (time.perf_counter() - self._t_captura) * 1000.0)
                 
                 # Mostrar en UI (Frames anotados y logs)
-                self._mostrar_frame(resultado['annotated_sup'], self.canvas_video_sup)
-                self._mostrar_frame(resultado['annotated_lat'], self.canvas_video_lat)
+                if self._ui_visible:  # get() dibuja las cajas: solo si se van a ver
+                    self._mostrar_frame(resultado['annotated_sup'].get(), self.canvas_video_sup)
+                    self._mostrar_frame(resultado['annotated_lat'].get(), self.canvas_video_lat)
                 self._mostrar_resultado(resultado)
                 
                 # Enviar a PLC
                 if not self.modo_simulacion and self.controlador_plc:
                     exito_plc = resultado['plc_success']
                     
-                    exito_escritura = self.controlador_plc.escribir_resultados(
+                    # Se envía en el worker de I/O; el resultado se revisa
+                    # en _escritura_en_curso() antes del siguiente polling
+                    self.escritura_pendiente = self.plc_executor.submit(
+                        self.controlador_plc.escribir_resultados,
                         resultado['desviacion_y_mm'], # Desviación Z
                         resultado['filas'],           # Conteo de filas
                         exito_plc
                     )
-                    
-                    if not exito_escritura:
-                        self.logger.error("❌ FALLO AL ESCRIBIR EN PLC")
-                        self.plc_status_var.set("❌ Error Escritura")
-                        self.plc_status_var.config(foreground='red')
                 
-                delay_siguiente = self.config.get('sistema', {}).get('delay_post_proceso_ms', 500)
+                delay_siguiente = self._delay_post_ms
             else:
+                # Mostrar frames *originales* (al procesar se muestran los anotados)
+                if self._toca_display():
+                    self._mostrar_frame(self.frame_actual_sup, self.canvas_video_sup)
+                    self._mostrar_frame(self.frame_actual_lat, self.canvas_video_lat)
+                
                 if not self.modo_simulacion:
                     self.status_var.set("🟢 Monitoreando PLC (esperando D28=99)")
+                    if self.controlador_plc and self.controlador_plc.is_connected:
+                        delay_siguiente = self.controlador_plc.obtener_delay_polling_ms()
             
             # 4. Siguiente iteración
             self.root.after(delay_siguiente, self._loop_principal)
@@ -482,38 +644,168 @@ class SistemaPLCYOLO:
             self._detener_sistema()
             messagebox.showerror("Error de Ejecución", f"Error fatal en el sistema: {e}")
     
+    def _solicitud_plc(self) -> bool:
+        """
+        Polling de D28 sin bloquear el hilo de Tk.
+        
+        La lectura (con sus reintentos y reconexiones) corre en el worker
+        de I/O y se recoge en una vuelta posterior del loop; al recogerla
+        sin solicitud se envía la siguiente, así cada vuelta consume una
+        lectura y el ritmo lo sigue marcando el delay del loop.
+        
+        Returns:
+            True cuando una lectura terminada encontró D28=99
+        """
+        if self.lectura_pendiente is None:
+            self.lectura_pendiente = self.plc_executor.submit(
+                self.controlador_plc.leer_solicitud_inspeccion
+            )
+            return False
+        if not self.lectura_pendiente.done():
+            return False
+        
+        procesar = self.lectura_pendiente.result()
+        self.lectura_pendiente = None
+        if self._log_debug:
+            log_estado_plc(self.controlador_plc, self.logger, procesar)
+        if not procesar:
+            self.lectura_pendiente = self.plc_executor.submit(
+                self.controlador_plc.leer_solicitud_inspeccion
+            )
+        return procesar
+    
+    def _escritura_en_curso(self) -> bool:
+        """
+        Indica si hay una escritura al PLC todavía en vuelo.
+        
+        Cuando la escritura termina, procesa su resultado en el hilo de Tk
+        (actualiza la UI si falló) y libera el polling.
+        """
+        if self.escritura_pendiente is None:
+            return False
+        if not self.escritura_pendiente.done():
+            return True
+        
+        exito_escritura = self.escritura_pendiente.result()
+        self.escritura_pendiente = None
+        if not exito_escritura:
+            self.logger.error("❌ FALLO AL ESCRIBIR EN PLC")
+            self.plc_status_var.set("❌ Error Escritura")
+            self.plc_status_var.config(foreground='red')
+        return False
+    
+    @staticmethod
+    def _opencv_cuda_disponible() -> bool:
+        """True si OpenCV fue compilado con CUDA y hay un dispositivo"""
+        try:
+            return cv2.cuda.getCudaEnabledDeviceCount() > 0
+        except (AttributeError, cv2.error):
+            return False
+    
+    def _preparar_display(self, frame, canvas, new_w, new_h):
+        """
+        Resize + BGR→RGB del frame para el canvas.
+        
+        En ambos caminos se reduce primero (la conversión de color se hace
+        sobre menos píxeles) y sobre buffers reservados por canvas, que se
+        recrean solo si cambia el tamaño. Con CUDA se sube el frame, se
+        reduce y convierte en GPU y solo se descarga la imagen ya pequeña.
+        """
+        forma = (new_h, new_w, 3)
+        buffers = self._buffers_display.get(canvas)
+        if buffers is None or buffers[0].shape != forma:
+            buffers = (np.empty(forma, dtype=np.uint8), np.empty(forma, dtype=np.uint8))
+            self._buffers_display[canvas] = buffers
+        bgr, rgb = buffers
+        interpolacion = interpolacion_preview(frame.shape[1], new_w)
+        
+        if self.display_cuda:
+            try:
+                gpu_in, gpu_chico, gpu_rgb = self._gpu_mats.setdefault(
+                    canvas, (cv2.cuda_GpuMat(), cv2.cuda_GpuMat(), cv2.cuda_GpuMat()))
+                gpu_in.upload(frame)
+                cv2.cuda.resize(gpu_in, (new_w, new_h), dst=gpu_chico, interpolation=interpolacion)
+                cv2.cuda.cvtColor(gpu_chico, cv2.COLOR_BGR2RGB, dst=gpu_rgb)
+                return gpu_rgb.download(dst=rgb)
+            except cv2.error as e:
+                self.logger.warning(f"⚠️ Display CUDA falló, se usa CPU: {e}")
+                self.display_cuda = False
+        
+        cv2.resize(frame, (new_w, new_h), dst=bgr, interpolation=interpolacion)
+        return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=rgb)
+    
+    def _toca_display(self) -> bool:
+        """True si la ventana está a la vista y ya pasó el período de display"""
+        if not self._ui_visible:
+            return False
+        ahora = time.perf_counter()
+        if ahora - self._t_ultimo_display < self._periodo_display_s:
+            return False
+        self._t_ultimo_display = ahora
+        return True
+    
+    def _pintar_en_canvas(self, canvas, imagen, x, y):
+        """
+        Pega la imagen sobre el PhotoImage persistente del canvas.
+        
+        Cada canvas tiene un solo PhotoImage y un solo item: el PhotoImage
+        se recrea únicamente si cambia el tamaño, y el item solo se mueve
+        si cambia el offset de centrado.
+        """
+        estado = self._photos.get(canvas)
+        if estado is None:
+            photo = ImageTk.PhotoImage(image=imagen)
+            item = canvas.create_image(x, y, anchor=tk.NW, image=photo)
+            self._photos[canvas] = [photo, item, (x, y)]
+            return
+        
+        photo, item, posicion = estado
+        if (photo.width(), photo.height()) != imagen.size:
+            estado[0] = ImageTk.PhotoImage(image=imagen)
+            canvas.itemconfig(item, image=estado[0])
+        else:
+            photo.paste(imagen)
+        if posicion != (x, y):
+            canvas.coords(item, x, y)
+            estado[2] = (x, y)
+    
+    def _on_canvas_resize(self, event):
+        """Guarda el nuevo tamaño del canvas que disparó <Configure>"""
+        if event.width < 10 or event.height < 10:
+            self._tamano_canvas[event.widget] = (640, 480) # Default
+        else:
+            self._tamano_canvas[event.widget] = (event.width, event.height)
+    
+    def _on_visibilidad(self, event):
+        """Sigue si la ventana está a la vista (<Map>/<Unmap>/<Visibility>)"""
+        if event.widget is not self.root:
+            return  # Los bindings de la raíz también reciben eventos de los hijos
+        if event.type == tk.EventType.Unmap:
+            self._ui_visible = False
+        elif event.type == tk.EventType.Map:
+            self._ui_visible = True
+        else:
+            self._ui_visible = event.state != 'VisibilityFullyObscured'
+    
     def _mostrar_frame(self, frame, canvas):
         """Muestra frame en un canvas específico, redimensionando"""
+        if not self._ui_visible:
+            return
         try:
-            canvas_width = canvas.winfo_width()
-            canvas_height = canvas.winfo_height()
-
-            if canvas_width < 10 or canvas_height < 10:
-                canvas_width, canvas_height = 640, 480 # Default
+            canvas_width, canvas_height = self._tamano_canvas.get(canvas, (640, 480))
                 
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            
-            h, w, _ = frame_rgb.shape
+            h, w, _ = frame.shape
             ratio = min(canvas_width / w, canvas_height / h)
             new_w, new_h = int(w * ratio), int(h * ratio)
             
             if new_w <= 0 or new_h <= 0: return
             
-            frame_resized = cv2.resize(frame_rgb, (new_w, new_h), interpolation=cv2.INTER_AREA)
-            
-            imagen = Image.fromarray(frame_resized)
-            imagen_tk = ImageTk.PhotoImage(imagen)
+            frame_resized = self._preparar_display(frame, canvas, new_w, new_h)
+            imagen = Image.frombuffer('RGB', (new_w, new_h), frame_resized, 'raw', 'RGB', 0, 1)
             
-            canvas.delete("all")
             x_offset = (canvas_width - new_w) // 2
             y_offset = (canvas_height - new_h) // 2
-            
-            canvas.create_image(x_offset, y_offset, anchor=tk.NW, image=imagen_tk)
-            
-            if canvas == self.canvas_video_sup:
-                self.canvas_video_sup.image = imagen_tk
-            else:
-                self.canvas_video_lat.image = imagen_tk
+            self._pintar_en_canvas(canvas, imagen, x_offset, y_offset)
                 
         except Exception as e:
             self.logger.warning(f"⚠️ Error al mostrar frame: {e} (Canvas: {canvas})")
@@ -522,29 +814,47 @@ class SistemaPLCYOLO:
     def _mostrar_resultado(self, resultado):
         """Muestra resultado DUAL en panel de texto"""
         timestamp = time.strftime("%H:%M:%S")
-        
-        texto = f"\n{'='*45}\n"
-        texto += f"[{timestamp}] RESULTADO PROCESAMIENTO DUAL\n"
-        texto += f"{'='*45}\n"
+        separador = '=' * 45
         
         codigo_plc = resultado['codigo_respuesta_plc']
         if codigo_plc == 2: # PARADA
-            texto += f"🛑 DIAGNÓSTICO: PARADA CRÍTICA (Lateral)\n"
+            diagnostico = "🛑 DIAGNÓSTICO: PARADA CRÍTICA (Lateral)"
         elif codigo_plc == 1: # FALLO QC
-            texto += f"⚠️ DIAGNÓSTICO: FALLO QC / Corrección Y\n"
+            diagnostico = "⚠️ DIAGNÓSTICO: FALLO QC / Corrección Y"
         else:
-            texto += f"✅ DIAGNÓSTICO: OK\n"
-            
-        texto += f"--- SUPERIOR (QC, Y, Conteo) ---\n"
-        texto += f"  • Filas Restantes: {resultado['filas']}\n"
-        texto += f"  • Desviación Y: {resultado['desviacion_y_px']} px\n" # Mostrar en Píxeles
-        
-        texto += f"\n--- LATERAL (Z, Seguridad) ---\n"
-        texto += f"  • Corrección Z: {resultado['correccion_z_cmm']} cMM\n"
-        texto += f"  • Desviación (a PLC): {resultado['desviacion_y_mm']:.2f} mm\n" # Mostrar Z en mm
-        texto += f"  • Log Z: {resultado['log_z']}\n"
+            diagnostico = "✅ DIAGNÓSTICO: OK"
+        
+        # Una sola concatenación (join) en vez de un += por línea
+        partes = [
+            "",
+            separador,
+            f"[{timestamp}] RESULTADO PROCESAMIENTO DUAL",
+            separador,
+            diagnostico,
+            "--- SUPERIOR (QC, Y, Conteo) ---",
+            f"  • Filas Restantes: {resultado['filas']}",
+            f"  • Desviación Y: {resultado['desviacion_y_px']} px", # Mostrar en Píxeles
+            "",
+            "--- LATERAL (Z, Seguridad) ---",
+            f"  • Corrección Z: {resultado['correccion_z_cmm']} cMM",
+            f"  • Desviación (a PLC): {resultado['desviacion_y_mm']:.2f} mm", # Mostrar Z en mm
+            f"  • Log Z: {resultado['log_z']}",
+            "",
+        ]
 
+        # Insertar al final y hacer scroll
+        self._agregar_texto_resultados("\n".join(partes))
+    
+    def _agregar_texto_resultados(self, texto):
+        """
+        Agrega texto al panel de resultados y recorta el historial: pasadas
+        MAX_LINEAS_RESULTADOS se borran las LINEAS_A_RECORTAR más viejas de
+        una vez (borrado amortizado, memoria y scroll acotados en 24/7).
+        """
         self.text_resultados.insert(tk.END, texto)
+        lineas = int(self.text_resultados.index('end-1c').split('.')[0])
+        if lineas > MAX_LINEAS_RESULTADOS:
+            self.text_resultados.delete('1.0', f'{LINEAS_A_RECORTAR + 1}.0')
         self.text_resultados.see(tk.END)
     
     def cerrar(self):
@@ -559,6 +869,12 @@ class SistemaPLCYOLO:
             self.logger.info("Liberando video Lateral...")
             self.video_cap_lat.release()
         
+        # Esperar a que termine cualquier escritura pendiente
+        self.plc_executor.shutdown(wait=True)
+        
+        if self.vision_processor:
+            self.vision_processor.cerrar()
+        
         if self.controlador_plc:
             self.logger.info("Desconectando PLC...")
             self.controlador_plc.desconectar()
@@ -3,5 +3,6 @@ Utilidades del sistema
 """
 
 from .logger import setup_logger, log_resultado_procesamiento
+from .config import cargar_json
 
-__all__ = ['setup_logger', 'log_resultado_procesamiento']
\ No newline at end of file
+__all__ = ['setup_logger', 'log_resultado_procesamiento', 'cargar_json']
\ No newline at end of file
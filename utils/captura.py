@@ -0,0 +1,572 @@
+"""
+Captura de video en segundo plano
+Desacopla la lectura de las cámaras/videos del loop de Tk y de la inferencia
+"""
+
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+log = logging.getLogger('SistemaPLC.Captura')
+
+# Decodificación H.264 en NVDEC (Jetson / GPUs NVIDIA con DeepStream)
+PIPELINE_GSTREAMER_NVDEC = (
+    "filesrc location={archivo} ! qtdemux ! h264parse ! nvv4l2decoder ! "
+    "nvvidconv ! video/x-raw,format=BGRx ! videoconvert ! video/x-raw,format=BGR ! "
+    "appsink drop=1 max-buffers=2"
+)
+
+
+class _CapturaAdaptada:
+    """
+    Base de los lectores que no son cv2.VideoCapture: expone la parte de
+    su interfaz que usa el sistema (read, grab, retrieve, get, set a frame
+    0, isOpened, release). Las subclases implementan `_abrir`, `_siguiente`
+    y, si el frame crudo no es ya BGR, `_a_bgr`.
+    """
+
+    def __init__(self, fuente: str):
+        self._fuente = fuente
+        self._abierto = False
+        self._crudo = None  # Último frame avanzado con grab(), sin convertir
+        self._abrir()
+        self._abierto = True
+
+    def _abrir(self):
+        raise NotImplementedError
+
+    def _siguiente(self):
+        """Próximo frame decodificado, sin convertir; None al final."""
+        raise NotImplementedError
+
+    def _a_bgr(self, crudo) -> np.ndarray:
+        """Convierte un frame de `_siguiente` a BGR uint8."""
+        return crudo
+
+    def _propiedades(self) -> dict:
+        """{CAP_PROP_*: valor} para get()"""
+        raise NotImplementedError
+
+    def _cerrar(self):
+        raise NotImplementedError
+
+    def isOpened(self) -> bool:
+        return self._abierto
+
+    def read(self, image=None):
+        # `image` se acepta por compatibilidad con cv2; el lector entrega su array
+        crudo = self._siguiente() if self._abierto else None
+        if crudo is None:
+            return False, None
+        return True, self._a_bgr(crudo)
+
+    def grab(self) -> bool:
+        # El frame se decodifica pero la conversión a BGR queda para retrieve()
+        self._crudo = self._siguiente() if self._abierto else None
+        return self._crudo is not None
+
+    def retrieve(self, image=None):
+        if self._crudo is None:
+            return False, None
+        return True, self._a_bgr(self._crudo)
+
+    def get(self, propiedad) -> float:
+        return float(self._propiedades().get(propiedad, 0) or 0)
+
+    def set(self, propiedad, valor) -> bool:
+        # Solo se usa para reiniciar el video al llegar al final
+        if propiedad != cv2.CAP_PROP_POS_FRAMES or valor != 0:
+            return False
+        self._cerrar()
+        self._crudo = None
+        self._abrir()
+        return True
+
+    def release(self):
+        if self._abierto:
+            self._cerrar()
+            self._abierto = False
+
+
+class _CapturaFFmpegCV(_CapturaAdaptada):
+    """Lector ffmpegcv (subproceso ffmpeg, entrega BGR uint8 contiguo)"""
+
+    def _abrir(self):
+        import ffmpegcv
+        self._cap = ffmpegcv.VideoCapture(self._fuente)
+
+    def _siguiente(self):
+        ret, frame = self._cap.read()
+        return frame if ret else None
+
+    def _propiedades(self):
+        return {
+            cv2.CAP_PROP_FPS: self._cap.fps,
+            cv2.CAP_PROP_FRAME_COUNT: self._cap.count,
+            cv2.CAP_PROP_FRAME_WIDTH: self._cap.width,
+            cv2.CAP_PROP_FRAME_HEIGHT: self._cap.height,
+        }
+
+    def _cerrar(self):
+        self._cap.release()
+
+
+class _CapturaPyAV(_CapturaAdaptada):
+    """Lector PyAV (libav en proceso; útil para RTSP/streams de red)"""
+
+    def _abrir(self):
+        import av
+        self._contenedor = av.open(self._fuente)
+        self._stream = self._contenedor.streams.video[0]
+        self._stream.thread_type = 'AUTO'
+        self._frames = self._contenedor.decode(self._stream)
+
+    def _siguiente(self):
+        try:
+            return next(self._frames)
+        except StopIteration:
+            return None
+
+    def _a_bgr(self, crudo):
+        return crudo.to_ndarray(format='bgr24')
+
+    def _propiedades(self):
+        contexto = self._stream.codec_context
+        return {
+            cv2.CAP_PROP_FPS: self._stream.average_rate,
+            cv2.CAP_PROP_FRAME_COUNT: self._stream.frames,
+            cv2.CAP_PROP_FRAME_WIDTH: contexto.width,
+            cv2.CAP_PROP_FRAME_HEIGHT: contexto.height,
+        }
+
+    def _cerrar(self):
+        self._contenedor.close()
+
+
+_LECTORES_ALTERNATIVOS = {'ffmpegcv': _CapturaFFmpegCV, 'pyav': _CapturaPyAV}
+
+
+def abrir_video(archivo: str, backend: str = 'ffmpeg',
+                pipeline: str = PIPELINE_GSTREAMER_NVDEC) -> Tuple[cv2.VideoCapture, str]:
+    """
+    Abre un archivo de video con el backend pedido.
+
+    Con `backend='gstreamer'` se intenta el pipeline (decodificación por
+    hardware). Con 'ffmpeg_hw' se pide a FFmpeg de OpenCV la aceleración
+    disponible (NVDEC, VAAPI, D3D11...); si no hay, FFmpeg decodifica en
+    CPU igual. Con 'ffmpegcv' o 'pyav' se usa esa librería (opcional) a
+    través de un adaptador con la interfaz de cv2.VideoCapture. Si el
+    backend no está disponible o no abre, se usa el lector por defecto
+    (FFmpeg de OpenCV, CPU).
+
+    Args:
+        archivo: Ruta del video (o URL, con 'pyav')
+        backend: 'ffmpeg', 'ffmpeg_hw', 'gstreamer', 'ffmpegcv' o 'pyav'
+        pipeline: Plantilla del pipeline GStreamer con `{archivo}`
+
+    Returns:
+        (VideoCapture o adaptador, nombre del backend efectivo)
+    """
+    if backend == 'gstreamer':
+        cap = cv2.VideoCapture(pipeline.format(archivo=archivo), cv2.CAP_GSTREAMER)
+        if cap.isOpened():
+            return cap, 'gstreamer'
+        cap.release()
+        log.warning("⚠️ Pipeline GStreamer no disponible para %s; se usa FFmpeg", archivo)
+    elif backend == 'ffmpeg_hw':
+        cap = _abrir_ffmpeg_hw(archivo)
+        if cap is not None:
+            return cap, 'ffmpeg_hw'
+    elif backend in _LECTORES_ALTERNATIVOS:
+        try:
+            return _LECTORES_ALTERNATIVOS[backend](archivo), backend
+        except ImportError:
+            log.warning("⚠️ %s no está instalado; se usa FFmpeg de OpenCV", backend)
+        except Exception as e:
+            log.warning("⚠️ %s no pudo abrir %s (%s); se usa FFmpeg de OpenCV", backend, archivo, e)
+    return cv2.VideoCapture(archivo), 'ffmpeg'
+
+
+def _abrir_ffmpeg_hw(archivo: str) -> Optional[cv2.VideoCapture]:
+    """
+    FFmpeg de OpenCV con decodificación por hardware (OpenCV >= 4.5.2).
+    
+    Los parámetros de aceleración solo se respetan al abrir, no con set().
+    
+    Returns:
+        VideoCapture abierto, o None si la build de OpenCV no lo soporta
+    """
+    try:
+        params = [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+    except AttributeError:
+        log.warning("⚠️ OpenCV sin CAP_PROP_HW_ACCELERATION; se usa FFmpeg en CPU")
+        return None
+    cap = cv2.VideoCapture(archivo, cv2.CAP_FFMPEG, params)
+    if not cap.isOpened():
+        cap.release()
+        return None
+    if int(cap.get(cv2.CAP_PROP_HW_ACCELERATION)) == cv2.VIDEO_ACCELERATION_NONE:
+        log.info("ℹ️ Sin decodificación por hardware para %s; FFmpeg decodifica en CPU", archivo)
+    return cap
+
+
+def abrir_camara(indice: int = 0, ancho: Optional[int] = None, alto: Optional[int] = None,
+                 fourcc: Optional[str] = 'MJPG') -> cv2.VideoCapture:
+    """
+    Abre una cámara local configurada para baja latencia.
+
+    - Buffer del driver en 1 frame: read() entrega el frame más nuevo y no
+      uno encolado hace varios frames (~130 ms con el buffer por defecto).
+    - MJPG y resolución explícita: evitan que el driver negocie YUYV y haga
+      la conversión a BGR por su cuenta.
+
+    Args:
+        indice: Índice de la cámara
+        ancho, alto: Resolución pedida (None = la del driver)
+        fourcc: Códec pedido al driver (None = no tocar)
+
+    Returns:
+        VideoCapture (revisar isOpened())
+    """
+    api = cv2.CAP_DSHOW if sys.platform.startswith('win') else cv2.CAP_V4L2
+    cap = cv2.VideoCapture(indice, api)
+    if not cap.isOpened():
+        return cap
+
+    if fourcc:
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+    if ancho and alto:
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, ancho)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, alto)
+    if not cap.set(cv2.CAP_PROP_BUFFERSIZE, 1):
+        log.warning("⚠️ El backend no permite CAP_PROP_BUFFERSIZE=1; "
+                    "los frames pueden llegar con retraso")
+    return cap
+
+
+def interpolacion_preview(ancho_origen: int, ancho_destino: int) -> int:
+    """
+    Interpolación para reducir un frame de preview.
+    
+    INTER_AREA promedia todos los píxeles de origen y es varias veces más
+    cara que INTER_LINEAR; solo compensa (evita aliasing visible) cuando la
+    reducción es de más de 4x.
+    
+    Args:
+        ancho_origen: Ancho del frame original
+        ancho_destino: Ancho de la imagen a mostrar
+        
+    Returns:
+        cv2.INTER_AREA o cv2.INTER_LINEAR
+    """
+    if ancho_origen > 4 * ancho_destino:
+        return cv2.INTER_AREA
+    return cv2.INTER_LINEAR
+
+
+class CapturaEnHilo:
+    """
+    Lee uno o varios cv2.VideoCapture en un hilo productor y deja el set
+    de frames más reciente en una cola acotada.
+
+    Si la cola está llena los frames siguientes se avanzan con grab() (sin
+    retrieve ni conversión) y solo uno de cada `decodificar_cada` se
+    recupera y reemplaza al set más viejo, así lo encolado nunca tiene más
+    de `decodificar_cada` frames de atraso; con `saltar_con_grab=False` se
+    decodifican todos y se descarta el set más viejo. En modo drop-oldest
+    obtener() entrega el set más nuevo de la cola. Con
+    `descartar_viejos=False` el productor se bloquea hasta que haya lugar
+    (back-pressure, no se pierde ningún frame) y obtener() los entrega en
+    orden. Los videos se reinician al
+    llegar al final y se leen a su FPS nominal.
+
+    Con `set_tamano_display()` el productor además deja lista, para la
+    primera fuente, una copia RGB ya redimensionada al canvas (ver
+    `obtener(con_display=True)`), así el hilo de Tk no convierte píxeles.
+    Con `usar_opencl=True` (y OpenCL disponible) ese resize + conversión
+    corre en la GPU/iGPU vía cv2.UMat. Con `nucleos` el hilo productor se
+    fija a esos núcleos (solo Linux).
+    """
+
+    def __init__(self, capturas: List[cv2.VideoCapture], nombres: List[str], maxsize: int = 2,
+                 descartar_viejos: bool = True, saltar_con_grab: bool = True,
+                 decodificar_cada: int = 2, usar_opencl: bool = False, nucleos: Optional[List[int]] = None):
+        """
+        Args:
+            capturas: VideoCapture ya abiertos (se leen en este orden)
+            nombres: Nombre de cada fuente, para los logs
+            maxsize: Tamaño de la cola de frames
+            descartar_viejos: True = drop-oldest, False = put bloqueante
+            saltar_con_grab: Con la cola llena (drop-oldest), avanzar con
+                grab() en vez de decodificar y descartar
+            decodificar_cada: Con la cola llena y `saltar_con_grab`, cada
+                cuántos frames avanzados se recupera uno para la cola
+            usar_opencl: Preparar el display con la API transparente de
+                OpenCL (cv2.UMat); sin OpenCL se usa la CPU
+            nucleos: Núcleos de CPU para el hilo productor (None = el
+                scheduler decide)
+        """
+        self.capturas = capturas
+        self.nombres = nombres
+        self.cola = queue.Queue(maxsize=maxsize)
+        self.descartar_viejos = descartar_viejos
+        self.saltar_con_grab = saltar_con_grab
+        self.decodificar_cada = max(1, decodificar_cada)
+        self.error: Optional[str] = None
+        # perf_counter() de lectura del último set entregado por obtener()
+        self.t_captura: Optional[float] = None
+
+        fps = [c.get(cv2.CAP_PROP_FPS) for c in capturas]
+        fps_validos = [f for f in fps if f and f > 0]
+        self._periodo_s = 1.0 / min(fps_validos) if fps_validos else 0.0
+
+        # Se activa al encolar un set y se limpia cuando la cola queda vacía
+        self.frame_listo = threading.Event()
+
+        # Display: anillo de buffers RGB reutilizados (cola + el que muestra
+        # Tk + el que se está escribiendo), más un BGR intermedio
+        self._tamano_display: Optional[Tuple[int, int]] = None
+        self._anillo_display: List[np.ndarray] = []
+        self._bgr_display: Optional[np.ndarray] = None
+        self._idx_display = 0
+        self.usar_opencl = usar_opencl and cv2.ocl.haveOpenCL()
+        if usar_opencl and not self.usar_opencl:
+            log.warning("⚠️ OpenCL no disponible; el display se prepara en CPU")
+
+        self.nucleos = set(nucleos) if nucleos else None
+
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def iniciar(self):
+        """Arranca el hilo productor."""
+        if self._hilo and self._hilo.is_alive():
+            return
+        self.error = None
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._producir, name='captura', daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        """Detiene el hilo productor y vacía la cola."""
+        self._detener.set()
+        if self._hilo:
+            self._hilo.join(timeout=2.0)
+            self._hilo = None
+        while True:
+            try:
+                self.cola.get_nowait()
+            except queue.Empty:
+                break
+        self.frame_listo.clear()
+
+    def set_tamano_display(self, ancho: int, alto: int):
+        """
+        Fija el tamaño (px) de la imagen RGB de display que prepara el
+        productor. Se puede llamar desde Tk (p. ej. en <Configure>).
+        """
+        self._tamano_display = (ancho, alto) if ancho > 0 and alto > 0 else None
+
+    def obtener(self, timeout: float = 1.0, con_display: bool = False):
+        """
+        Devuelve el set de frames más reciente.
+
+        Args:
+            timeout: Segundos de espera; 0 = no bloquear
+            con_display: Si True devuelve (frames, display) en vez de frames
+
+        Returns:
+            Tupla con un frame por fuente, o None si no llegó nada a tiempo
+            (revisar `error` para distinguir una fuente perdida). `display`
+            es la imagen RGB redimensionada de la primera fuente, o None si
+            no hay tamaño de display; vale hasta la siguiente llamada. El
+            instante de lectura del set queda en `t_captura`.
+        """
+        try:
+            if timeout <= 0:
+                item = self.cola.get_nowait()
+            else:
+                item = self.cola.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if self.descartar_viejos:
+            # Drop-oldest: los sets anteriores ya no sirven, se entrega el último
+            while True:
+                try:
+                    item = self.cola.get_nowait()
+                except queue.Empty:
+                    break
+        frames, display, self.t_captura = item
+        if self.cola.empty():
+            self.frame_listo.clear()
+            if not self.cola.empty():  # El productor encoló entre medio
+                self.frame_listo.set()
+        return (frames, display) if con_display else frames
+
+    def _leer(self, cap, nombre) -> Optional[np.ndarray]:
+        """Lee un frame; al final del video reinicia y reintenta una vez."""
+        ret, frame = cap.read()
+        if not ret:
+            log.info("Video %s finalizado, reiniciando...", nombre)
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = cap.read()
+        return frame if ret else None
+
+    def _leer_set(self, recuperar: bool = False) -> Optional[List[np.ndarray]]:
+        """
+        Lee un frame de cada fuente (con `recuperar`, hace retrieve() del
+        frame ya avanzado con grab()); None y `error` si alguna falla.
+        """
+        frames = []
+        for cap, nombre in zip(self.capturas, self.nombres):
+            if recuperar:
+                ret, frame = cap.retrieve()
+                frame = frame if ret else None
+            else:
+                frame = self._leer(cap, nombre)
+            if frame is None:
+                self.error = f"No se pueden leer frames del video {nombre}"
+                log.error("❌ %s", self.error)
+                return None
+            frames.append(frame)
+        return frames
+
+    def _saltar(self, cap, nombre) -> bool:
+        """Avanza un frame sin decodificarlo a BGR; reinicia al final del video."""
+        if cap.grab():
+            return True
+        log.info("Video %s finalizado, reiniciando...", nombre)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        return cap.grab()
+
+    def _preparar_display(self, frame) -> Optional[np.ndarray]:
+        """Resize + BGR→RGB del frame a buffers reservados (hilo productor)."""
+        tamano = self._tamano_display
+        if tamano is None:
+            return None
+
+        ancho, alto = tamano
+        forma = (alto, ancho, 3)
+        if self._bgr_display is None or self._bgr_display.shape != forma:
+            self._bgr_display = np.empty(forma, dtype=np.uint8)
+            self._anillo_display = [np.empty(forma, dtype=np.uint8)
+                                    for _ in range(self.cola.maxsize + 2)]
+
+        destino = self._anillo_display[self._idx_display]
+        self._idx_display = (self._idx_display + 1) % len(self._anillo_display)
+        interpolacion = interpolacion_preview(frame.shape[1], ancho)
+        if self.usar_opencl:
+            try:
+                reducido = cv2.resize(cv2.UMat(frame), (ancho, alto), interpolation=interpolacion)
+                np.copyto(destino, cv2.cvtColor(reducido, cv2.COLOR_BGR2RGB).get())
+                return destino
+            except cv2.error as e:
+                log.warning("⚠️ Display OpenCL falló, se usa CPU: %s", e)
+                self.usar_opencl = False
+        # Reducir primero: la conversión de color se hace sobre menos píxeles
+        cv2.resize(frame, (ancho, alto), dst=self._bgr_display, interpolation=interpolacion)
+        cv2.cvtColor(self._bgr_display, cv2.COLOR_BGR2RGB, dst=destino)
+        return destino
+
+    def _encolar_bloqueante(self, frames) -> bool:
+        """put() que espera lugar en la cola pero atiende a detener()."""
+        while not self._detener.is_set():
+            try:
+                self.cola.put(frames, timeout=0.1)
+                self.frame_listo.set()
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _esperar_periodo(self, siguiente: float) -> float:
+        """Duerme hasta el próximo frame a FPS nominal; retorna el nuevo plazo."""
+        if not self._periodo_s:
+            return siguiente
+        siguiente += self._periodo_s
+        espera = siguiente - time.perf_counter()
+        if espera > 0:
+            self._detener.wait(espera)
+            return siguiente
+        return time.perf_counter()
+
+    def _fijar_afinidad(self):
+        """
+        Fija el hilo productor a `nucleos`, así el decode no salta de núcleo
+        en núcleo (ni pisa la caché del hilo de inferencia).
+        
+        En Linux sched_setaffinity(0) aplica solo al hilo que lo llama; en
+        otros sistemas la afinidad es por proceso y no se toca.
+        """
+        if not self.nucleos:
+            return
+        if not hasattr(os, 'sched_setaffinity'):
+            log.warning("⚠️ Afinidad por hilo no disponible en %s; se ignora 'nucleos'", sys.platform)
+            return
+        try:
+            os.sched_setaffinity(0, self.nucleos)
+            log.info("📌 Hilo de captura fijado a los núcleos %s", sorted(self.nucleos))
+        except OSError as e:
+            log.warning("⚠️ No se pudo fijar la afinidad de captura %s: %s", sorted(self.nucleos), e)
+
+    def _producir(self):
+        """Cuerpo del hilo: cualquier excepción queda en `error` y corta la captura."""
+        try:
+            self._producir_frames()
+        except Exception as e:
+            self.error = f"Error en el hilo de captura: {e}"
+            log.error("❌ %s", self.error, exc_info=True)
+
+    def _producir_frames(self):
+        self._fijar_afinidad()
+        siguiente = time.perf_counter()
+        saltados = 0
+        while not self._detener.is_set():
+            saltar = self.descartar_viejos and self.saltar_con_grab and self.cola.full()
+            if saltar:
+                # El consumidor va atrasado: el video avanza sin decodificar y
+                # uno de cada `decodificar_cada` frames reemplaza al set más
+                # viejo (si no, la cola se congela en el momento en que se llenó)
+                for cap, nombre in zip(self.capturas, self.nombres):
+                    if not self._saltar(cap, nombre):
+                        self.error = f"No se pueden leer frames del video {nombre}"
+                        log.error("❌ %s", self.error)
+                        return
+                saltados += 1
+                if saltados < self.decodificar_cada:
+                    siguiente = self._esperar_periodo(siguiente)
+                    continue
+            saltados = 0
+
+            frames = self._leer_set(recuperar=saltar)
+            if frames is None:
+                return
+            t_captura = time.perf_counter()
+            item = (tuple(frames), self._preparar_display(frames[0]), t_captura)
+
+            if not self.descartar_viejos:
+                # Espera lugar en la cola (back-pressure) y después respeta el
+                # FPS nominal: un consumidor rápido no acelera el video
+                if not self._encolar_bloqueante(item):
+                    return
+                siguiente = self._esperar_periodo(siguiente)
+                continue
+
+            # Descartar el set más viejo si el consumidor va atrasado
+            try:
+                self.cola.put_nowait(item)
+            except queue.Full:
+                try:
+                    self.cola.get_nowait()
+                except queue.Empty:
+                    pass
+                self.cola.put_nowait(item)
+            self.frame_listo.set()
+            siguiente = self._esperar_periodo(siguiente)
@@ -0,0 +1,30 @@
+"""
+Carga de archivos de configuración JSON
+"""
+
+from typing import Dict
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # orjson es opcional
+    import json
+    _loads = json.loads
+
+
+def cargar_json(ruta: str) -> Dict:
+    """
+    Lee y parsea un archivo JSON.
+    
+    Usa `orjson` si está instalado; si no, la librería estándar `json`.
+    Los errores de parseo son subclase de `json.JSONDecodeError` en
+    ambos casos.
+    
+    Args:
+        ruta: Ruta al archivo JSON
+        
+    Returns:
+        Diccionario con el contenido del archivo
+    """
+    with open(ruta, 'rb') as f:
+        return _loads(f.read())
@@ -2,15 +2,102 @@
 Sistema de logging para debugging y análisis
 """
 
+import atexit
 import logging
+import queue
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 from typing import Dict
 import os
 
+# Partes fijas del bloque de log_resultado_procesamiento (armadas una vez)
+SEPARADOR = "=" * 70
+ENCABEZADO_RESULTADO = ("", SEPARADOR, "RESULTADO DE PROCESAMIENTO YOLO → PLC", SEPARADOR)
+
+
+class MensajeDiferido:
+    """
+    Mensaje de log que se arma recién cuando un handler lo emite.
+    
+    logging llama a str() sobre el mensaje en getMessage(), así el bloque
+    se construye en el hilo del QueueListener y no en el que loguea.
+    """
+    __slots__ = ('_armar', '_args', '_texto')
+    
+    def __init__(self, armar, *args):
+        self._armar = armar
+        self._args = args
+        self._texto = None
+    
+    def __str__(self) -> str:
+        if self._texto is None:  # Consola y archivo comparten el mismo texto
+            self._texto = self._armar(*self._args)
+        return self._texto
+
+
+class _QueueHandlerDiferido(QueueHandler):
+    """
+    QueueHandler que encola el registro sin formatearlo.
+    
+    La cola es en proceso, el registro no necesita ser serializable: el
+    formateo queda para los handlers del QueueListener.
+    """
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class _FileHandlerPorLotes(logging.FileHandler):
+    """
+    FileHandler que escribe sin vaciar el buffer en cada registro.
+    
+    El vaciado lo decide _QueueListenerPorLotes: una ráfaga de registros
+    (p. ej. varios bloques de resultado seguidos) sale en una sola escritura.
+    """
+    
+    def emit(self, record: logging.LogRecord):
+        if self.stream is None:
+            self.stream = self._open()
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+
+class _QueueListenerPorLotes(QueueListener):
+    """
+    QueueListener que vacía los handlers cuando la cola queda vacía, ante
+    un ERROR o cada MAX_LOTE registros; nunca se espera a un temporizador.
+    """
+    MAX_LOTE = 16
+    
+    def __init__(self, cola, *handlers, respect_handler_level: bool = False):
+        super().__init__(cola, *handlers, respect_handler_level=respect_handler_level)
+        self._pendientes = 0
+    
+    def handle(self, record: logging.LogRecord):
+        super().handle(record)
+        self._pendientes += 1
+        if (record.levelno >= logging.ERROR or self._pendientes >= self.MAX_LOTE
+                or self.queue.empty()):
+            self._vaciar()
+    
+    def stop(self):
+        super().stop()
+        self._vaciar()
+    
+    def _vaciar(self):
+        self._pendientes = 0
+        for handler in self.handlers:
+            handler.flush()
+
 
 def setup_logger(nombre: str = 'PLCSystem', 
                 nivel: int = logging.INFO,
-                archivo_log: str = None) -> logging.Logger:
+                archivo_log: str = None,
+                asincrono: bool = False) -> logging.Logger:
     """
     Configura el sistema de logging.
     
@@ -18,6 +105,9 @@ def setup_logger(nombre: str = 'PLCSystem',
         nombre: Nombre del logger
         nivel: Nivel de logging (INFO, DEBUG, etc.)
         archivo_log: Ruta opcional para guardar logs en archivo
+        asincrono: Si True, el logger solo encola los registros
+            (QueueHandler) y un hilo aparte (QueueListener) los escribe
+            en consola/archivo; quien loguea no espera la E/S
         
     Returns:
         Objeto Logger configurado
@@ -38,15 +128,26 @@ def setup_logger(nombre: str = 'PLCSystem',
     # Handler para consola
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    handlers = [console_handler]
     
     # Handler para archivo (opcional)
     if archivo_log:
-        os.makedirs(os.path.dirname(archivo_log) if os.path.dirname(archivo_log) else '.', 
-                   exist_ok=True)
-        file_handler = logging.FileHandler(archivo_log, encoding='utf-8')
+        os.makedirs(os.path.dirname(archivo_log) or '.', exist_ok=True)
+        # En modo asíncrono el QueueListener decide cuándo vaciar el archivo
+        clase_archivo = _FileHandlerPorLotes if asincrono else logging.FileHandler
+        file_handler = clase_archivo(archivo_log, encoding='utf-8')
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
+    
+    if asincrono:
+        cola = queue.Queue(-1)
+        listener = _QueueListenerPorLotes(cola, *handlers, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)  # Vacía la cola al salir
+        logger.addHandler(_QueueHandlerDiferido(cola))
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
     
     return logger
 
@@ -59,33 +160,41 @@ def log_resultado_procesamiento(resultado: Dict, logger: logging.Logger = None):
         resultado: Diccionario con el resultado del procesamiento
         logger: Logger a usar (si es None, usa print)
     """
-    separador = "=" * 70
+    # Sin INFO activo no se arma el mensaje
+    if logger and not logger.isEnabledFor(logging.INFO):
+        return
     
-    mensaje = f"\n{separador}\n"
-    mensaje += "RESULTADO DE PROCESAMIENTO YOLO → PLC\n"
-    mensaje += f"{separador}\n"
+    if logger:
+        logger.info(MensajeDiferido(_armar_resultado, resultado))
+    else:
+        print(_armar_resultado(resultado))
+
+
+def _armar_resultado(resultado: Dict) -> str:
+    """Arma el bloque de texto de log_resultado_procesamiento."""
+    # Líneas en una lista y un solo join (sin += sobre el string)
+    partes = list(ENCABEZADO_RESULTADO)
     
     if resultado['success']:
-        mensaje += f"✅ Estado: ÉXITO\n"
-        mensaje += f"📊 Filas detectadas: {resultado['filas']}\n"
-        mensaje += f"📏 Desviación: {resultado['desviacion_mm']:.2f} mm\n"
+        partes.append("✅ Estado: ÉXITO")
+        partes.append(f"📊 Filas detectadas: {resultado['filas']}")
+        partes.append(f"📏 Desviación: {resultado['desviacion_mm']:.2f} mm")
         
         if 'metadata' in resultado:
             meta = resultado['metadata']
-            mensaje += f"\n📈 Metadata:\n"
-            mensaje += f"   • Detecciones totales: {meta.get('total_detectado', 'N/A')}\n"
-            mensaje += f"   • Detecciones válidas: {meta.get('detecciones_validas', 'N/A')}\n"
-            mensaje += f"   • Confianza promedio: {meta.get('confianza_promedio', 0):.2%}\n"
+            partes.append("\n📈 Metadata:")
+            partes.append(f"   • Detecciones totales: {meta.get('total_detectado', 'N/A')}")
+            partes.append(f"   • Detecciones válidas: {meta.get('detecciones_validas', 'N/A')}")
+            if 'confianza_promedio' in meta:
+                partes.append(f"   • Confianza promedio: {meta['confianza_promedio']:.2%}")
     else:
-        mensaje += f"❌ Estado: FALLO\n"
-        mensaje += f"📋 Razón: {resultado.get('metadata', {}).get('razon_fallo', 'Desconocida')}\n"
+        partes.append("❌ Estado: FALLO")
+        partes.append(f"📋 Razón: {resultado.get('metadata', {}).get('razon_fallo', 'Desconocida')}")
     
-    mensaje += f"{separador}\n"
+    partes.append(SEPARADOR)
+    partes.append("")  # Salto de línea final
+    return "\n".join(partes)
     
-    if logger:
-        logger.info(mensaje)
-    else:
-        print(mensaje)
 
 
 def log_estado_plc(estado: Dict, logger: logging.Logger = None):
@@ -96,13 +205,17 @@ def log_estado_plc(estado: Dict, logger: logging.Logger = None):
         estado: Diccionario con estado del PLC
         logger: Logger a usar
     """
+    if logger and not logger.isEnabledFor(logging.INFO):
+        return
+    
     if not estado.get('conectado'):
-        mensaje = "❌ PLC desconectado"
+        plantilla, args = "❌ PLC desconectado", ()
     else:
-        mensaje = f"PLC Estado → Trigger: {estado.get('descripcion_trigger')}, "
-        mensaje += f"Filas: {estado.get('filas', 0)}"
+        plantilla = "PLC Estado → Trigger: %s, Filas: %s"
+        args = (estado.get('descripcion_trigger'), estado.get('filas', 0))
     
+    # Formato diferido (%s): logging solo arma el texto si un handler lo emite
     if logger:
-        logger.info(mensaje)
+        logger.info(plantilla, *args)
     else:
-        print(mensaje)
\ No newline at end of file
+        print(plantilla % args)
\ No newline at end of file
@@ -1,57 +1,20 @@
 """
-Sistema de logging para debugging y análisis
+Sistema de logging para debugging y análisis (versión cámara dual)
+
+La configuración del logger es la de utils.logger; este módulo solo
+cambia los mensajes de resultado y de estado del PLC.
 """
 
 import logging
-from datetime import datetime
 from typing import Dict
-import os
 
+# setup_logger se re-exporta: main2.py lo importa desde este módulo
+from .logger import setup_logger, SEPARADOR, MensajeDiferido
 
-def setup_logger(nombre: str = 'PLCSystem', 
-                nivel: int = logging.INFO,
-                archivo_log: str = None) -> logging.Logger:
-    """
-    Configura el sistema de logging.
-    
-    Args:
-        nombre: Nombre del logger
-        nivel: Nivel de logging (INFO, DEBUG, etc.)
-        archivo_log: Ruta opcional para guardar logs en archivo
-        
-    Returns:
-        Objeto Logger configurado
-    """
-    logger = logging.getLogger(nombre)
-    logger.setLevel(nivel)
-    
-    # Evitar duplicar handlers
-    if logger.handlers:
-        return logger
-    
-    # Formato de mensajes
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - [%(levelname)s] - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    
-    # Handler para consola
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-    
-    # Handler para archivo (opcional)
-    if archivo_log:
-        os.makedirs(os.path.dirname(archivo_log) if os.path.dirname(archivo_log) else '.', 
-                   exist_ok=True)
-        file_handler = logging.FileHandler(archivo_log, encoding='utf-8')
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
-    
-    return logger
+# Encabezado del bloque de log_resultado_procesamiento (armado una vez)
+ENCABEZADO_RESULTADO = ("", SEPARADOR, "RESULTADO DE PROCESAMIENTO DUAL → PLC", SEPARADOR)
 
 
-# <<< FUNCIÓN CORREGIDA >>>
 def log_resultado_procesamiento(resultado: Dict, logger: logging.Logger = None):
     """
     Registra un resultado de procesamiento DUAL de forma estructurada.
@@ -60,42 +23,58 @@ def log_resultado_procesamiento(resultado: Dict, logger: logging.Logger = None):
         resultado: Diccionario con el resultado del procesamiento
         logger: Logger a usar (si es None, usa print)
     """
-    separador = "=" * 70
-    
-    mensaje = f"\n{separador}\n"
-    mensaje += "RESULTADO DE PROCESAMIENTO DUAL → PLC\n"
-    mensaje += f"{separador}\n"
-    
+    # Las paradas se loguean como ERROR, el resto como INFO: si ese nivel
+    # no está activo no se arma el mensaje
     # <<< CORRECCIÓN: Leer 'codigo_respuesta_plc' en lugar de 'success' o 'metadata' >>>
     codigo_plc = resultado.get('codigo_respuesta_plc', -1)
+    nivel = logging.ERROR if codigo_plc == 2 else logging.INFO  # Paradas como ERROR
+    if logger and not logger.isEnabledFor(nivel):
+        return
+    
+    if logger:
+        # Nivel resuelto una vez: sirve al filtro y a la emisión
+        logger.log(nivel, MensajeDiferido(_armar_resultado, resultado, codigo_plc))
+    else:
+        print(_armar_resultado(resultado, codigo_plc))
+
+
+def _armar_resultado(resultado: Dict, codigo_plc: int) -> str:
+    """Arma el bloque de texto de log_resultado_procesamiento (DUAL)."""
+    # Cada campo se lee una sola vez (log_z es None si falta: el texto por
+    # defecto depende de dónde se muestra)
+    log_z = resultado.get('log_z')
+    plc_ok = resultado.get('plc_success', False)
+    filas = resultado.get('filas', 0)
+    desviacion_z_mm = resultado.get('desviacion_y_mm', 0.0)  # D29 lleva la corrección Z
+    correccion_z_cmm = resultado.get('correccion_z_cmm', 0)
+    desviacion_y_px = resultado.get('desviacion_y_px', 0)
+    
+    # Líneas en una lista y un solo join (sin += sobre el string)
+    partes = list(ENCABEZADO_RESULTADO)
     
     if codigo_plc == 2: # PARADA
-        mensaje += f"🛑 Estado: PARADA CRÍTICA (Código {codigo_plc})\n"
-        mensaje += f"📋 Razón: {resultado.get('log_z', 'Error lateral desconocido')}\n"
+        partes.append(f"🛑 Estado: PARADA CRÍTICA (Código {codigo_plc})")
+        partes.append(f"📋 Razón: {'Error lateral desconocido' if log_z is None else log_z}")
     elif codigo_plc == 1: # FALLO QC
-        mensaje += f"⚠️ Estado: FALLO QC (Código {codigo_plc})\n"
+        partes.append(f"⚠️ Estado: FALLO QC (Código {codigo_plc})")
     else: # OK
-        mensaje += f"✅ Estado: ÉXITO (Código {codigo_plc})\n"
+        partes.append(f"✅ Estado: ÉXITO (Código {codigo_plc})")
 
-    mensaje += "\n--- DATOS ENVIADOS A PLC ---\n"
-    mensaje += f"  • Éxito (a D28): {resultado.get('plc_success', False)}\n"
-    mensaje += f"  • Filas (a D14): {resultado.get('filas', 0)}\n"
-    mensaje += f"  • Desviación Z (a D29): {resultado.get('desviacion_y_mm', 0.0):.2f} mm\n"
+    partes.append(f"""
+--- DATOS ENVIADOS A PLC ---
+  • Éxito (a D28): {plc_ok}
+  • Filas (a D14): {filas}
+  • Desviación Z (a D29): {desviacion_z_mm:.2f} mm
 
-    mensaje += "\n--- DATOS DE DIAGNÓSTICO ---\n"
-    mensaje += f"  • Corrección Z (cálculo): {resultado.get('correccion_z_cmm', 0)} cMM\n"
-    mensaje += f"  • Desviación Y (cálculo): {resultado.get('desviacion_y_px', 0)} px\n"
-    mensaje += f"  • Log Lateral (Z): {resultado.get('log_z', 'N/A')}\n"
+--- DATOS DE DIAGNÓSTICO ---
+  • Corrección Z (cálculo): {correccion_z_cmm} cMM
+  • Desviación Y (cálculo): {desviacion_y_px} px
+  • Log Lateral (Z): {'N/A' if log_z is None else log_z}""")
     
-    mensaje += f"{separador}\n"
+    partes.append(SEPARADOR)
+    partes.append("")  # Salto de línea final
+    return "\n".join(partes)
     
-    if logger:
-        if codigo_plc == 2:
-            logger.error(mensaje) # Loguear paradas como ERROR
-        else:
-            logger.info(mensaje)
-    else:
-        print(mensaje)
 
 
 def log_estado_plc(controlador_plc, logger: logging.Logger, solicitud_detectada: bool):
@@ -113,23 +92,30 @@ def log_estado_plc(controlador_plc, logger: logging.Logger, solicitud_detectada:
         else: print(mensaje)
         return
 
+    # Se llama en cada polling y solo emite DEBUG: sin DEBUG activo no se
+    # arma el mensaje
+    if logger and not logger.isEnabledFor(logging.DEBUG):
+        return
+
+    # Formato diferido (%s): logging solo arma el texto si un handler lo emite.
+    # Sale en cada polling: plantillas ASCII, sin emoji (strings de 1 byte por
+    # carácter en memoria y líneas más cortas en el archivo)
     try:
         if solicitud_detectada:
-            mensaje = f"🟢 PLC Estado: SOLICITUD RECIBIDA (D28={controlador_plc.VAL_SOLICITUD})"
+            plantilla = "PLC Estado: SOLICITUD RECIBIDA (D28=%s)"
         else:
             # Leer el valor actual para saber por qué no está listo (opcional)
             # valor_actual = controlador_plc.mc.batchread_wordunits(headdevice=controlador_plc.DEV_TRIGGER, readsize=1)[0]
-            # mensaje = f"⚪ PLC Estado: Esperando (D28={valor_actual})"
+            # plantilla = "PLC Estado: Esperando (D28=%s)"
             
             # Mensaje simple para no saturar el log
-            mensaje = f"⚪ PLC Estado: Esperando solicitud (D28 != {controlador_plc.VAL_SOLICITUD})"
+            plantilla = "PLC Estado: Esperando solicitud (D28 != %s)"
         
         if logger:
-            logger.debug(mensaje) # Usar DEBUG para no saturar el log de INFO
+            logger.debug(plantilla, controlador_plc.VAL_SOLICITUD) # Usar DEBUG para no saturar el log de INFO
         else:
-            print(mensaje)
+            print(plantilla % controlador_plc.VAL_SOLICITUD)
             
     except Exception as e:
-        mensaje = f"⚠️ Error leyendo estado de PLC: {e}"
-        if logger: logger.error(mensaje)
-        else: print(mensaje)
\ No newline at end of file
+        if logger: logger.error("⚠️ Error leyendo estado de PLC: %s", e)
+        else: print(f"⚠️ Error leyendo estado de PLC: {e}")
\ No newline at end of file